@@ -0,0 +1,85 @@
+"""Alert rule matching cost as the number of rules grows.
+
+Compiles ``--rules`` random rules into an AlertMatcher and times matching a
+scrape's worth of new links, against evaluating every rule on its own with
+one regex per term.
+
+    python benchmarks/bench_alerts.py
+    python benchmarks/bench_alerts.py --rules 10,100,1000 --links 5000
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from piston.alerts import AlertMatcher, evaluate, normalize, parse_rule, rule_terms
+
+WORDS = (
+    "python java go rust data backend frontend devops cloud remote senior junior lead intern "
+    "engineer developer analyst architect manager paris lyon nantes lille bordeaux toulouse "
+    "kubernetes docker aws azure django flask react vue postgres spark airflow ml ai security"
+).split()
+# Rules also mention skills no posting in this run contains, as most saved
+# rules miss most postings
+RULE_WORDS = WORDS + [f"skill{i}" for i in range(1000)]
+
+
+def random_rule():
+    first, second, third = random.sample(RULE_WORDS, 3)
+    return random.choice((
+        f"{first} AND {second}",
+        f"{first} {second} NOT {third}",
+        f"({first} OR {second}) AND {third}",
+        f'"{first} {second}" OR {third}',
+    ))
+
+
+def naive_match(rules, links):
+    # One regex per term, every rule evaluated for every link
+    compiled = []
+    for rule_id, name, website_id, expression in rules:
+        tree = parse_rule(expression)
+        patterns = {term: re.compile(r"(?<!\w)" + re.escape(term) + r"(?!\w)") for term in rule_terms(tree)}
+        compiled.append((name, tree, patterns))
+    matches = 0
+    for link, description in links:
+        text = normalize(f"{link} {description}")
+        for name, tree, patterns in compiled:
+            found = {term for term, pattern in patterns.items() if pattern.search(text)}
+            matches += evaluate(tree, found)
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", default="10,100,500,2000")
+    parser.add_argument("--links", type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    links = [
+        (f"/jobs/{i}", " ".join(random.choice(WORDS).title() for _ in range(random.randint(4, 10))))
+        for i in range(args.links)
+    ]
+    print(f"{args.links} new links")
+    print(f"{'rules':>6} {'compile ms':>11} {'matcher ms':>11} {'per rule ms':>12} {'matches':>8}")
+    for count in (int(value) for value in args.rules.split(",")):
+        rules = [(i, f"rule {i}", None, random_rule()) for i in range(count)]
+        started = time.perf_counter()
+        matcher = AlertMatcher(rules)
+        compiled = time.perf_counter()
+        matches = sum(len(names) for _, _, names in matcher.match(1, links))
+        matched = time.perf_counter()
+        naive_matches = naive_match(rules, links)
+        naive = time.perf_counter()
+        assert matches == naive_matches
+        print(f"{count:>6} {(compiled - started) * 1000:>11.1f} {(matched - compiled) * 1000:>11.1f} "
+              f"{(naive - matched) * 1000:>12.1f} {matches:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Fetches and detection delay of the 'auto' interval against fixed polling.
+
+Simulates ``--days`` of scraping sites whose postings change at random
+(Poisson) with mean gaps from 30 minutes to a week, once polled every
+``--fixed`` minutes and once with the 'auto' interval and default bounds.
+Detection delay is how long after a change the next scrape saw it.
+
+    python benchmarks/bench_auto_interval.py
+    python benchmarks/bench_auto_interval.py --days 90 --fixed 30
+"""
+import os
+import sys
+import random
+import argparse
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("EMAIL_ADDRESS", "bench@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "bench")
+os.environ.setdefault("RECIPIENT_EMAIL", "bench@example.com")
+
+from suite import percentile
+from piston import create_app
+from piston.models import adapt_interval, mark_checked
+
+MEAN_GAPS = {"30min": 1800, "2hours": 7200, "12hours": 43200, "1day": 86400, "1week": 604800}
+
+
+def change_times(mean_gap, start, end):
+    at, times = start, []
+    while True:
+        at += timedelta(seconds=random.expovariate(1 / mean_gap))
+        if at >= end:
+            return times
+        times.append(at)
+
+
+def simulate(changes, start, end, next_scrape):
+    # Returns (fetches, detection delays in seconds)
+    fetches, delays = 0, []
+    pending = 0
+    at = start
+    while at < end:
+        fetches += 1
+        seen = []
+        while pending < len(changes) and changes[pending] <= at:
+            seen.append(changes[pending])
+            pending += 1
+        delays.extend((at - change).total_seconds() for change in seen)
+        at = next_scrape(at, bool(seen))
+    return fetches, delays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--fixed", type=float, default=5, help="fixed interval in minutes")
+    args = parser.parse_args()
+
+    # Exact due times: the per-site jitter phase would blur the intervals compared
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:", "SCHEDULE_JITTER": False})
+    start = datetime(2024, 1, 1)
+    end = start + timedelta(days=args.days)
+    fixed = timedelta(minutes=args.fixed)
+
+    print(f"{args.days} days, fixed interval {args.fixed:g} min, auto between "
+          f"{app.config['AUTO_INTERVAL_MIN']} s and {app.config['AUTO_INTERVAL_MAX']} s")
+    print(f"{'every':>8} {'fixed fetches':>14} {'auto fetches':>13} {'fixed p50 delay':>16} "
+          f"{'auto p50 delay':>15} {'auto p95 delay':>15}")
+    with app.app_context():
+        for label, mean_gap in MEAN_GAPS.items():
+            random.seed(0)
+            changes = change_times(mean_gap, start, end)
+            fixed_fetches, fixed_delays = simulate(changes, start, end, lambda at, changed: at + fixed)
+
+            website = SimpleNamespace(
+                scrape_interval="auto", auto_interval_seconds=None, unchanged_streak=None, last_checked=None,
+                last_changed_at=None, change_gap_ewma=None, auto_fetches_saved=None, next_due_at=None,
+            )
+
+            def next_auto(at, changed):
+                adapt_interval(website, "changed" if changed else "unchanged", at)
+                mark_checked(website, at)
+                return website.next_due_at
+
+            auto_fetches, auto_delays = simulate(changes, start, end, next_auto)
+            print(f"{label:>8} {fixed_fetches:>14} {auto_fetches:>13} "
+                  f"{percentile(fixed_delays, 50) / 60:>12.1f} min {percentile(auto_delays, 50) / 60:>11.1f} min "
+                  f"{percentile(auto_delays, 95) / 60:>11.1f} min")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Several worker processes sharing one SQLite (WAL) database through leases.
+
+Starts ``--processes`` workers, each running the scheduler's
+``check_all_websites`` against the same database file until no website is
+due, plus one worker that is killed mid-scrape. The synthetic job board
+counts the fetches of every site: with leases each site is fetched once,
+except the ones the killed worker had claimed, which the others fetch
+again after its leases expire; each site's result is written once.
+
+    python benchmarks/bench_leases.py
+    python benchmarks/bench_leases.py --sites 1000 --processes 1,2,4
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("EMAIL_ADDRESS", "bench@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "bench")
+os.environ.setdefault("RECIPIENT_EMAIL", "bench@example.com")
+
+from jobboard import JobBoardServer
+from suite import PLUGIN_SOURCE
+from piston import create_app, db
+from piston.models import ScrapeRun, Website, init_db
+
+LEASE_SECONDS = 10
+
+
+def worker_config(workdir, worker_id):
+    return {
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{workdir}/bench.db",
+        "WORKER_ID": worker_id,
+        "SCRAPE_WORKERS": 4,
+        "SCRAPE_MAX_PER_HOST": 4,
+        "SCRAPE_CLAIM_BATCH": 20,
+        "SCRAPE_LEASE_SECONDS": LEASE_SECONDS,
+        "HTTP_HOST_RATE": 0,
+        "HTTP_RESPECT_CRAWL_DELAY": False,
+    }
+
+
+def work(workdir, worker_id, claimed=None):
+    from unittest.mock import patch
+    from piston.registry import registry
+    from piston.scheduler import check_all_websites
+
+    registry.plugins_dir = workdir
+    app = create_app(worker_config(workdir, worker_id))
+    with app.app_context(), patch("piston.models.send_email"):
+        if claimed is not None:
+            # Fetches a batch, then hangs before writing it until killed
+            def hang(*args):
+                claimed.set()
+                time.sleep(3600)
+
+            with patch("piston.scheduler.write_results", side_effect=hang):
+                check_all_websites()
+        while check_all_websites()["ran"] or db.session.query(Website.id).filter(
+            Website.next_due_at <= datetime.now(), Website.lease_owner.is_not(None)
+        ).first():
+            # Websites still leased to a worker that may have died: wait for
+            # the leases to be released or to expire
+            time.sleep(0.5)
+        db.session.remove()
+
+
+def run(workdir, server, processes, sites):
+    with open(os.path.join(workdir, "jobboard.py"), "w") as f:
+        f.write(PLUGIN_SOURCE)
+    if os.path.exists(os.path.join(workdir, "bench.db")):
+        os.remove(os.path.join(workdir, "bench.db"))
+    app = create_app(worker_config(workdir, "setup"))
+    with app.app_context():
+        init_db()
+        now = datetime.now()
+        db.session.add_all(
+            Website(
+                name=f"Board {i}", url=server.url_for(i, links=50, size_kb=16), plugin_name="jobboard",
+                scraping_type="links", scrape_interval="1day", next_due_at=now,
+            )
+            for i in range(sites)
+        )
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+    server.httpd.generations.clear()
+
+    context = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    claimed = context.Event()
+    doomed = context.Process(target=work, args=(workdir, "doomed", claimed))
+    doomed.start()
+    claimed.wait(60)
+    workers = [context.Process(target=work, args=(workdir, f"worker-{i}")) for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    os.kill(doomed.pid, signal.SIGKILL)
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    fetches = Counter(server.httpd.generations.values())
+    with app.app_context():
+        # Results written, i.e. emails that would have gone out
+        runs = Counter(website_id for (website_id,) in db.session.query(ScrapeRun.website_id))
+        db.session.remove()
+        db.engine.dispose()
+    written_twice = sum(1 for count in runs.values() if count > 1)
+    return elapsed, sum(server.httpd.generations.values()), len(runs), fetches, written_twice
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=300)
+    parser.add_argument("--processes", default="1,2,4")
+    args = parser.parse_args()
+
+    print(f"{args.sites} sites, leases of {LEASE_SECONDS}s, one extra worker killed after claiming a batch")
+    print(f"{'workers':>8} {'seconds':>8} {'fetches':>8} {'fetched twice':>14} {'sites written':>14} "
+          f"{'written twice':>14}")
+    with tempfile.TemporaryDirectory() as workdir, JobBoardServer() as server:
+        for processes in (int(value) for value in args.processes.split(",")):
+            elapsed, total, written, fetches, written_twice = run(workdir, server, processes, args.sites)
+            twice = sum(count for times, count in fetches.items() if times > 1)
+            print(f"{processes:>8} {elapsed:>8.1f} {total:>8} {twice:>14} {written:>14} {written_twice:>14}")
+
+
+if __name__ == "__main__":
+    main()
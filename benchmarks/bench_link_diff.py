@@ -0,0 +1,86 @@
+"""Per-scrape cost of link diffing as a site's stored history grows.
+
+Each scrape returns 200 links, 10 of them new. The "ORM set" column is the
+previous approach (load every Link row, diff in Python), "insert-or-ignore"
+is the indexed bulk insert now used by update_website.
+
+    python benchmarks/bench_link_diff.py
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("EMAIL_ADDRESS", "bench@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "bench")
+os.environ.setdefault("RECIPIENT_EMAIL", "bench@example.com")
+
+from piston import create_app, db
+from piston.models import Link, Website, init_db, insert_new_links
+from piston.urls import url_hash
+
+HISTORY_SIZES = [1_000, 10_000, 100_000]
+LINKS_PER_SCRAPE = 200
+NEW_PER_SCRAPE = 10
+SCRAPES = 20
+# Links are stored canonical, as update_website would
+BASE_URL = "http://localhost"
+
+
+def seed(website_id, count):
+    rows = []
+    for i in range(count):
+        link = f"{BASE_URL}/jobs/{i}"
+        rows.append({"website_id": website_id, "link": link, "url_hash": url_hash(link), "description": f"Job {i}"})
+    db.session.execute(Link.__table__.insert(), rows)
+    db.session.commit()
+
+
+def scrape_result(history, scrape):
+    known = [(f"{BASE_URL}/jobs/{history - 1 - i}", "Job") for i in range(LINKS_PER_SCRAPE - NEW_PER_SCRAPE)]
+    new = [(f"{BASE_URL}/new/{scrape}/{i}", "New job") for i in range(NEW_PER_SCRAPE)]
+    return known + new
+
+
+def orm_set_diff(website_id, links):
+    existing = set(link.link for link in db.session.query(Link).filter(Link.website_id == website_id).all())
+    new = [link for link in links if link[0] not in existing]
+    for link, description in new:
+        db.session.add(Link(website_id=website_id, link=link, url_hash=url_hash(link), description=description))
+    return new
+
+
+def measure(diff, website_id, history, offset):
+    timings = []
+    for scrape in range(SCRAPES):
+        links = scrape_result(history, offset + scrape)
+        start = time.perf_counter()
+        assert len(diff(website_id, links)) == NEW_PER_SCRAPE
+        db.session.commit()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    print(f"{'stored links':>12} {'ORM set p50 (ms)':>18} {'insert-or-ignore p50 (ms)':>26}")
+    for history in HISTORY_SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp}/bench.db"})
+            with app.app_context(), patch("piston.models.send_email"):
+                init_db()
+                website = Website(name="Bench", url=BASE_URL, plugin_name="bench")
+                db.session.add(website)
+                db.session.commit()
+                seed(website.id, history)
+
+                legacy = measure(orm_set_diff, website.id, history, offset=0)
+                indexed = measure(insert_new_links, website.id, history, offset=SCRAPES)
+                print(f"{history:>12} {legacy:>18.2f} {indexed:>26.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Streaming link extraction against the BeautifulSoup path on large pages.
+
+Generates synthetic listing pages of a few MB and compares the previous
+Wikipedia plugin approach (decode the whole body, build a BeautifulSoup
+tree with html.parser, find_all("a")) with piston.links.iter_links fed
+64 KiB chunks. Reports wall time and peak traced memory.
+
+    python benchmarks/bench_link_extraction.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from piston.links import iter_links
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:  # bs4 is only needed for the comparison column
+    BeautifulSoup = None
+
+PAGE_SIZES_MB = [1, 4, 8]
+CHUNK_SIZE = 64 * 1024
+
+
+def listing_page(size_mb):
+    row = (
+        '<li class="job"><a href="/jobs/{i}">Senior Python developer {i}</a>'
+        '<span class="meta">Remote - posted today</span>'
+        '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p></li>\n'
+    )
+    rows, size, i = [], 0, 0
+    while size < size_mb * 1024 * 1024:
+        rows.append(row.format(i=i))
+        size += len(rows[-1])
+        i += 1
+    html = f'<html><body><div id="results"><ul>{"".join(rows)}</ul></div></body></html>'
+    return html.encode("utf-8")
+
+
+def with_bs4(body):
+    soup = BeautifulSoup(body.decode("utf-8"), "html.parser")
+    return [(a.get("href"), a.text.strip()) for a in soup.find_all("a") if a.get("href")]
+
+
+def with_stream(body):
+    chunks = (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+    return list(iter_links(chunks))
+
+
+def measure(extract, body):
+    start = time.perf_counter()
+    links = extract(body)
+    elapsed = time.perf_counter() - start
+
+    # Separate run: tracing allocations slows parsing down several times
+    tracemalloc.start()
+    extract(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return len(links), elapsed * 1000, peak / (1024 * 1024)
+
+
+def main():
+    print(f"{'page':>6} {'links':>7} {'bs4 ms':>9} {'bs4 peak MB':>12} {'stream ms':>10} {'stream peak MB':>15}")
+    for size_mb in PAGE_SIZES_MB:
+        body = listing_page(size_mb)
+        count, stream_ms, stream_peak = measure(with_stream, body)
+        if BeautifulSoup is not None:
+            bs4_count, bs4_ms, bs4_peak = measure(with_bs4, body)
+            assert bs4_count == count
+            bs4_cols = f"{bs4_ms:>9.0f} {bs4_peak:>12.1f}"
+        else:
+            bs4_cols = f"{'n/a':>9} {'n/a':>12}"
+        print(f"{size_mb:>4}MB {count:>7} {bs4_cols} {stream_ms:>10.0f} {stream_peak:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
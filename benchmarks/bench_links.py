@@ -0,0 +1,117 @@
+"""``/api/links`` latency with millions of stored links.
+
+Fills SQLite with ``--links`` links spread over ``--sites`` websites (the
+FTS5 index is maintained by its triggers as they are inserted), then times
+the first and a deep page of each listing, with keyset cursors as served by
+the API and with the OFFSET and LIKE queries they replace.
+
+    python benchmarks/bench_links.py
+    python benchmarks/bench_links.py --links 5000000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("EMAIL_ADDRESS", "bench@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "bench")
+os.environ.setdefault("RECIPIENT_EMAIL", "bench@example.com")
+
+from sqlalchemy import insert, text
+from suite import percentile
+from piston import create_app, db
+from piston.models import Link, Website, init_db
+
+TITLES = ["Python", "Data", "Backend", "Frontend", "DevOps", "Java", "Go", "Rust", "QA", "Product"]
+ROLES = ["developer", "engineer", "lead", "intern", "architect", "analyst", "manager"]
+PLACES = ["Paris", "Lyon", "Nantes", "Lille", "Remote", "Bordeaux", "Toulouse"]
+# One description in 20,000 mentions it
+RARE = "Kubernetes"
+
+
+def fill(app, args):
+    random.seed(0)
+    with app.app_context():
+        init_db()
+        db.session.execute(insert(Website), [
+            {"id": i, "name": f"Board {i}", "url": f"http://127.0.0.1/board/{i}", "plugin_name": "board"}
+            for i in range(1, args.sites + 1)
+        ])
+        started = time.perf_counter()
+        batch = []
+        for i in range(args.links):
+            description = f"{random.choice(TITLES)} {random.choice(ROLES)} - {random.choice(PLACES)}"
+            if i % 20000 == 0:
+                description += f" ({RARE})"
+            batch.append({"website_id": i % args.sites + 1, "link": f"/jobs/{i}", "description": description})
+            if len(batch) == 10000:
+                db.session.execute(insert(Link), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Link), batch)
+        db.session.commit()
+        db.session.remove()
+    return time.perf_counter() - started
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return percentile(timings, 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, default=1_000_000)
+    parser.add_argument("--sites", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "links.db")
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+        fill_seconds = fill(app, args)
+        print(f"{args.links} links over {args.sites} sites: inserted in {fill_seconds:.1f}s, "
+              f"{os.path.getsize(path) / 1024 / 1024:.0f} MiB")
+
+        client = app.test_client()
+        deep = args.links * 9 // 10
+        per_site_deep = deep // args.sites
+        with app.app_context():
+            deep_site_id = db.session.execute(text(
+                f"SELECT id FROM links WHERE website_id = 1 ORDER BY id LIMIT 1 OFFSET {per_site_deep}"
+            )).scalar()
+            deep_match_id = db.session.execute(text(
+                "SELECT rowid FROM links_fts WHERE links_fts MATCH 'python' ORDER BY rowid "
+                f"LIMIT 1 OFFSET {deep // len(TITLES)}"
+            )).scalar()
+
+        cases = [
+            ("all, first page", "", "SELECT * FROM links ORDER BY id LIMIT 50"),
+            ("all, deep page", f"after={deep}", f"SELECT * FROM links ORDER BY id LIMIT 50 OFFSET {deep}"),
+            ("site, deep page", f"website_id=1&after={deep_site_id}",
+             f"SELECT * FROM links WHERE website_id = 1 ORDER BY id LIMIT 50 OFFSET {per_site_deep}"),
+            ("common term", "q=python", "SELECT * FROM links WHERE description LIKE '%python%' ORDER BY id LIMIT 50"),
+            ("common term, deep", f"q=python&after={deep_match_id}",
+             "SELECT * FROM links WHERE description LIKE '%python%' ORDER BY id "
+             f"LIMIT 50 OFFSET {deep // len(TITLES)}"),
+            ("rare term", f"q={RARE}", f"SELECT * FROM links WHERE description LIKE '%{RARE}%' ORDER BY id LIMIT 50"),
+        ]
+        print(f"{'listing':<20} {'api ms':>8} {'offset/LIKE ms':>15}")
+        for label, query, baseline in cases:
+            with app.app_context():
+                api = timed(lambda: client.get(f"/api/links?{query}"), args.repeat)
+                old = timed(lambda: db.session.execute(text(baseline)).all(), args.repeat)
+                db.session.remove()
+            print(f"{label:<20} {api:>8.1f} {old:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
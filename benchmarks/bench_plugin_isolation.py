@@ -0,0 +1,123 @@
+"""Thread versus process plugin execution for a CPU-heavy plugin.
+
+Every site runs a plugin that parses a large synthetic job board page with
+BeautifulSoup. While check_all_websites runs, a client thread requests
+``/metrics``, which does no I/O, so its latency shows how long request
+threads wait for the GIL.
+
+    python benchmarks/bench_plugin_isolation.py
+    python benchmarks/bench_plugin_isolation.py --sites 400 --size 256
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("EMAIL_ADDRESS", "bench@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "bench")
+os.environ.setdefault("RECIPIENT_EMAIL", "bench@example.com")
+
+from jobboard import JobBoardServer
+from suite import percentile
+from piston import create_app, db, isolation
+from piston.models import Website, init_db
+from piston.registry import registry
+from piston.scheduler import check_all_websites
+
+PLUGIN_SOURCE = '''
+from bs4 import BeautifulSoup
+from piston.http_client import fetch
+
+WEBSITE_NAME = "Synthetic job board (bs4)"
+WEBSITE_URL = "http://127.0.0.1/board/0"
+
+
+def scrape(url):
+    soup = BeautifulSoup(fetch(url).text, "html.parser")
+    links = [(a["href"], a.get_text(strip=True)) for a in soup.select("#results a")]
+    return {"link_count": len(links), "links_with_descriptions": links}
+'''
+
+
+def run_mode(mode, server, workdir, args):
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{workdir}/{mode}.db",
+        "SCRAPE_WORKERS": args.workers,
+        "SCRAPE_MAX_PER_HOST": args.workers,
+        "HTTP_HOST_RATE": 0,
+        "PLUGIN_EXECUTION": mode,
+        "PLUGIN_PROCESSES": args.workers,
+    })
+    with app.app_context():
+        init_db()
+        db.session.add_all(
+            Website(
+                name=f"Board {i}",
+                url=server.url_for(i, links=args.links, size_kb=args.size),
+                plugin_name="bs4board",
+                scraping_type="links",
+                scrape_interval="5min",
+                next_due_at=datetime.now(),
+            )
+            for i in range(args.sites)
+        )
+        db.session.commit()
+        db.session.remove()
+
+    client = app.test_client()
+    stop = threading.Event()
+    latencies = []
+
+    def poll():
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get("/metrics")
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    with app.app_context():
+        report = check_all_websites()
+        db.session.remove()
+    stop.set()
+    poller.join()
+    isolation.configure("thread")
+
+    return {
+        "tick_s": report["wall_time"],
+        "sites_per_s": round(report["ran"] / report["wall_time"], 1),
+        "request_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "request_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=200)
+    parser.add_argument("--links", type=int, default=200)
+    parser.add_argument("--size", type=int, default=128, help="page size in KiB")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir, JobBoardServer() as server, patch("piston.models.send_email"):
+        with open(os.path.join(workdir, "bs4board.py"), "w") as f:
+            f.write(PLUGIN_SOURCE)
+        registry.plugins_dir = workdir
+        registry.clear()
+
+        print(f"{args.sites} sites, {args.links} links, {args.size} KiB pages, {args.workers} workers")
+        print(f"{'mode':<10} {'tick s':>8} {'sites/s':>8} {'req p50 ms':>11} {'req p99 ms':>11}")
+        for mode in ("thread", "process"):
+            r = run_mode(mode, server, workdir, args)
+            print(f"{mode:<10} {r['tick_s']:>8} {r['sites_per_s']:>8} {r['request_p50_ms']:>11} {r['request_p99_ms']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Scrape latency as the number of installed plugins grows.
+
+Compares the cached plugin registry against re-importing every plugin on
+each scrape (the previous ``load_plugins`` behaviour). Plugins do no network
+I/O, so the numbers isolate the plugin lookup/import cost.
+
+    python benchmarks/bench_plugin_registry.py
+"""
+import os
+import sys
+import time
+import tempfile
+import importlib.util
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from piston.registry import PluginRegistry
+
+PLUGIN_COUNTS = [10, 100, 500]
+SCRAPES = 50
+
+PLUGIN_SOURCE = """
+import json
+import hashlib
+
+WEBSITE_NAME = "Plugin {index}"
+WEBSITE_URL = "http://localhost/{index}"
+
+
+def scrape(url):
+    return {{"link_count": 0, "links_with_descriptions": [], "html_hash": hashlib.sha256(url.encode()).hexdigest()}}
+"""
+
+
+def write_plugins(plugins_dir, count):
+    for index in range(count):
+        with open(os.path.join(plugins_dir, f"plugin_{index}.py"), "w") as f:
+            f.write(PLUGIN_SOURCE.format(index=index))
+
+
+def reimport_all(plugins_dir):
+    plugins = {}
+    for filename in os.listdir(plugins_dir):
+        if filename.endswith(".py"):
+            plugin_name = filename[:-3]
+            spec = importlib.util.spec_from_file_location(plugin_name, os.path.join(plugins_dir, filename))
+            plugin = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(plugin)
+            plugins[plugin_name] = plugin
+    return plugins
+
+
+def measure(scrape_once, scrapes):
+    timings = []
+    for _ in range(scrapes):
+        start = time.perf_counter()
+        scrape_once()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    print(f"{'plugins':>8} {'re-import p50 (ms)':>20} {'registry p50 (ms)':>20}")
+    for count in PLUGIN_COUNTS:
+        with tempfile.TemporaryDirectory() as plugins_dir:
+            write_plugins(plugins_dir, count)
+            target = f"plugin_{count // 2}"
+            registry = PluginRegistry(plugins_dir)
+            registry.get(target)  # warm, as after the first scheduled scrape
+
+            legacy = measure(lambda: reimport_all(plugins_dir)[target].scrape("http://localhost"), min(SCRAPES, 10))
+            cached = measure(lambda: registry.get(target).scrape("http://localhost"), SCRAPES)
+            print(f"{count:>8} {legacy:>20.3f} {cached:>20.3f}")
+
+
+if __name__ == "__main__":
+    main()
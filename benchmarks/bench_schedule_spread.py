@@ -0,0 +1,70 @@
+"""How evenly scrapes spread over scheduler ticks, with and without jitter.
+
+Simulates ``--hours`` of 30-second scheduler ticks for ``--sites`` sites
+created together (as ``init_websites`` does) with a mix of intervals. Every
+site due at a tick is scraped at that tick, then rescheduled with
+``next_due``. Reports the busiest tick and the spread of scrapes per tick.
+
+    python benchmarks/bench_schedule_spread.py
+    python benchmarks/bench_schedule_spread.py --sites 5000 --hours 48
+"""
+import os
+import sys
+import random
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("EMAIL_ADDRESS", "bench@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "bench")
+os.environ.setdefault("RECIPIENT_EMAIL", "bench@example.com")
+
+from suite import percentile
+from piston import create_app
+from piston.models import Website, next_due
+
+INTERVALS = ("5min", "30min", "1hour", "2hours", "12hours", "1day")
+TICK = timedelta(seconds=30)
+
+
+def simulate(sites, start, hours):
+    per_tick = Counter()
+    due = {index: next_due(site, None, start) for index, site in enumerate(sites)}
+    ticks = int(timedelta(hours=hours) / TICK)
+    for tick in range(ticks):
+        now = start + tick * TICK
+        for index, at in due.items():
+            if at <= now:
+                per_tick[tick] += 1
+                due[index] = next_due(sites[index], now)
+    # Skip the start-up burst of never-checked sites
+    return [per_tick[tick] for tick in range(ticks // 4, ticks)], [per_tick[tick] for tick in range(ticks // 4)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=1000)
+    parser.add_argument("--hours", type=int, default=24)
+    args = parser.parse_args()
+
+    random.seed(0)
+    sites = [
+        Website(url=f"http://board{i % 20}.test/jobs?page={i}", scrape_interval=random.choice(INTERVALS))
+        for i in range(args.sites)
+    ]
+    start = datetime(2024, 1, 1, 8, 0, 3)
+    print(f"{args.sites} sites over {args.hours} hours of 30-second ticks")
+    print(f"{'jitter':>7} {'first busiest':>14} {'busiest':>8} {'p99':>5} {'p50':>5} {'idle ticks':>11}")
+    for jitter in (False, True):
+        app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:", "SCHEDULE_JITTER": jitter})
+        with app.app_context():
+            steady, first = simulate(sites, start, args.hours)
+        idle = sum(1 for count in steady if count == 0) / len(steady)
+        print(f"{str(jitter):>7} {max(first):>14} {max(steady):>8} {percentile(steady, 99):>5} "
+              f"{percentile(steady, 50):>5} {idle:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
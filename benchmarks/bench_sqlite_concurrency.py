@@ -0,0 +1,152 @@
+"""Dashboard latency while a large scheduler tick is writing.
+
+Runs check_all_websites over link-type sites served by the synthetic job
+board while a reader thread polls ``/fetch_updated_data`` (with the
+dashboard cache invalidated, so every poll hits SQLite) and a writer thread
+posts ``/update_interval`` changes. Compared modes:
+
+- stock: rollback journal, synchronous=FULL, one commit per site
+- wal: WAL, synchronous=NORMAL, busy timeout, one commit per site
+- wal+batch: as wal, with the scheduler's writes grouped (the default)
+
+    python benchmarks/bench_sqlite_concurrency.py
+    python benchmarks/bench_sqlite_concurrency.py --sites 2000 --workers 16
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("EMAIL_ADDRESS", "bench@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "bench")
+os.environ.setdefault("RECIPIENT_EMAIL", "bench@example.com")
+
+from jobboard import JobBoardServer
+from suite import PLUGIN_SOURCE, percentile
+from piston import create_app, db
+from piston.dashboard import get_dashboard_cache
+from piston.models import Website, init_db
+from piston.registry import registry
+from piston.scheduler import check_all_websites
+
+MODES = {
+    "stock": {
+        "SQLITE_WAL": False,
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLALCHEMY_ENGINE_OPTIONS": {},
+        "SCRAPE_COMMIT_BATCH": 1,
+    },
+    "wal": {"SCRAPE_COMMIT_BATCH": 1},
+    "wal+batch": {},
+}
+
+
+def poll(stop, func, timings, errors):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            status = func()
+        except Exception as e:
+            errors.append(str(e))
+        else:
+            if status >= 500:
+                errors.append(status)
+        timings.append(time.perf_counter() - start)
+        time.sleep(0.01)
+
+
+def run_mode(name, overrides, server, workdir, args):
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{workdir}/{name}.db",
+        "SCRAPE_WORKERS": args.workers,
+        "SCRAPE_MAX_PER_HOST": args.workers,
+        "HTTP_HOST_RATE": 0,
+        **overrides,
+    })
+    with app.app_context():
+        init_db()
+        db.session.add_all(
+            Website(
+                name=f"Board {i}",
+                url=server.url_for(i, links=args.links, size_kb=8),
+                plugin_name="jobboard",
+                scraping_type="links",
+                scrape_interval="5min",
+                next_due_at=datetime.now(),
+            )
+            for i in range(args.sites)
+        )
+        db.session.commit()
+        db.session.remove()
+
+    client = app.test_client()
+    cache = get_dashboard_cache(app)
+    intervals = ["5min", "30min"]
+
+    def read():
+        cache.invalidate()
+        return client.get("/fetch_updated_data").status_code
+
+    def write():
+        intervals.reverse()
+        return client.post("/update_interval/1", json={"interval": intervals[0]}).status_code
+
+    stop = threading.Event()
+    reads, writes, errors = [], [], []
+    pollers = [
+        threading.Thread(target=poll, args=(stop, read, reads, errors)),
+        threading.Thread(target=poll, args=(stop, write, writes, errors)),
+    ]
+    for thread in pollers:
+        thread.start()
+
+    with app.app_context():
+        report = check_all_websites()
+        db.session.remove()
+    stop.set()
+    for thread in pollers:
+        thread.join()
+
+    with app.app_context():
+        db.engine.dispose()
+
+    return {
+        "tick_s": report["wall_time"],
+        "sites_per_s": round(report["ran"] / report["wall_time"], 1),
+        "read_p50_ms": round(percentile(reads, 50) * 1000, 1),
+        "read_p99_ms": round(percentile(reads, 99) * 1000, 1),
+        "write_p50_ms": round(percentile(writes, 50) * 1000, 1),
+        "write_p99_ms": round(percentile(writes, 99) * 1000, 1),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=1000)
+    parser.add_argument("--links", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir, JobBoardServer() as server, patch("piston.models.send_email"):
+        with open(os.path.join(workdir, "jobboard.py"), "w") as f:
+            f.write(PLUGIN_SOURCE)
+        registry.plugins_dir = workdir
+        registry.clear()
+
+        print(f"{'mode':<12} {'tick s':>8} {'sites/s':>8} {'read p50':>9} {'read p99':>9} "
+              f"{'write p50':>10} {'write p99':>10} {'errors':>7}")
+        for name, overrides in MODES.items():
+            r = run_mode(name, overrides, server, workdir, args)
+            print(f"{name:<12} {r['tick_s']:>8} {r['sites_per_s']:>8} {r['read_p50_ms']:>9} {r['read_p99_ms']:>9} "
+                  f"{r['write_p50_ms']:>10} {r['write_p99_ms']:>10} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
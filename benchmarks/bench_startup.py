@@ -0,0 +1,67 @@
+"""Startup plugin discovery as plugins get more numerous and heavier.
+
+Each synthetic plugin burns ``--import-ms`` of CPU at import time, standing
+in for heavy dependencies. Compares importing every plugin to read its
+constants (the previous ``load_plugins``) with the static manifest, both on
+a cold start (no manifest file yet) and a warm one.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --plugins 10,100,1000 --import-ms 50
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from piston.manifest import PluginManifest
+from piston.registry import PluginRegistry
+
+PLUGIN_SOURCE = """
+import time
+
+# Stand-in for importing heavy scraping dependencies
+_deadline = time.perf_counter() + {import_ms} / 1000
+while time.perf_counter() < _deadline:
+    pass
+
+WEBSITE_NAME = "Plugin {index}"
+WEBSITE_URL = "http://localhost/{index}"
+
+
+def scrape(url):
+    return {{"link_count": 0, "links_with_descriptions": []}}
+"""
+
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plugins", default="10,100,500")
+    parser.add_argument("--import-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    print(f"plugins taking {args.import_ms:g} ms to import")
+    print(f"{'plugins':>8} {'import all ms':>14} {'manifest cold ms':>17} {'manifest warm ms':>17}")
+    for count in (int(value) for value in args.plugins.split(",")):
+        with tempfile.TemporaryDirectory() as plugins_dir:
+            for index in range(count):
+                with open(os.path.join(plugins_dir, f"plugin_{index}.py"), "w") as f:
+                    f.write(PLUGIN_SOURCE.format(index=index, import_ms=args.import_ms))
+
+            import_all = timed(PluginRegistry(plugins_dir).load_all)
+            cache_path = os.path.join(plugins_dir, "instance", "plugin-manifest.json")
+            cold = timed(PluginManifest(PluginRegistry(plugins_dir), cache_path).load)
+            warm = timed(PluginManifest(PluginRegistry(plugins_dir), cache_path).load)
+            print(f"{count:>8} {import_all:>14.1f} {cold:>17.1f} {warm:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
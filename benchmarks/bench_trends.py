@@ -0,0 +1,119 @@
+"""Link-count history: storage size and ``/api/trends`` latency.
+
+Fills a SQLite database with the history a deployment would accumulate
+(a point per site every ``--every`` minutes over ``--days`` days, folded
+into hourly and daily rollups), prunes it with the default retention and
+times typical trend queries for every site and for a single site.
+
+    python benchmarks/bench_trends.py
+    python benchmarks/bench_trends.py --sites 5000 --days 30
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("EMAIL_ADDRESS", "bench@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "bench")
+os.environ.setdefault("RECIPIENT_EMAIL", "bench@example.com")
+
+from sqlalchemy import insert
+from suite import percentile
+from piston import create_app, db
+from piston.models import ROLLUP_BUCKETS, LinkCountPoint, LinkCountRollup, Website, init_db, prune_link_history
+
+
+def fill(app, args, now):
+    # Same rows record_link_count would write, inserted in bulk and in time
+    # order as they would be in production
+    random.seed(0)
+    with app.app_context():
+        init_db()
+        db.session.execute(insert(Website), [
+            {"id": i, "name": f"Board {i}", "url": f"http://127.0.0.1/board/{i}", "plugin_name": "board"}
+            for i in range(1, args.sites + 1)
+        ])
+        steps = args.days * 24 * 60 // args.every
+        points, rollups = [], {}
+        for website_id in range(1, args.sites + 1):
+            link_count = random.randint(10, 200)
+            for step in range(steps):
+                at = now - timedelta(minutes=args.every * (steps - step))
+                new_links = random.choice((0, 0, 0, 1, 2))
+                link_count = max(0, link_count + new_links - random.choice((0, 0, 1)))
+                points.append({"website_id": website_id, "at": at, "link_count": link_count, "new_links": new_links})
+                for resolution, bucket in ROLLUP_BUCKETS.items():
+                    row = rollups.setdefault((website_id, resolution, bucket(at)), {
+                        "website_id": website_id, "resolution": resolution, "bucket_start": bucket(at),
+                        "samples": 0, "link_count_min": link_count, "link_count_max": link_count, "new_links": 0,
+                    })
+                    row["samples"] += 1
+                    row["link_count_min"] = min(row["link_count_min"], link_count)
+                    row["link_count_max"] = max(row["link_count_max"], link_count)
+                    row["link_count_last"] = link_count
+                    row["new_links"] += new_links
+        points.sort(key=lambda point: point["at"])
+        db.session.execute(insert(LinkCountPoint), points)
+        db.session.execute(insert(LinkCountRollup), sorted(rollups.values(), key=lambda row: row["bucket_start"]))
+        db.session.commit()
+
+        started = time.perf_counter()
+        prune_link_history(
+            now,
+            app.config["LINK_HISTORY_RAW_DAYS"],
+            app.config["LINK_HISTORY_HOURLY_DAYS"],
+            app.config["LINK_HISTORY_DAILY_DAYS"],
+        )
+        prune_ms = (time.perf_counter() - started) * 1000
+        counts = {
+            "raw": LinkCountPoint.query.count(),
+            "rollup": LinkCountRollup.query.count(),
+        }
+        db.session.remove()
+    return counts, prune_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--every", type=int, default=60, help="minutes between scrapes")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    now = datetime.now().replace(second=0, microsecond=0)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "trends.db")
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+        counts, prune_ms = fill(app, args, now)
+        print(f"{args.sites} sites, {args.days} days, a scrape every {args.every} min")
+        print(f"after pruning: {counts['raw']} raw points, {counts['rollup']} rollups, "
+              f"{os.path.getsize(path) / 1024 / 1024:.1f} MiB, prune {prune_ms:.0f} ms")
+
+        client = app.test_client()
+        queries = {
+            "all sites, 1 day": f"start={(now - timedelta(days=1)).isoformat()}",
+            "all sites, 7 days": f"start={(now - timedelta(days=7)).isoformat()}",
+            "all sites, 90 days": f"start={(now - timedelta(days=90)).isoformat()}",
+            "one site, 7 days": f"website_id=1&start={(now - timedelta(days=7)).isoformat()}",
+        }
+        print(f"{'query':<20} {'resolution':>10} {'points':>8} {'KiB':>8} {'p50 ms':>8} {'max ms':>8}")
+        for label, query in queries.items():
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = client.get(f"/api/trends?end={now.isoformat()}&{query}")
+                timings.append((time.perf_counter() - started) * 1000)
+            body = response.get_json()
+            points = sum(len(series) for series in body["series"].values())
+            print(f"{label:<20} {body['resolution']:>10} {points:>8} {len(response.data) / 1024:>8.0f} "
+                  f"{percentile(timings, 50):>8.1f} {max(timings):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
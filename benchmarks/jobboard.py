@@ -0,0 +1,85 @@
+"""Local stand-in for a job board, serving synthetic listing pages.
+
+``/board/<site>?links=50&size=16&churn=0.1`` returns a page with ``links``
+job postings inside ``<div id="results">``, padded to about ``size`` KiB.
+Every request to the same site advances its listing by ``churn * links``
+postings, so consecutive scrapes see that fraction of new links.
+"""
+import threading
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = "<p>We are an equal opportunity employer. Apply now and join our growing team.</p>\n"
+
+
+def listing_page(site, generation, links=50, size_kb=16, churn=0.1):
+    first = generation * round(links * churn)
+    rows = "".join(
+        f'<li class="job"><a href="/jobs/{site}/{i}">Job {i} at site {site}</a> '
+        f'<span class="meta">Remote</span></li>\n'
+        for i in range(first, first + links)
+    )
+    html = f'<html><body><nav><a href="/">Home</a></nav><div id="results"><ul>{rows}</ul></div>'
+    padding = max(0, size_kb * 1024 - len(html)) // len(FILLER)
+    return (html + FILLER * padding + "</body></html>").encode()
+
+
+class JobBoardHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if not parts.path.startswith("/board/"):
+            self.send_error(404)
+            return
+        site = parts.path.rsplit("/", 1)[-1]
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+        with self.server.lock:
+            generation = self.server.generations.get(site, 0)
+            self.server.generations[site] = generation + 1
+
+        body = listing_page(
+            site,
+            generation,
+            links=int(params.get("links", 50)),
+            size_kb=int(params.get("size", 16)),
+            churn=float(params.get("churn", 0.1)),
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class JobBoardServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), JobBoardHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.generations = {}
+
+    def url_for(self, site, links=50, size_kb=16, churn=0.1):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/board/{site}?links={links}&size={size_kb}&churn={churn}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8800
+    with JobBoardServer(port=port) as server:
+        print(f"Serving synthetic job boards, e.g. {server.url_for(1)}")
+        threading.Event().wait()
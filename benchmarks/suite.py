@@ -0,0 +1,192 @@
+"""Offline end-to-end benchmark suite.
+
+Starts the synthetic job board from ``benchmarks/jobboard.py`` and runs
+update_website, check_all_websites, get_websites and the ``/`` and
+``/fetch_updated_data`` routes against a temporary SQLite database holding
+10 to 5,000 link-type websites. Reports throughput, p50/p99 latency and
+the process peak RSS, and compares them with ``benchmarks/baseline.json``.
+
+    python benchmarks/suite.py                      # compare with baseline
+    python benchmarks/suite.py --sites 10,100       # quicker run
+    python benchmarks/suite.py --save-baseline      # record a new baseline
+
+Emails are not sent: send_email is patched out for the whole run.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+from datetime import datetime
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("EMAIL_ADDRESS", "bench@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "bench")
+os.environ.setdefault("RECIPIENT_EMAIL", "bench@example.com")
+
+from jobboard import JobBoardServer
+from piston import create_app, db
+from piston.dashboard import get_dashboard_cache
+from piston.models import Website, get_websites, init_db, update_website
+from piston.registry import registry
+from piston.scheduler import check_all_websites
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+SITE_COUNTS = [10, 100, 1000, 5000]
+SAMPLES = 20
+
+PLUGIN_SOURCE = '''
+from piston.links import extract_links
+
+WEBSITE_NAME = "Synthetic job board"
+WEBSITE_URL = "http://127.0.0.1/board/0"
+
+
+def scrape(url):
+    links = list(dict.fromkeys(extract_links(url, scope="#results")))
+    return {"link_count": len(links), "links_with_descriptions": links}
+'''
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(func, samples):
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings, operations=None):
+    total = sum(timings)
+    return {
+        "throughput": round((operations or len(timings)) / total, 2) if total else None,
+        "p50_ms": round(percentile(timings, 50) * 1000, 2),
+        "p99_ms": round(percentile(timings, 99) * 1000, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_for(site_count, server, workdir, args):
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{workdir}/bench_{site_count}.db",
+        "SCRAPE_WORKERS": args.workers,
+        "SCRAPE_MAX_PER_HOST": args.workers,  # every site lives on 127.0.0.1
+        "HTTP_HOST_RATE": 0,
+    })
+    results = {}
+    with app.app_context():
+        init_db()
+        now = datetime.now()
+        db.session.add_all(
+            Website(
+                name=f"Board {i}",
+                url=server.url_for(i, links=args.links, size_kb=args.size, churn=args.churn),
+                plugin_name="jobboard",
+                scraping_type="links",
+                scrape_interval="5min",
+                next_due_at=now,
+            )
+            for i in range(site_count)
+        )
+        db.session.commit()
+        ids = [website_id for (website_id,) in db.session.query(Website.id)]
+
+        sample_ids = ids[:SAMPLES]
+        timings = [timed(lambda: update_website(website_id), 1)[0] for website_id in sample_ids]
+        results["update_website"] = summarize(timings)
+
+        Website.query.update({Website.next_due_at: datetime.now()})
+        db.session.commit()
+        start = time.perf_counter()
+        report = check_all_websites()
+        results["check_all_websites"] = summarize([time.perf_counter() - start], operations=report["ran"])
+
+        cache = get_dashboard_cache(app)
+
+        def uncached_get_websites():
+            cache.invalidate()
+            get_websites()
+
+        results["get_websites"] = summarize(timed(uncached_get_websites, SAMPLES))
+
+        client = app.test_client()
+        results["GET /"] = summarize(timed(lambda: client.get("/"), SAMPLES))
+
+        etag = client.get("/fetch_updated_data").headers["ETag"]
+        results["GET /fetch_updated_data"] = summarize(timed(lambda: client.get("/fetch_updated_data"), SAMPLES))
+        results["GET /fetch_updated_data (304)"] = summarize(
+            timed(lambda: client.get("/fetch_updated_data", headers={"If-None-Match": etag}), SAMPLES)
+        )
+        db.session.remove()
+    return results
+
+
+def compare(current, baseline):
+    print()
+    print(f"{'benchmark':<44} {'p50 ms':>10} {'base':>10} {'diff':>8} {'ops/s':>10} {'base':>10} {'diff':>8}")
+    for name, metrics in current.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<44} {metrics['p50_ms']:>10} {'-':>10} {'new':>8}")
+            continue
+
+        def diff(key):
+            if not base.get(key) or metrics.get(key) is None:
+                return "-"
+            return f"{(metrics[key] - base[key]) / base[key] * 100:+.0f}%"
+
+        print(
+            f"{name:<44} {metrics['p50_ms']:>10} {base['p50_ms']:>10} {diff('p50_ms'):>8} "
+            f"{metrics['throughput']:>10} {base['throughput']:>10} {diff('throughput'):>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", default=",".join(map(str, SITE_COUNTS)))
+    parser.add_argument("--links", type=int, default=20, help="links per page")
+    parser.add_argument("--size", type=int, default=8, help="page size in KiB")
+    parser.add_argument("--churn", type=float, default=0.1, help="fraction of new links per scrape")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, JobBoardServer() as server, patch("piston.models.send_email"):
+        with open(os.path.join(workdir, "jobboard.py"), "w") as f:
+            f.write(PLUGIN_SOURCE)
+        registry.plugins_dir = workdir
+        registry.clear()
+
+        for site_count in (int(n) for n in args.sites.split(",")):
+            for name, metrics in run_for(site_count, server, workdir, args).items():
+                key = f"{name} @ {site_count} sites"
+                results[key] = metrics
+                print(f"{key:<44} {metrics}")
+
+    if args.save_baseline:
+        with open(BASELINE, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {BASELINE}")
+    elif os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from flask_apscheduler import APScheduler
+from werkzeug.serving import is_running_from_reloader
 from piston import (
     create_app,
     init_db,
@@ -9,17 +10,22 @@ from piston import (
 from piston.scheduler import init_scheduler
 
 
+# Development server with the scheduler embedded; in production run
+# `piston serve` and `piston worker` instead
 if __name__ == "__main__":
     ensure_plugins_directory()
 
     app = create_app()
-    scheduler = APScheduler()
-    scheduler.init_app(app)
-    scheduler.start()
-
     init_db(app)
     plugins, websites_data = load_plugins()
     init_websites(app, websites_data)
-    init_scheduler(app, scheduler)
+
+    # The reloader runs this module in a watching parent process too: only
+    # the child serving requests schedules scrapes
+    if is_running_from_reloader():
+        scheduler = APScheduler()
+        scheduler.init_app(app)
+        scheduler.start()
+        init_scheduler(app, scheduler)
 
     app.run(host="0.0.0.0", port=app.config["PORT"], debug=True)
@@ -3,6 +3,9 @@ from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
 import os
 import shutil
+import socket
+
+from piston import hashing, http_client, isolation, manifest, storage, urls
 
 load_dotenv()
 
@@ -15,13 +18,66 @@ def create_app(config=None):
     if config:
         app.config.update(config)
     else:
-        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///websites.db"
+        # Workers and web servers sharing a database point at the same URL
+        app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///websites.db")
     
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["PORT"] = int(os.getenv("PORT", 5000))
     app.config["EMAIL_ADDRESS"] = os.getenv("EMAIL_ADDRESS")
     app.config["EMAIL_PASSWORD"] = os.getenv("EMAIL_PASSWORD")
     app.config["RECIPIENT_EMAIL"] = os.getenv("RECIPIENT_EMAIL")
+    app.config.setdefault("SCRAPE_WORKERS", int(os.getenv("SCRAPE_WORKERS", 8)))
+    app.config.setdefault("SCRAPE_TIMEOUT", float(os.getenv("SCRAPE_TIMEOUT", 60)))
+    app.config.setdefault("SCRAPE_MAX_PER_HOST", int(os.getenv("SCRAPE_MAX_PER_HOST", 2)))
+    app.config.setdefault("MANUAL_SCRAPE_WORKERS", int(os.getenv("MANUAL_SCRAPE_WORKERS", 2)))
+    app.config.setdefault("PLUGIN_EXECUTION", os.getenv("PLUGIN_EXECUTION", "thread"))
+    app.config.setdefault("PLUGIN_PROCESSES", int(os.getenv("PLUGIN_PROCESSES", os.cpu_count() or 2)))
+    app.config.setdefault("PLUGIN_TIMEOUT", float(os.getenv("PLUGIN_TIMEOUT", app.config["SCRAPE_TIMEOUT"])))
+    app.config.setdefault("PLUGIN_MAX_RSS_MB", int(os.getenv("PLUGIN_MAX_RSS_MB", 512)))
+    app.config.setdefault("PLUGIN_MAX_JOBS", int(os.getenv("PLUGIN_MAX_JOBS", 100)))
+    app.config.setdefault("SMTP_HOST", os.getenv("SMTP_HOST", "smtp.gmail.com"))
+    app.config.setdefault("SMTP_PORT", int(os.getenv("SMTP_PORT", 465)))
+    app.config.setdefault("SMTP_SSL", os.getenv("SMTP_SSL", "true").lower() in ("1", "true", "yes"))
+    app.config.setdefault("EMAIL_DIGEST_WINDOW", float(os.getenv("EMAIL_DIGEST_WINDOW", 30)))
+    app.config.setdefault("EMAIL_MAX_RETRIES", int(os.getenv("EMAIL_MAX_RETRIES", 5)))
+    app.config.setdefault("HTTP_TIMEOUT", float(os.getenv("HTTP_TIMEOUT", 30)))
+    app.config.setdefault("HTTP_RETRIES", int(os.getenv("HTTP_RETRIES", 3)))
+    app.config.setdefault("HTTP_MAX_BYTES", int(os.getenv("HTTP_MAX_BYTES", 10 * 1024 * 1024)))
+    app.config.setdefault("HTTP_HOST_RATE", float(os.getenv("HTTP_HOST_RATE", 1)))
+    app.config.setdefault("HTTP_HOST_BURST", int(os.getenv("HTTP_HOST_BURST", 4)))
+    app.config.setdefault(
+        "HTTP_RESPECT_CRAWL_DELAY", os.getenv("HTTP_RESPECT_CRAWL_DELAY", "true").lower() in ("1", "true", "yes")
+    )
+    app.config.setdefault("HASH_MAX_BYTES", int(os.getenv("HASH_MAX_BYTES", 10 * 1024 * 1024)))
+    app.config.setdefault("HASH_NORMALIZE", os.getenv("HASH_NORMALIZE", "false").lower() in ("1", "true", "yes"))
+    app.config.setdefault(
+        "URL_TRACKING_PARAMS", os.getenv("URL_TRACKING_PARAMS", ",".join(urls.settings["tracking_params"]))
+    )
+    app.config.setdefault("SCRAPE_RUNS_RETENTION_DAYS", int(os.getenv("SCRAPE_RUNS_RETENTION_DAYS", 14)))
+    app.config.setdefault("LINK_HISTORY_RAW_DAYS", int(os.getenv("LINK_HISTORY_RAW_DAYS", 7)))
+    app.config.setdefault("LINK_HISTORY_HOURLY_DAYS", int(os.getenv("LINK_HISTORY_HOURLY_DAYS", 90)))
+    app.config.setdefault("LINK_HISTORY_DAILY_DAYS", int(os.getenv("LINK_HISTORY_DAILY_DAYS", 3 * 365)))
+    app.config.setdefault("WORKER_POLL_SECONDS", float(os.getenv("WORKER_POLL_SECONDS", 30)))
+    app.config.setdefault("DASHBOARD_CACHE_TTL", float(os.getenv("DASHBOARD_CACHE_TTL", 10)))
+    app.config.setdefault("EVENTS_STREAM_SECONDS", float(os.getenv("EVENTS_STREAM_SECONDS", 300)))
+    app.config.setdefault("EVENTS_MAX_STREAMS", int(os.getenv("EVENTS_MAX_STREAMS", 16)))
+    app.config.setdefault("WORKER_METRICS_PORT", int(os.getenv("WORKER_METRICS_PORT", 9101)))
+    app.config.setdefault("WORKER_ID", os.getenv("WORKER_ID", f"{socket.gethostname()}:{os.getpid()}"))
+    app.config.setdefault(
+        "SCRAPE_LEASE_SECONDS", float(os.getenv("SCRAPE_LEASE_SECONDS", max(120, 2 * app.config["SCRAPE_TIMEOUT"])))
+    )
+    app.config.setdefault("SCRAPE_CLAIM_BATCH", int(os.getenv("SCRAPE_CLAIM_BATCH", 4 * app.config["SCRAPE_WORKERS"])))
+    app.config.setdefault("SCHEDULE_JITTER", os.getenv("SCHEDULE_JITTER", "true").lower() in ("1", "true", "yes"))
+    app.config.setdefault("AUTO_INTERVAL_MIN", int(os.getenv("AUTO_INTERVAL_MIN", 5 * 60)))
+    app.config.setdefault("AUTO_INTERVAL_MAX", int(os.getenv("AUTO_INTERVAL_MAX", 24 * 3600)))
+    app.config.setdefault("AUTO_INTERVAL_START", int(os.getenv("AUTO_INTERVAL_START", 3600)))
+    app.config.setdefault("SCRAPE_COMMIT_BATCH", int(os.getenv("SCRAPE_COMMIT_BATCH", 20)))
+    app.config.setdefault("SCRAPE_COMMIT_INTERVAL", float(os.getenv("SCRAPE_COMMIT_INTERVAL", 1)))
+    app.config.setdefault("SQLITE_WAL", os.getenv("SQLITE_WAL", "true").lower() in ("1", "true", "yes"))
+    app.config.setdefault("SQLITE_BUSY_TIMEOUT", float(os.getenv("SQLITE_BUSY_TIMEOUT", 5)))
+    app.config.setdefault("SQLITE_SYNCHRONOUS", os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"))
+    app.config.setdefault("DB_POOL_SIZE", int(os.getenv("DB_POOL_SIZE", 10)))
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", storage.engine_options(app.config))
 
     if app.config["EMAIL_ADDRESS"] is None:
         raise ValueError(
@@ -36,7 +92,44 @@ def create_app(config=None):
             "RECIPIENT_EMAIL is not set. Please set it in your environment or .env file."
         )
 
+    http_client.configure(
+        read_timeout=app.config["HTTP_TIMEOUT"],
+        retries=app.config["HTTP_RETRIES"],
+        max_bytes=app.config["HTTP_MAX_BYTES"],
+        pool_maxsize=max(4, app.config["SCRAPE_MAX_PER_HOST"]),
+        host_rate=app.config["HTTP_HOST_RATE"],
+        host_burst=app.config["HTTP_HOST_BURST"],
+        respect_crawl_delay=app.config["HTTP_RESPECT_CRAWL_DELAY"],
+    )
+    hashing.configure(
+        max_bytes=app.config["HASH_MAX_BYTES"],
+        normalize=app.config["HASH_NORMALIZE"],
+    )
+    urls.configure(
+        tracking_params=tuple(
+            param.strip() for param in app.config["URL_TRACKING_PARAMS"].split(",") if param.strip()
+        ),
+    )
+    # Kept out of the plugins directory, which holds user files
+    manifest.configure(cache_dir=app.instance_path)
+    # Workers copy the HTTP and hashing settings above when they start
+    isolation.configure(
+        mode=app.config["PLUGIN_EXECUTION"],
+        processes=app.config["PLUGIN_PROCESSES"],
+        timeout=app.config["PLUGIN_TIMEOUT"],
+        max_rss_mb=app.config["PLUGIN_MAX_RSS_MB"],
+        max_jobs=app.config["PLUGIN_MAX_JOBS"],
+    )
+
     db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            storage.configure_sqlite(
+                db.engine,
+                wal=app.config["SQLITE_WAL"],
+                busy_timeout=app.config["SQLITE_BUSY_TIMEOUT"],
+                synchronous=app.config["SQLITE_SYNCHRONOUS"],
+            )
 
     from piston.routes import app as routes_blueprint
 
@@ -45,8 +138,10 @@ def create_app(config=None):
     return app
 
 def init_db(app):
-    with app.app_context():
-        db.create_all()
+    from piston.models import init_db as init_db_func
+
+    with app.app_context(), storage.setup_lock(db.engine):
+        init_db_func()
 
 def load_plugins():
     from piston.utils import load_plugins as load_plugins_func
@@ -56,7 +151,8 @@ def load_plugins():
 def init_websites(app, websites_data):
     from piston.models import Website
     
-    with app.app_context():
+    # Under the setup lock, so that processes starting together seed once
+    with app.app_context(), storage.setup_lock(db.engine):
         if Website.query.count() == 0:
             for data in websites_data:
                 # Assuming data is a tuple of (name, url, plugin_name)
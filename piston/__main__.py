@@ -0,0 +1,3 @@
+from piston.cli import cli
+
+cli(prog_name="piston")
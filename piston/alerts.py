@@ -0,0 +1,252 @@
+import re
+import threading
+import unicodedata
+
+from piston.signals import alert_rules_changed
+
+TOKEN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+OPERATORS = {"AND", "OR", "NOT"}
+
+
+def normalize(text):
+    # Case- and accent-insensitive words separated by single spaces, so that
+    # "Développeur  Python!" and "developpeur python" compare equal
+    text = unicodedata.normalize("NFKD", text or "").casefold()
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", text))
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if match is None:
+            raise ValueError(f"Unterminated quote at position {position}")
+        position = match.end()
+        opening, closing, phrase, word = match.groups()
+        if opening or closing:
+            tokens.append(opening or closing)
+        elif word in OPERATORS:
+            tokens.append(word)
+        else:
+            term = normalize(phrase if phrase is not None else word)
+            if term:
+                tokens.append(("term", term))
+    return tokens
+
+
+def parse_rule(expression):
+    """Parse a rule such as ``python AND (remote OR "télétravail") NOT senior``.
+
+    Terms are words or quoted phrases, matched as whole words regardless of
+    case and accents. AND, OR and NOT must be upper case; adjacent terms are
+    ANDed. Returns a tree of ``("term", text)``, ``("not", node)``,
+    ``("and", [nodes])`` and ``("or", [nodes])``; raises ValueError.
+    """
+    tokens = tokenize(expression)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def advance():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        nodes = [parse_and()]
+        while peek() == "OR":
+            advance()
+            nodes.append(parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and():
+        nodes = [parse_unary()]
+        while peek() not in (None, "OR", ")"):
+            if peek() == "AND":
+                advance()
+            nodes.append(parse_unary())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_unary():
+        token = peek()
+        if token == "NOT":
+            advance()
+            return ("not", parse_unary())
+        if token == "(":
+            advance()
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Missing closing parenthesis")
+            advance()
+            return node
+        if isinstance(token, tuple):
+            return advance()
+        raise ValueError(f"Expected a term, got {token or 'end of rule'}")
+
+    if not tokens:
+        raise ValueError("Empty rule")
+    tree = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Unexpected {peek()}")
+    return tree
+
+
+def rule_terms(node):
+    if node[0] == "term":
+        return {node[1]}
+    if node[0] == "not":
+        return rule_terms(node[1])
+    return set().union(*(rule_terms(child) for child in node[1]))
+
+
+def evaluate(node, found):
+    kind = node[0]
+    if kind == "term":
+        return node[1] in found
+    if kind == "not":
+        return not evaluate(node[1], found)
+    if kind == "and":
+        return all(evaluate(child, found) for child in node[1])
+    return any(evaluate(child, found) for child in node[1])
+
+
+def trie_pattern(terms):
+    # Alternation arranged as a trie, so matching at a position costs the
+    # length of the longest term rather than the number of terms
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        optional = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if optional:
+            return "(?:" + body + ")?" if len(branches) > 1 or len(body) > 1 else body + "?"
+        return body
+
+    return build(trie)
+
+
+class AlertMatcher:
+    """Every active alert rule, compiled into a single regular expression.
+
+    The regex finds which rule terms occur in a link's text in one pass;
+    only the rules using one of those terms (and rules such as ``NOT senior``
+    that match when none of their terms occur) are then evaluated, so the
+    cost per link barely depends on how many rules exist.
+    """
+
+    def __init__(self, rules):
+        # rules: (id, name, website_id, expression) tuples
+        self.rules = []
+        self.sites = set()
+        self.by_term = {}
+        self.always = []
+        for rule_id, name, website_id, expression in rules:
+            tree = parse_rule(expression)
+            rule = (rule_id, name, website_id, tree)
+            self.rules.append(rule)
+            self.sites.add(website_id)
+            if evaluate(tree, set()):
+                self.always.append(rule)
+            for term in rule_terms(tree):
+                self.by_term.setdefault(term, []).append(rule)
+
+        terms = sorted(self.by_term)
+        # A shorter term found at the same position as a longer one is one of
+        # its leading words: regex alternation only reports the longer one
+        self.implied = {}
+        for term in terms:
+            words = term.split(" ")
+            prefixes = (" ".join(words[:length]) for length in range(1, len(words)))
+            self.implied[term] = [prefix for prefix in prefixes if prefix in self.by_term]
+        self.pattern = None
+        if terms:
+            self.pattern = re.compile(r"(?<!\w)(?=(" + trie_pattern(terms) + r")(?!\w))")
+
+    def applies_to(self, website_id):
+        return None in self.sites or website_id in self.sites
+
+    def found_terms(self, text):
+        found = set()
+        if self.pattern is not None:
+            for match in self.pattern.finditer(text):
+                term = match.group(1)
+                found.add(term)
+                found.update(self.implied[term])
+        return found
+
+    def matching_rules(self, website_id, text):
+        found = self.found_terms(normalize(text))
+        candidates = {rule[0]: rule for rule in self.always}
+        for term in found:
+            for rule in self.by_term[term]:
+                candidates[rule[0]] = rule
+        return [
+            name
+            for rule_id, name, scope, tree in sorted(candidates.values())
+            if scope in (None, website_id) and evaluate(tree, found)
+        ]
+
+    def match(self, website_id, links):
+        """Filter new ``(link, description)`` pairs of a website.
+
+        Returns ``(link, description, rule_names)`` for the pairs matching
+        at least one rule, or None when no rule covers this website.
+        """
+        if not self.applies_to(website_id):
+            return None
+        matches = []
+        for link, description in links:
+            names = self.matching_rules(website_id, f"{link} {description or ''}")
+            if names:
+                matches.append((link, description, names))
+        return matches
+
+
+class AlertMatcherCache:
+    """The compiled matcher, rebuilt after alert rules change."""
+
+    def __init__(self):
+        self.version = 0
+        self.matcher = None
+        self._lock = threading.Lock()
+
+    def get(self, load):
+        with self._lock:
+            if self.matcher is not None:
+                return self.matcher
+            version = self.version
+
+        matcher = AlertMatcher(load())
+
+        with self._lock:
+            if version == self.version:
+                self.matcher = matcher
+        return matcher
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self.matcher = None
+
+
+def get_alert_matcher_cache(app):
+    if "piston_alerts" not in app.extensions:
+        app.extensions["piston_alerts"] = AlertMatcherCache()
+    return app.extensions["piston_alerts"]
+
+
+@alert_rules_changed.connect
+def invalidate_alert_matcher(app, **kwargs):
+    get_alert_matcher_cache(app).invalidate()
@@ -0,0 +1,131 @@
+import os
+import sys
+
+import click
+
+from piston import create_app, ensure_plugins_directory, init_db, init_websites, load_plugins
+
+
+def prepare_app():
+    """App with its database, plugins and websites set up, but no scheduler.
+
+    Safe to run from several processes at once: schema creation and seeding
+    happen under a lock on the database (see ``storage.setup_lock``).
+    """
+    ensure_plugins_directory()
+    app = create_app()
+    init_db(app)
+    _, websites_data = load_plugins()
+    init_websites(app, websites_data)
+    return app
+
+
+def create_web_app():
+    """WSGI app factory for the web tier, e.g. ``gunicorn 'piston.cli:create_web_app()'``.
+
+    Serves the dashboard and API only: scheduled scrapes are left to
+    ``piston worker`` processes sharing the database.
+    """
+    return prepare_app()
+
+
+@click.group()
+def cli():
+    """Piston job board watcher."""
+
+
+@cli.command("init-db")
+def init_db_command():
+    """Create or upgrade the database and add the plugins' websites, then exit.
+
+    Run it once before starting ``serve`` and ``worker`` processes on a new
+    or upgraded database.
+    """
+    prepare_app()
+    click.echo("Database ready")
+
+
+@cli.command()
+@click.option("--host", default="0.0.0.0", show_default=True)
+@click.option("--port", type=int, help="Defaults to the PORT setting.")
+@click.option("--threads", type=int, help="Defaults to 8 plus EVENTS_MAX_STREAMS.")
+def serve(host, port, threads):
+    """Serve the dashboard and API, without scheduling scrapes.
+
+    Every open dashboard tab holds a thread on its ``/events`` stream, so
+    the thread count leaves room for EVENTS_MAX_STREAMS of them besides the
+    threads answering other requests.
+    """
+    app = create_web_app()
+    port = port or app.config["PORT"]
+    threads = threads or 8 + app.config["EVENTS_MAX_STREAMS"]
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        from werkzeug.serving import run_simple
+
+        print("waitress is not installed (pip install 'piston[serve]'): using the Werkzeug server")
+        run_simple(host, port, app, threaded=True)
+    else:
+        waitress_serve(app, host=host, port=port, threads=threads)
+
+
+@cli.command()
+@click.option("--metrics-host", default="0.0.0.0", show_default=True)
+@click.option("--metrics-port", type=int, help="Defaults to the WORKER_METRICS_PORT setting; 0 disables it.")
+def worker(metrics_host, metrics_port):
+    """Run the scheduler and scrape due websites, without the web server.
+
+    Several workers can share a database: due websites are claimed through
+    leases, so each scrape runs once. Each worker serves its scrape metrics
+    on ``/metrics`` of its own port, as ``piston serve`` runs no scrapes.
+    """
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from piston import metrics
+    from piston.scheduler import init_scheduler
+
+    app = prepare_app()
+    metrics_port = app.config["WORKER_METRICS_PORT"] if metrics_port is None else metrics_port
+    if metrics_port:
+        metrics.serve(app, metrics_host, metrics_port)
+    scheduler = BlockingScheduler()
+    init_scheduler(app, scheduler, poll=app.config["WORKER_POLL_SECONDS"])
+    print(f"Worker {app.config['WORKER_ID']} started")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+@cli.command("scrape-once")
+def scrape_once():
+    """Scrape every due website in parallel, send the emails and exit."""
+    from piston import db, isolation
+    from piston.executor import get_executor
+    from piston.models import schedule_unscheduled_websites
+    from piston.scheduler import check_all_websites
+
+    app = prepare_app()
+    with app.app_context():
+        schedule_unscheduled_websites()
+        report = check_all_websites()
+        db.session.remove()
+        db.engine.dispose()
+    executor = get_executor(app)
+    executor.shutdown()
+    notifications = app.extensions.get("piston_notifications")
+    if notifications is not None:
+        notifications.flush()
+    click.echo(
+        f"{report['ran']} ran, {report['skipped']} skipped, {report['failed']} failed, "
+        f"{report['timed_out']} timed out, {report['lost']} lost in {report['wall_time']}s"
+    )
+    if executor.running():
+        # Timed-out fetches still hold pool threads, which the interpreter
+        # would wait for (forever, for a plugin that never returns)
+        pool = isolation.get_pool()
+        if pool is not None:
+            pool.shutdown()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
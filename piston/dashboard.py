@@ -0,0 +1,56 @@
+import time
+import hashlib
+import threading
+
+from flask import current_app
+
+from piston.signals import website_changed
+
+
+class DashboardCache:
+    """Last dashboard snapshot, kept until a website change is committed.
+
+    Changes committed by other processes (``piston worker``) send no signal
+    here, so a snapshot is also rebuilt once it is ``ttl`` seconds old.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.version = 0
+        self.snapshot = None
+        self.built_at = None
+        self._lock = threading.Lock()
+
+    def get(self, build):
+        with self._lock:
+            if self.snapshot is not None and not (self.ttl and time.monotonic() - self.built_at >= self.ttl):
+                return self.snapshot
+            version = self.version
+            started = time.monotonic()
+
+        websites = build()
+        body = current_app.json.dumps(websites).encode()
+        snapshot = (websites, body, hashlib.sha1(body).hexdigest())
+
+        with self._lock:
+            # Don't cache a snapshot that was built while a change committed
+            if version == self.version:
+                self.snapshot = snapshot
+                self.built_at = started
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self.snapshot = None
+
+
+def get_dashboard_cache(app):
+    if "piston_dashboard" not in app.extensions:
+        app.extensions["piston_dashboard"] = DashboardCache(app.config.get("DASHBOARD_CACHE_TTL"))
+    return app.extensions["piston_dashboard"]
+
+
+@website_changed.connect
+def invalidate_dashboard(app, **kwargs):
+    get_dashboard_cache(app).invalidate()
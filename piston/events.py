@@ -0,0 +1,101 @@
+import json
+import time
+import queue
+import threading
+
+from piston.signals import website_changed
+
+# Sent to a subscriber that fell too far behind: it should refetch everything
+RESYNC = "event: resync\ndata: {}\n\n"
+
+
+class Subscription:
+    def __init__(self, maxsize):
+        self.frames = queue.Queue(maxsize)
+
+    def put(self, frame):
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            # A stalled tab: drop its backlog rather than buffer without bound
+            with self.frames.mutex:
+                self.frames.queue.clear()
+            self.frames.put_nowait(RESYNC)
+
+    def get(self, timeout):
+        return self.frames.get(timeout=timeout)
+
+
+class EventBroker:
+    """Fan out dashboard deltas to every open ``/events`` stream.
+
+    Each event is serialized once, however many tabs are listening.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = Subscription(self.maxsize)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscribers(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        if not subscriptions:
+            return
+        frame = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        for subscription in subscriptions:
+            subscription.put(frame)
+
+
+def get_event_broker(app):
+    if "piston_events" not in app.extensions:
+        app.extensions["piston_events"] = EventBroker()
+    return app.extensions["piston_events"]
+
+
+def stream(subscription, broker, keepalive=15, version=None, max_age=None):
+    # ``version`` returns a token of the dashboard data, compared at every
+    # keepalive: changes made by processes that publish nothing here then
+    # reach the page as a resync. The stream ends after ``max_age`` seconds,
+    # handing its server thread back; the browser reconnects and resyncs.
+    try:
+        # Browsers reconnect after this many milliseconds if the stream drops
+        yield "retry: 5000\n\n"
+        seen = version() if version else None
+        deadline = time.monotonic() + max_age if max_age else None
+        while True:
+            timeout = keepalive if deadline is None else min(keepalive, deadline - time.monotonic())
+            if timeout <= 0:
+                return
+            try:
+                yield subscription.get(timeout=timeout)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                current = version() if version else None
+                if current != seen:
+                    seen = current
+                    yield RESYNC
+                else:
+                    yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@website_changed.connect
+def publish_website_change(app, website_id, reason, changes=None, **kwargs):
+    get_event_broker(app).publish(reason, dict(changes or {}, id=website_id))
@@ -0,0 +1,222 @@
+import time
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from piston import http_client
+from piston.utils import run_timed, scrape_website
+
+
+class ScrapeExecutor:
+    """Bounded thread pool running plugin fetches in parallel.
+
+    Only ``scrape_website`` runs on the pool; results are handed back to the
+    caller, which applies them to the database one at a time. At most
+    ``max_per_host`` fetches hit the same host concurrently: the others wait
+    in a queue of their host, without a pool thread, until a slot frees up.
+    A fetch whose host is rate limited also waits for its token before taking
+    a thread. A fetch that runs longer than ``timeout`` seconds is abandoned:
+    its host slot goes to the next waiting fetch, its thread finishes in the
+    background and its result is dropped.
+    """
+
+    def __init__(self, max_workers=8, timeout=60, max_per_host=2):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="piston-scrape")
+        # host -> fetches waiting for a slot, and number of slots taken
+        self._waiting = {}
+        self._active = {}
+        # future -> timer starting a fetch once its host's token is due
+        self._timers = {}
+        # website_id -> future of the fetch running for it
+        self._in_flight = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _dispatch(self, host):
+        # Take the host's free slots for its waiting fetches
+        while True:
+            with self._lock:
+                waiting = self._waiting.get(host)
+                if self._closed or not waiting or self._active.get(host, 0) >= self.max_per_host:
+                    return
+                job = waiting.popleft()
+                if not waiting:
+                    del self._waiting[host]
+                self._active[host] = self._active.get(host, 0) + 1
+            delay, prepaid = http_client.take_token(job[2])
+            job = (*job, prepaid)
+            if delay <= 0:
+                self._start(host, job)
+                continue
+            timer = threading.Timer(delay, self._start, (host, job))
+            timer.daemon = True
+            with self._lock:
+                self._timers[job[0]] = timer
+            timer.start()
+
+    def _start(self, host, job):
+        future, website_id = job[0], job[1]
+        with self._lock:
+            self._timers.pop(future, None)
+            start = not self._closed and future.set_running_or_notify_cancel()
+            if start:
+                self._pool.submit(self._fetch, host, job)
+                return
+            self._in_flight.pop(website_id, None)
+        self._release(host)
+
+    def _release(self, host):
+        with self._lock:
+            self._active[host] -= 1
+            if not self._active[host]:
+                del self._active[host]
+        self._dispatch(host)
+
+    def _abandon(self, future):
+        # A fetch given up on (timed out) hands its host slot to the next
+        # waiting fetch now, not when its thread returns, which may be never
+        with self._lock:
+            if future.released:
+                return
+            future.released = True
+        self._release(future.host)
+
+    def _fetch(self, host, job):
+        future, website_id, url, plugin_name, validators, started, prepaid = job
+        try:
+            started.append(time.monotonic())
+            with http_client.prepaid(url) if prepaid else nullcontext():
+                outcome = run_timed(scrape_website, url, plugin_name, validators)
+        except Exception as e:
+            outcome = e
+        with self._lock:
+            self._in_flight.pop(website_id, None)
+            release, future.released = not future.released, True
+        if isinstance(outcome, Exception):
+            future.set_exception(outcome)
+        else:
+            future.set_result(outcome)
+        if release:
+            self._release(host)
+
+    def _submit(self, website_id, url, plugin_name, validators):
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            if website_id in self._in_flight:
+                return self._in_flight[website_id], None
+            future = Future()
+            # Monotonic start time of the fetch, once a thread runs it
+            future.started = []
+            future.host = host
+            # Set once its host slot is handed back
+            future.released = False
+            self._in_flight[website_id] = future
+            self._waiting.setdefault(host, deque()).append(
+                (future, website_id, url, plugin_name, validators, future.started)
+            )
+        self._dispatch(host)
+        return future, future.started
+
+    def submit(self, website_id, url, plugin_name, validators=None):
+        """Start a fetch, or join the one already running for ``website_id``.
+
+        Returns ``(future, owner)``: ``owner`` is False when the future belongs
+        to a fetch started earlier (by a scheduler run or another caller), whose
+        starter applies the result.
+        """
+        future, started = self._submit(website_id, url, plugin_name, validators)
+        return future, started is not None
+
+    def result(self, future):
+        """Wait for a future from ``submit`` and return its result.
+
+        Raises ``TimeoutError`` once the fetch has run for ``timeout``
+        seconds; time spent waiting for a thread or a host slot does not count.
+        """
+        while True:
+            started = future.started
+            remaining = self.timeout - (time.monotonic() - started[0]) if started else 0.5
+            if remaining <= 0 and not future.done():
+                self._abandon(future)
+                raise TimeoutError(f"Fetch still running after {self.timeout}s")
+            done, _ = wait([future], timeout=min(max(remaining, 0), 0.5))
+            if done:
+                return future.result()
+
+    def run(self, jobs):
+        """Fetch ``(website_id, url, plugin_name, validators)`` jobs.
+
+        Yields ``(website_id, status, scrape_result, timing)`` in completion
+        order, timing being the fetch/parse split from ``run_timed``,
+        and status ``"ok"``, ``"failed"``, ``"timeout"`` or ``"skipped"``
+        (a fetch for that website, e.g. one that timed out earlier or a
+        manual scrape, is still running and will be applied by its starter).
+        """
+        pending = {}
+        for website_id, url, plugin_name, validators in jobs:
+            future, started = self._submit(website_id, url, plugin_name, validators)
+            if started is None:
+                yield website_id, "skipped", None, None
+                continue
+            pending[future] = (website_id, started)
+
+        while pending:
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                website_id, _ = pending.pop(future)
+                try:
+                    scrape_result, timing = future.result()
+                except Exception as e:
+                    print(f"Error scraping website {website_id}: {e}")
+                    yield website_id, "failed", None, None
+                else:
+                    yield website_id, "ok", scrape_result, timing
+
+            now = time.monotonic()
+            for future, (website_id, started) in list(pending.items()):
+                # Finished while the caller was busy: collected on the next wait
+                if future.done():
+                    continue
+                if started and now - started[0] > self.timeout:
+                    del pending[future]
+                    future.cancel()
+                    self._abandon(future)
+                    yield website_id, "timeout", None, None
+
+    def running(self):
+        # Fetches submitted and not finished, including abandoned ones
+        with self._lock:
+            return len(self._in_flight)
+
+    def queued(self):
+        # Fetches submitted but not yet picked up by a worker
+        with self._lock:
+            waiting = sum(len(jobs) for jobs in self._waiting.values()) + len(self._timers)
+        return waiting + self._pool._work_queue.qsize()
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            timers, self._timers = list(self._timers.items()), {}
+            waiting, self._waiting = [job for jobs in self._waiting.values() for job in jobs], {}
+        for future, timer in timers:
+            timer.cancel()
+            future.cancel()
+        for job in waiting:
+            job[0].cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_executor(app):
+    if "piston_executor" not in app.extensions:
+        app.extensions["piston_executor"] = ScrapeExecutor(
+            max_workers=app.config["SCRAPE_WORKERS"],
+            timeout=app.config["SCRAPE_TIMEOUT"],
+            max_per_host=app.config["SCRAPE_MAX_PER_HOST"],
+        )
+    return app.extensions["piston_executor"]
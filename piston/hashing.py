@@ -0,0 +1,125 @@
+import time
+import codecs
+import hashlib
+from html.parser import HTMLParser
+
+import requests
+
+from piston.http_client import ResponseTooLarge, fetch, iter_body
+
+settings = {
+    "max_bytes": 10 * 1024 * 1024,
+    "normalize": False,
+}
+
+SKIPPED_ELEMENTS = {"script", "style", "noscript", "template"}
+
+
+def configure(**options):
+    settings.update({key: value for key, value in options.items() if value is not None})
+
+
+class TextHasher(HTMLParser):
+    """Hash the visible text of a page, fed incrementally.
+
+    Markup, attributes (CSRF tokens, nonces, tracking ids) and the contents
+    of script/style blocks are ignored, and whitespace is normalised, so the
+    digest does not depend on how the body was chunked on the wire.
+    """
+
+    def __init__(self, hasher):
+        super().__init__(convert_charrefs=True)
+        self.hasher = hasher
+        self._skip = 0
+        self._pending = ""
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_ELEMENTS:
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_ELEMENTS and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        text = self._pending + data
+        words = text.split()
+        # Hold back a trailing partial word until the next chunk completes it
+        self._pending = words.pop() if words and not text[-1].isspace() else ""
+        for word in words:
+            self.hasher.update(word.encode() + b" ")
+
+    def close(self):
+        super().close()
+        if self._pending:
+            self.hasher.update(self._pending.encode() + b" ")
+            self._pending = ""
+
+
+def hash_response(response, max_bytes=None, normalize=False):
+    """Return ``(hexdigest, bytes_read)`` for a streamed response body."""
+    hasher = hashlib.sha256()
+    bytes_read = 0
+    if normalize:
+        parser = TextHasher(hasher)
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+
+    for chunk in iter_body(response, max_bytes):
+        bytes_read += len(chunk)
+        if normalize:
+            parser.feed(decoder.decode(chunk))
+        else:
+            hasher.update(chunk)
+
+    if normalize:
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+    return hasher.hexdigest(), bytes_read
+
+
+def hash_page(url, validators=None, normalize=None, max_bytes=None):
+    """Scrape result for a hash-mode site, as returned by generated plugins.
+
+    Sends conditional request headers from ``validators`` and hashes the body
+    while it streams, never holding more than one chunk in memory.
+    """
+    normalize = settings["normalize"] if normalize is None else normalize
+    max_bytes = settings["max_bytes"] if max_bytes is None else max_bytes
+
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    started = time.monotonic()
+    try:
+        response = fetch(url, headers=headers, stream=True, max_bytes=max_bytes)
+        with response:
+            if response.status_code == 304:
+                return {
+                    "link_count": 0,
+                    "links_with_descriptions": [],
+                    "not_modified": True,
+                    "bytes_read": 0,
+                    "fetch_seconds": time.monotonic() - started,
+                }
+            elif response.status_code != 200:
+                return None
+
+            html_hash, bytes_read = hash_response(response, max_bytes, normalize)
+            return {
+                "link_count": 0,
+                "links_with_descriptions": [],
+                "html_hash": html_hash,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "bytes_read": bytes_read,
+                "fetch_seconds": time.monotonic() - started,
+            }
+    except (ResponseTooLarge, requests.RequestException) as e:
+        print(f"Error hashing {url}: {e}")
+        return None
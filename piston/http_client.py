@@ -0,0 +1,299 @@
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+# "gzip,deflate" plus "br" when the brotli package is installed
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; piston)",
+    "Accept-Encoding": ACCEPT_ENCODING,
+}
+
+settings = {
+    "connect_timeout": 5,
+    "read_timeout": 30,
+    "retries": 3,
+    "backoff_factor": 0.5,
+    "max_bytes": 10 * 1024 * 1024,
+    "pool_connections": 32,
+    "pool_maxsize": 4,
+    # Fetches per second and burst allowed per host; 0 disables the limit
+    "host_rate": 1.0,
+    "host_burst": 4,
+    # Slow a host down to its robots.txt Crawl-delay, read once per robots_ttl
+    "respect_crawl_delay": True,
+    "robots_ttl": 24 * 3600,
+    # Longest a 429 or 503 response's Retry-After holds a host back
+    "max_retry_after": 300,
+}
+
+ROBOTS_AGENT = "piston"
+# Pause after a 429 without a Retry-After, and before retrying a robots.txt
+# that could not be fetched
+DEFAULT_RETRY_AFTER = 60
+ROBOTS_ERROR_TTL = 3600
+
+_session = None
+_lock = threading.Lock()
+# Per-thread network time and bytes, so a scrape can split fetch from parse
+_stats = threading.local()
+# host -> HostLimit, shared by every thread of the process
+_hosts = {}
+_hosts_lock = threading.Lock()
+# Host whose token the next fetch on this thread was handed by take_token()
+_prepaid = threading.local()
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+def configure(**options):
+    global _session
+    with _lock:
+        settings.update({key: value for key, value in options.items() if value is not None})
+        if _session is not None:
+            _session.close()
+            _session = None
+    with _hosts_lock:
+        _hosts.clear()
+
+
+class TokenBucket:
+    """``rate`` tokens per second, up to ``burst`` saved; a fetch takes one.
+
+    A fetch finding the bucket empty borrows its token from the future and
+    waits for it, so concurrent callers queue up at ``rate`` rather than
+    all retrying at once.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now=None):
+        """Take a token; returns how many seconds to wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic() if now is None else now)
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds, now=None):
+        # Hand out no token for ``seconds``
+        with self._lock:
+            self._refill(time.monotonic() if now is None else now)
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class HostLimit:
+    def __init__(self, bucket, crawl_delay, expires):
+        self.bucket = bucket
+        self.crawl_delay = crawl_delay
+        self.expires = expires
+
+
+def read_crawl_delay(origin):
+    # Returns (crawl delay in seconds or None, how long to trust it)
+    try:
+        response = get_session().get(
+            f"{origin}/robots.txt", timeout=(settings["connect_timeout"], settings["read_timeout"])
+        )
+    except requests.RequestException:
+        return None, ROBOTS_ERROR_TTL
+    if response.status_code >= 500:
+        return None, ROBOTS_ERROR_TTL
+    if response.status_code != 200:
+        return None, settings["robots_ttl"]
+    parser = RobotFileParser()
+    parser.parse(response.text[:512 * 1024].splitlines())
+    delay = parser.crawl_delay(ROBOTS_AGENT)
+    try:
+        delay = float(delay) if delay is not None else None
+    except ValueError:
+        delay = None
+    return (delay if delay and delay > 0 else None), settings["robots_ttl"]
+
+
+def host_limit(url):
+    """The rate limit of ``url``'s host, or None when fetches to it are free."""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    now = time.monotonic()
+    with _hosts_lock:
+        limit = _hosts.get(host)
+    if limit is not None and limit.expires > now:
+        return limit
+
+    crawl_delay, ttl = None, settings["robots_ttl"]
+    if settings["respect_crawl_delay"] and parts.scheme in ("http", "https") and host:
+        crawl_delay, ttl = read_crawl_delay(f"{parts.scheme}://{parts.netloc}")
+    rate, burst = settings["host_rate"], settings["host_burst"]
+    if crawl_delay:
+        rate, burst = min(rate, 1 / crawl_delay) if rate else 1 / crawl_delay, 1
+
+    with _hosts_lock:
+        current = _hosts.get(host)
+        if current is not None and current.expires > now:
+            return current
+        if rate and current is not None and (current.bucket.rate, current.bucket.burst) == (rate, burst):
+            # Unchanged robots.txt: keep the tokens already spent
+            bucket = current.bucket
+        else:
+            bucket = TokenBucket(rate, max(burst, 1)) if rate else None
+        limit = _hosts[host] = HostLimit(bucket, crawl_delay, now + ttl)
+        return limit
+
+
+def take_token(url):
+    """Take a token from ``url``'s host bucket ahead of fetching it.
+
+    Returns ``(seconds until the token is due, taken)``, so a caller can wait
+    for it before tying up a thread, then fetch inside ``prepaid(url)``. Only
+    limits already known are used (robots.txt is not read here): ``taken``
+    is False for a host without one, whose fetch takes its own token.
+    """
+    with _hosts_lock:
+        limit = _hosts.get(urlsplit(url).hostname or "")
+    if limit is None or limit.bucket is None:
+        return 0.0, False
+    return limit.bucket.reserve(), True
+
+
+@contextmanager
+def prepaid(url):
+    """Let the first fetch of ``url``'s host on this thread use the token from ``take_token``."""
+    _prepaid.host = urlsplit(url).hostname or ""
+    try:
+        yield
+    finally:
+        _prepaid.host = None
+
+
+def retry_after(response):
+    value = response.headers.get("Retry-After", "").strip()
+    if value.isdigit():
+        seconds = int(value)
+    else:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            seconds = DEFAULT_RETRY_AFTER
+    return min(max(seconds, 0), settings["max_retry_after"])
+
+
+def get_session():
+    """Return the process-wide pooled session shared by every plugin."""
+    global _session
+    with _lock:
+        if _session is None:
+            retry = Retry(
+                total=settings["retries"],
+                backoff_factor=settings["backoff_factor"],
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "HEAD"}),
+                raise_on_status=False,
+                # A Retry-After pauses the host's bucket in fetch() instead of
+                # sleeping in this thread
+                respect_retry_after_header=False,
+            )
+            # pool_connections is the number of hosts kept alive, pool_maxsize the
+            # number of idle connections kept per host
+            adapter = HTTPAdapter(
+                pool_connections=settings["pool_connections"],
+                pool_maxsize=settings["pool_maxsize"],
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def start_stats():
+    _stats.seconds = 0.0
+    _stats.bytes = 0
+
+
+def get_stats():
+    return {"seconds": getattr(_stats, "seconds", 0.0), "bytes": getattr(_stats, "bytes", 0)}
+
+
+def record(seconds, size=0):
+    _stats.seconds = getattr(_stats, "seconds", 0.0) + seconds
+    _stats.bytes = getattr(_stats, "bytes", 0) + size
+
+
+def iter_body(response, max_bytes=None, chunk_size=64 * 1024):
+    """Iterate over a streamed response body, stopping past ``max_bytes``."""
+    max_bytes = settings["max_bytes"] if max_bytes is None else max_bytes
+    read = 0
+    chunks = response.iter_content(chunk_size)
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        record(time.perf_counter() - started, len(chunk) if chunk else 0)
+        if chunk is None:
+            break
+        read += len(chunk)
+        if max_bytes and read > max_bytes:
+            response.close()
+            raise ResponseTooLarge(f"{response.url} is larger than {max_bytes} bytes")
+        yield chunk
+
+
+def fetch(url, headers=None, timeout=None, max_bytes=None, stream=False, **kwargs):
+    """GET ``url`` through the shared session.
+
+    Applies the default timeouts, retries and compression. Unless ``stream``
+    is set the body is read up front (raising ``ResponseTooLarge`` past
+    ``max_bytes``) so ``response.content`` and ``response.text`` work as with
+    ``requests.get``; streamed responses should be read with ``iter_body``.
+
+    Fetches to a host are spaced by its token bucket (``host_rate`` and
+    ``host_burst``, slowed down to its robots.txt Crawl-delay), and a 429
+    holds the host back for its Retry-After. Inside ``prepaid(url)`` the
+    token taken with ``take_token`` is used instead. Buckets are per process, so
+    with ``PLUGIN_EXECUTION=process`` each worker has its own.
+    """
+    timeout = timeout or (settings["connect_timeout"], settings["read_timeout"])
+    started = time.perf_counter()
+    bucket = host_limit(url).bucket
+    if bucket is not None and getattr(_prepaid, "host", None) == (urlsplit(url).hostname or ""):
+        _prepaid.host = None
+    elif bucket is not None:
+        time.sleep(bucket.reserve())
+    response = get_session().get(url, headers=headers, timeout=timeout, stream=True, **kwargs)
+    record(time.perf_counter() - started)
+    if bucket is not None and (
+        response.status_code == 429 or (response.status_code == 503 and "Retry-After" in response.headers)
+    ):
+        bucket.pause(retry_after(response))
+
+    max_bytes = settings["max_bytes"] if max_bytes is None else max_bytes
+    content_length = response.headers.get("Content-Length")
+    if max_bytes and content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        response.close()
+        raise ResponseTooLarge(f"{url} is larger than {max_bytes} bytes")
+
+    if not stream:
+        response._content = b"".join(iter_body(response, max_bytes))
+    return response
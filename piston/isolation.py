@@ -0,0 +1,218 @@
+import os
+import json
+import atexit
+import threading
+import multiprocessing
+
+from piston import hashing, http_client, metrics
+from piston.registry import registry
+
+MODES = ("thread", "process")
+# Seconds a new worker may take to import piston before it counts as crashed
+STARTUP_TIMEOUT = 30
+
+_pool = None
+_lock = threading.Lock()
+
+
+class PluginTimeout(Exception):
+    pass
+
+
+class PluginCrashed(Exception):
+    pass
+
+
+def current_rss():
+    # Resident set size in bytes, from /proc on Linux; peak RSS elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def compact(result):
+    # Plugins may return BeautifulSoup strings that drag their whole tree
+    # along when pickled: send plain JSON instead
+    if result is None:
+        return None
+    result = dict(result)
+    if "links_with_descriptions" in result:
+        result["links_with_descriptions"] = [
+            [str(link), None if description is None else str(description)]
+            for link, description in result["links_with_descriptions"]
+        ]
+    return result
+
+
+def _worker_main(conn, http_settings, hash_settings, max_rss, max_jobs):
+    from piston.utils import run_timed, scrape_website
+
+    http_client.configure(**http_settings)
+    hashing.configure(**hash_settings)
+    conn.send_bytes(b"ready")
+
+    jobs = 0
+    while True:
+        try:
+            plugins_dir, url, plugin_name, validators = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        jobs += 1
+        registry.plugins_dir = plugins_dir
+        try:
+            result, timing = run_timed(scrape_website, url, plugin_name, validators)
+            reply = {"result": compact(result), "timing": timing}
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+
+        if jobs >= max_jobs:
+            reply["retire"] = "max_jobs"
+        elif max_rss and current_rss() > max_rss:
+            reply["retire"] = "rss"
+        conn.send_bytes(json.dumps(reply, default=str).encode())
+        if "retire" in reply:
+            return
+
+
+class Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        self.conn.close()
+        self.process.join(timeout=5)
+
+
+class PluginProcessPool:
+    """Warm worker processes running plugins outside the web process.
+
+    Each scrape is sent to an idle worker, which keeps its own plugin
+    registry and HTTP session between jobs. A worker is killed when a scrape
+    exceeds ``timeout`` seconds, and retires itself after ``max_jobs`` scrapes
+    or once its resident memory passes ``max_rss_mb``; a replacement is
+    spawned on demand.
+    """
+
+    def __init__(self, size=4, timeout=60, max_rss_mb=512, max_jobs=100, start_method="spawn"):
+        self.size = size
+        self.timeout = timeout
+        self.max_rss = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+        self.max_jobs = max_jobs
+        self._context = multiprocessing.get_context(start_method)
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _launch(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                child_conn,
+                dict(http_client.settings),
+                dict(hashing.settings),
+                self.max_rss,
+                self.max_jobs,
+            ),
+            name="piston-plugin",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return Worker(process, parent_conn)
+
+    def _wait_ready(self, worker):
+        # Startup (a fresh interpreter importing piston) is not part of any
+        # scrape's timeout
+        try:
+            if worker.conn.poll(STARTUP_TIMEOUT) and worker.conn.recv_bytes() == b"ready":
+                return worker
+        except (EOFError, OSError):
+            pass
+        worker.stop(kill=True)
+        raise PluginCrashed("plugin worker failed to start")
+
+    def _spawn(self):
+        return self._wait_ready(self._launch())
+
+    def start(self):
+        # Spawn every worker up front so the first tick doesn't pay for it
+        workers = [self._wait_ready(worker) for worker in [self._launch() for _ in range(self.size)]]
+        with self._lock:
+            self._idle.extend(workers)
+
+    def _checkout(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.stop()
+        return self._spawn()
+
+    def _checkin(self, worker):
+        with self._lock:
+            self._idle.append(worker)
+
+    def scrape(self, url, plugin_name, validators=None):
+        """Run a plugin in a worker; returns ``(scrape_result, timing)``."""
+        with self._slots:
+            worker = self._checkout()
+            try:
+                worker.conn.send((registry.plugins_dir, url, plugin_name, validators))
+                if not worker.conn.poll(self.timeout):
+                    worker.stop(kill=True)
+                    metrics.plugin_worker_exits.inc(reason="timeout")
+                    raise PluginTimeout(f"{plugin_name} did not finish within {self.timeout}s")
+                reply = json.loads(worker.conn.recv_bytes())
+            except (EOFError, OSError) as e:
+                worker.stop(kill=True)
+                metrics.plugin_worker_exits.inc(reason="crash")
+                raise PluginCrashed(f"{plugin_name} worker exited: {e!r}")
+
+            if "retire" in reply:
+                worker.stop()
+                metrics.plugin_worker_exits.inc(reason=reply["retire"])
+            else:
+                self._checkin(worker)
+
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply["result"], reply["timing"]
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.stop(kill=True)
+
+
+def configure(mode="thread", processes=4, timeout=60, max_rss_mb=512, max_jobs=100):
+    global _pool
+    if mode not in MODES:
+        raise ValueError(f"PLUGIN_EXECUTION must be one of {', '.join(MODES)}")
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+        if mode == "process":
+            _pool = PluginProcessPool(processes, timeout, max_rss_mb, max_jobs)
+            _pool.start()
+
+
+def get_pool():
+    """The process pool when plugins run out of process, otherwise None."""
+    return _pool
+
+
+@atexit.register
+def _shutdown():
+    if _pool is not None:
+        _pool.shutdown()
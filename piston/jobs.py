@@ -0,0 +1,149 @@
+import uuid
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from piston import db
+from piston.executor import get_executor
+from piston.models import Website, apply_scrape_result, get_validators
+from piston.signals import website_changed
+
+# Finished jobs kept for /jobs/<id> lookups
+JOB_HISTORY = 500
+# Seconds a joined job waits for the scheduler to commit the shared result
+JOIN_GRACE = 5
+
+
+class ScrapeJob:
+    def __init__(self, website_id):
+        self.id = uuid.uuid4().hex
+        self.website_id = website_id
+        self.status = "queued"
+        self.result = None
+        self.joined = False
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.finished = threading.Event()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "website_id": self.website_id,
+            "status": self.status,
+            "result": self.result,
+            "joined": self.joined,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """Manual scrapes, run off the request thread.
+
+    A request for a website that already has a queued or running job gets
+    that job back. The fetch goes through the shared ScrapeExecutor, so a
+    scheduled fetch already in flight for the website is joined instead of
+    started twice; the job completes when that run's result is committed.
+    """
+
+    def __init__(self, app, max_workers=2):
+        self.app = app
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="piston-job")
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+        website_changed.connect(self._on_website_changed, sender=app, weak=False)
+
+    def submit(self, website_id):
+        """Return ``(job, created)`` for a manual scrape of ``website_id``."""
+        with self._lock:
+            job = self._active.get(website_id)
+            if job is not None:
+                return job, False
+            job = ScrapeJob(website_id)
+            self._active[website_id] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > JOB_HISTORY:
+                self._jobs.popitem(last=False)
+        self._pool.submit(self._run, job)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def qsize(self):
+        return self._pool._work_queue.qsize()
+
+    def _finish(self, job, status, result):
+        with self._lock:
+            if job.finished_at is not None:
+                return
+            job.status = status
+            job.result = result
+            job.finished_at = datetime.now()
+            if self._active.get(job.website_id) is job:
+                del self._active[job.website_id]
+        job.finished.set()
+
+    def _run(self, job):
+        with self.app.app_context():
+            try:
+                website = db.session.get(Website, job.website_id)
+                if website is None:
+                    self._finish(job, "failed", "Website not found")
+                    return
+
+                validators = None
+                if website.scraping_type == 'hash':
+                    validators = get_validators([website.id]).get(website.id)
+
+                executor = get_executor(self.app)
+                job.status = "running"
+                future, owner = executor.submit(website.id, website.url, website.plugin_name, validators)
+                job.joined = not owner
+                try:
+                    scrape_result, timing = executor.result(future)
+                except TimeoutError:
+                    self._finish(job, "failed", "Scrape timed out")
+                    return
+                except Exception as e:
+                    print(f"Error scraping website {website.id}: {e}")
+                    self._finish(job, "failed", "Scraping failed")
+                    return
+
+                # A joined fetch is applied by the scheduler, whose commit
+                # finishes this job. If the scheduler gave up on it (it timed
+                # out there) apply it here: applying a result twice stores and
+                # emails nothing new.
+                if not owner and job.finished.wait(self.app.config["SCRAPE_COMMIT_INTERVAL"] + JOIN_GRACE):
+                    return
+                # Usually finished by the website_changed it sends; not on a
+                # database error
+                self._finish(job, "done", apply_scrape_result(website, scrape_result, timing))
+            except Exception as e:
+                print(f"Error running scrape job {job.id}: {e}")
+                self._finish(job, "failed", str(e))
+            finally:
+                db.session.remove()
+
+    def _on_website_changed(self, app, website_id, reason, changes=None, **kwargs):
+        # Only a committed scrape result counts, not a rescheduled skip
+        outcome = (changes or {}).get("outcome")
+        if reason != "scrape" or outcome in (None, "skipped"):
+            return
+        with self._lock:
+            job = self._active.get(website_id)
+        if job is not None and job.status == "running":
+            result = changes.get("result") or ("Scrape timed out" if outcome == "timeout" else "Scraping failed")
+            self._finish(job, "done", result)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_job_queue(app):
+    if "piston_jobs" not in app.extensions:
+        app.extensions["piston_jobs"] = JobQueue(app, max_workers=app.config["MANUAL_SCRAPE_WORKERS"])
+    return app.extensions["piston_jobs"]
@@ -0,0 +1,127 @@
+import re
+import codecs
+from collections import deque
+from html.parser import HTMLParser
+
+from piston.http_client import fetch, iter_body
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+_COMPOUND = re.compile(r"([a-zA-Z][\w-]*)?((?:[#.][\w-]+)*)$")
+
+
+class SimpleSelector:
+    """One compound selector such as ``div#results.list``."""
+
+    def __init__(self, text):
+        match = _COMPOUND.match(text)
+        if not text or not match:
+            raise ValueError(f"Unsupported selector: {text!r}")
+        self.tag = match.group(1).lower() if match.group(1) else None
+        parts = re.findall(r"[#.][\w-]+", match.group(2))
+        self.ids = {part[1:] for part in parts if part[0] == "#"}
+        self.classes = {part[1:] for part in parts if part[0] == "."}
+
+    def matches(self, tag, attrs):
+        if self.tag and self.tag != tag:
+            return False
+        if self.ids and attrs.get("id") not in self.ids:
+            return False
+        if self.classes and not self.classes <= set((attrs.get("class") or "").split()):
+            return False
+        return True
+
+
+def parse_scope(scope):
+    # Descendant chain of compound selectors, e.g. "#results li.job"
+    return [SimpleSelector(part) for part in scope.split()]
+
+
+class LinkParser(HTMLParser):
+    """Incremental ``<a href>`` collector that never builds a tree.
+
+    Only a stack of open tags is kept, each annotated with how much of the
+    scope selector chain is matched at that depth.
+    """
+
+    def __init__(self, scope=None):
+        super().__init__(convert_charrefs=True)
+        self.scope = parse_scope(scope) if scope else []
+        self.links = deque()
+        self._stack = []
+        self._anchor = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        matched = self._stack[-1][1] if self._stack else 0
+        if matched < len(self.scope) and self.scope[matched].matches(tag, attrs):
+            matched += 1
+        if tag not in VOID_ELEMENTS:
+            self._stack.append((tag, matched))
+
+        if tag == "a":
+            self._close_anchor()
+            href = (attrs.get("href") or "").strip()
+            if href and matched == len(self.scope):
+                self._anchor = (href, [])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == "a":
+            self._close_anchor()
+        # Browsers close every element left open inside the one being closed
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                del self._stack[index:]
+                break
+
+    def handle_data(self, data):
+        if self._anchor:
+            self._anchor[1].append(data)
+
+    def close(self):
+        super().close()
+        self._close_anchor()
+
+    def _close_anchor(self):
+        if self._anchor:
+            href, text = self._anchor
+            self.links.append((href, " ".join("".join(text).split())))
+            self._anchor = None
+
+
+def iter_links(chunks, scope=None, encoding=None):
+    """Yield ``(href, text)`` pairs from an iterable of HTML chunks.
+
+    ``chunks`` may be ``str`` or ``bytes`` (decoded incrementally with
+    ``encoding``, UTF-8 by default). ``scope`` restricts the result to links
+    inside elements matching a CSS-like descendant selector made of tag,
+    ``#id`` and ``.class`` parts, e.g. ``"#results"`` or ``"ul.jobs li"``.
+    """
+    parser = LinkParser(scope)
+    decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        while parser.links:
+            yield parser.links.popleft()
+
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    yield from parser.links
+
+
+def extract_links(url, scope=None, **fetch_kwargs):
+    """Stream ``url`` through the shared HTTP client and yield its links."""
+    response = fetch(url, stream=True, **fetch_kwargs)
+    with response:
+        response.raise_for_status()
+        # requests falls back to ISO-8859-1 for text/* without a charset
+        encoding = response.encoding if "charset" in response.headers.get("Content-Type", "") else None
+        yield from iter_links(iter_body(response), scope, encoding)
@@ -0,0 +1,153 @@
+import os
+import ast
+import json
+import hashlib
+import threading
+
+from piston.registry import registry
+
+MANIFEST_FILE = "plugin-manifest.json"
+# Module constants every plugin declares, read without importing it
+CONSTANTS = ("WEBSITE_NAME", "WEBSITE_URL")
+
+
+settings = {
+    # Where the manifest cache is kept, e.g. the app's instance folder; None
+    # reads every plugin's constants on each load
+    "cache_dir": None,
+}
+
+
+class ManifestError(Exception):
+    pass
+
+
+def configure(**options):
+    settings.update(options)
+
+
+def read_constants(source, filename="<plugin>"):
+    """Literal values of a plugin's WEBSITE_NAME and WEBSITE_URL.
+
+    Only the module's top-level assignments are looked at; raises
+    ManifestError when a constant is missing or isn't a literal.
+    """
+    try:
+        tree = ast.parse(source, filename)
+    except SyntaxError as e:
+        raise ManifestError(f"{filename}: {e}")
+
+    values = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets, value = [node.target], node.value
+        else:
+            continue
+        for target in targets:
+            if isinstance(target, ast.Name) and target.id in CONSTANTS:
+                try:
+                    values[target.id] = ast.literal_eval(value)
+                except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+                    values.pop(target.id, None)
+
+    missing = [name for name in CONSTANTS if not isinstance(values.get(name), str)]
+    if missing:
+        raise ManifestError(f"{filename}: no literal {', '.join(missing)}")
+    return values
+
+
+class PluginManifest:
+    """WEBSITE_NAME and WEBSITE_URL of every plugin, without importing them.
+
+    Constants are read from each file's AST and cached by content hash in a
+    JSON file at ``cache_path`` (by default in the configured ``cache_dir``,
+    never in the plugins directory, which holds user files), so that a
+    restart only parses the plugins that changed (and a file is only hashed
+    again when its mtime or size changed). Plugins whose constants aren't
+    literals are imported through the registry instead.
+    """
+
+    def __init__(self, registry, cache_path=None):
+        self.registry = registry
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        if self.cache_path is not None:
+            return self.cache_path
+        if settings["cache_dir"] is not None:
+            return os.path.join(settings["cache_dir"], MANIFEST_FILE)
+        return None
+
+    def _read_cache(self):
+        if self.path is None:
+            return {"files": {}, "constants": {}}
+        try:
+            with open(self.path) as f:
+                cache = json.load(f)
+            return {"files": dict(cache["files"]), "constants": dict(cache["constants"])}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {"files": {}, "constants": {}}
+
+    def _write_cache(self, cache):
+        if self.path is None:
+            return
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temporary, "w") as f:
+                json.dump(cache, f, indent=1, sort_keys=True)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print(f"Could not save the plugin manifest: {e}")
+
+    def _digest(self, plugin_name, cached):
+        # Returns (file_entry, source or None if it wasn't read)
+        path = self.registry.path_for(plugin_name)
+        stat = os.stat(path)
+        if cached and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            return cached, None
+        with open(path, "rb") as f:
+            source = f.read()
+        file_entry = {"digest": hashlib.sha256(source).hexdigest(), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        return file_entry, source
+
+    def _constants(self, plugin_name, source):
+        path = self.registry.path_for(plugin_name)
+        if source is None:
+            with open(path, "rb") as f:
+                source = f.read()
+        try:
+            values = read_constants(source, path)
+        except ManifestError as e:
+            print(f"Importing plugin {plugin_name} to read its constants: {e}")
+            module = self.registry.get(plugin_name)
+            values = {name: getattr(module, name) for name in CONSTANTS}
+        return {"name": values["WEBSITE_NAME"], "url": values["WEBSITE_URL"]}
+
+    def load(self):
+        """``{plugin_name: {"name", "url", "digest"}}`` for every plugin."""
+        with self._lock:
+            cache = self._read_cache()
+            updated = {"files": {}, "constants": {}}
+            plugins = {}
+            for plugin_name in self.registry.plugin_names():
+                try:
+                    file_entry, source = self._digest(plugin_name, cache["files"].get(plugin_name))
+                    digest = file_entry["digest"]
+                    constants = cache["constants"].get(digest) or self._constants(plugin_name, source)
+                except Exception as e:
+                    print(f"Skipping plugin {plugin_name}: {e}")
+                    continue
+                updated["files"][plugin_name] = file_entry
+                updated["constants"][digest] = constants
+                plugins[plugin_name] = dict(constants, digest=digest)
+            if updated != cache:
+                self._write_cache(updated)
+            return plugins
+
+
+manifest = PluginManifest(registry)
@@ -0,0 +1,175 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; spans a cached plugin lookup up to a slow multi-MB page
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', bound))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+scrape_duration = Histogram(
+    "piston_scrape_duration_seconds", "Wall time of a scrape, fetch to notification.", ("website", "plugin")
+)
+scrape_phase_duration = Histogram(
+    "piston_scrape_phase_seconds", "Time spent in each scrape phase.", ("phase",)
+)
+scrape_runs = Counter("piston_scrape_runs_total", "Scrapes by outcome.", ("outcome",))
+scrape_bytes = Counter("piston_scrape_fetched_bytes_total", "Response bytes read by plugins.")
+new_links = Counter("piston_new_links_total", "New links stored.")
+duplicate_links = Counter(
+    "piston_duplicate_links_total", "New links not emailed because another website already listed them."
+)
+auto_fetches_saved = Counter(
+    "piston_auto_fetches_saved_total", "Scrapes 'auto' websites skipped compared to polling at the minimum interval."
+)
+scheduler_lag = Gauge(
+    "piston_scheduler_lag_seconds", "How late the last scheduler run started relative to the earliest due site."
+)
+tick_duration = Histogram("piston_scheduler_tick_seconds", "Wall time of a scheduler run.")
+queue_depth = Gauge("piston_queue_depth", "Items waiting in background queues.", ("queue",))
+plugin_worker_exits = Counter(
+    "piston_plugin_worker_exits_total", "Plugin worker processes replaced, by reason.", ("reason",)
+)
+
+REGISTRY = [
+    scrape_duration,
+    scrape_phase_duration,
+    scrape_runs,
+    scrape_bytes,
+    new_links,
+    duplicate_links,
+    auto_fetches_saved,
+    scheduler_lag,
+    tick_duration,
+    queue_depth,
+    plugin_worker_exits,
+]
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def collect(app):
+    """Render the metrics of this process, sampling ``app``'s queue depths first."""
+    notifications = app.extensions.get("piston_notifications")
+    if notifications is not None:
+        queue_depth.set(notifications.qsize(), queue="notifications")
+    jobs = app.extensions.get("piston_jobs")
+    if jobs is not None:
+        queue_depth.set(jobs.qsize(), queue="manual_scrapes")
+    executor = app.extensions.get("piston_executor")
+    if executor is not None:
+        queue_depth.set(executor.queued(), queue="scrapes")
+    return render()
+
+
+def serve(app, host, port):
+    """Serve ``/metrics`` on a background thread, for processes without the web app.
+
+    Scrape metrics live in the process running the scrapes, so each
+    ``piston worker`` exposes its own. Returns the server; ``port`` 0 picks a
+    free one.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = collect(app).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="piston-metrics", daemon=True).start()
+    return server
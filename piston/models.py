@@ -1,16 +1,75 @@
 import os
+import time
 import sqlite3
-import importlib.util
-from datetime import datetime
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
 import textwrap
+from flask import current_app
+from sqlalchemy import DDL, and_, column, event, func, insert, inspect, or_, select, table, text, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import SQLAlchemyError
 
-from piston.utils import adapt_datetime, convert_datetime, scrape_website, send_email
-from piston import db
+from piston.utils import adapt_datetime, convert_datetime, run_timed, scrape_website, send_email
+from piston.registry import registry
+from piston.signals import alert_rules_changed, website_changed
+from piston.dashboard import get_dashboard_cache
+from piston.alerts import get_alert_matcher_cache, parse_rule
+from piston.urls import canonicalize, url_hash
+from piston import db, metrics
 
 sqlite3.register_adapter(datetime, adapt_datetime)
 sqlite3.register_converter("datetime", convert_datetime)
 
+# Single source of truth for scrape intervals; None means never scheduled.
+# 'hourly' and 'daily' are kept for rows created with the old model default.
+SCRAPE_INTERVALS = {
+    'never': None,
+    '5min': timedelta(minutes=5),
+    '30min': timedelta(minutes=30),
+    '1hour': timedelta(hours=1),
+    'hourly': timedelta(hours=1),
+    '2hours': timedelta(hours=2),
+    '12hours': timedelta(hours=12),
+    '1day': timedelta(days=1),
+    'daily': timedelta(days=1),
+    '1week': timedelta(weeks=1)
+}
+
+# Sites are due on a grid of their interval starting here, shifted by a
+# per-site phase so that sites sharing an interval don't all fall due together
+SCHEDULE_EPOCH = datetime(2000, 1, 1)
+# Window the first scrapes of new sites are spread over (or their interval)
+FIRST_SCRAPE_SPREAD = timedelta(minutes=30)
+
+# 'auto' sites are rescheduled from their own change history, between the
+# AUTO_INTERVAL_MIN and AUTO_INTERVAL_MAX settings
+AUTO_INTERVAL = 'auto'
+# Weight of the latest gap between two changes in the running estimate
+AUTO_CHANGE_GAP_WEIGHT = 0.5
+# Growth of the interval after 1, 2, 3... scrapes in a row found no change
+AUTO_BACKOFF = (1.5, 2, 3)
+
+# Scrape runs are buffered in memory and written in one insert
+SCRAPE_RUN_BATCH = 50
+SCRAPE_RUN_FLUSH_SECONDS = 60
+SCRAPE_RUN_PHASES = ("fetch", "parse", "diff", "commit", "notify")
+_scrape_runs_lock = threading.Lock()
+
+# Link-count history resolutions and the bucket each point is rolled into
+TREND_RESOLUTIONS = ("raw", "hour", "day")
+ROLLUP_BUCKETS = {
+    "hour": lambda at: at.replace(minute=0, second=0, microsecond=0),
+    "day": lambda at: at.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+# Points /api/trends aims to return when it picks the resolution itself
+TREND_POINT_BUDGET = 50_000
+
+# What a scrape run and its metrics need from a Website, read before a commit
+# expires the instance
+SiteRef = namedtuple("SiteRef", "id name plugin_name")
+
 
 class Website(db.Model):
     __tablename__ = 'websites'
@@ -21,143 +80,934 @@ class Website(db.Model):
     scraping_type = db.Column(db.String, default='links')
     last_checked = db.Column(db.DateTime)
     scrape_interval = db.Column(db.String, default='daily')
+    next_due_at = db.Column(db.DateTime, index=True)
+    # State of the 'auto' interval, in seconds
+    auto_interval_seconds = db.Column(db.Integer)
+    unchanged_streak = db.Column(db.Integer)
+    last_changed_at = db.Column(db.DateTime)
+    change_gap_ewma = db.Column(db.Float)
+    auto_fetches_saved = db.Column(db.Integer)
+    # Worker scraping the website and until when, see claim_due_websites
+    lease_owner = db.Column(db.String)
+    lease_expires_at = db.Column(db.DateTime, index=True)
 
     def get_last_link_count(self):
-        # Get the latest link counts entry for this website
-        link_counts = LinkCounts.query.filter_by(website_id=self.id).order_by(LinkCounts.id.desc()).first()
+        link_counts = LinkCounts.query.filter_by(website_id=self.id).first()
         return link_counts.last_link_count if link_counts else None
 
 class LinkCounts(db.Model):
+    # The latest link count of each website, updated in place; the history
+    # is kept in LinkCountPoint and LinkCountRollup
     __tablename__ = 'link_history'
+    __table_args__ = (
+        db.Index('ix_link_history_website_id_unique', 'website_id', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), nullable=False)
     last_link_count = db.Column(db.Integer)
 
+class LinkCountPoint(db.Model):
+    # One row per successful links scrape, appended and never updated
+    __tablename__ = 'link_count_points'
+    __table_args__ = (
+        db.Index('ix_link_count_points_website_id_at', 'website_id', 'at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), nullable=False)
+    at = db.Column(db.DateTime, nullable=False, index=True)
+    link_count = db.Column(db.Integer, nullable=False)
+    new_links = db.Column(db.Integer, nullable=False)
+
+class LinkCountRollup(db.Model):
+    # Hourly and daily aggregates of LinkCountPoint, upserted as points arrive
+    # so each resolution is complete over its own retention window
+    __tablename__ = 'link_count_rollups'
+    __table_args__ = (
+        db.Index('ix_link_count_rollups_bucket', 'website_id', 'resolution', 'bucket_start', unique=True),
+        db.Index('ix_link_count_rollups_resolution_bucket_start', 'resolution', 'bucket_start'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), nullable=False)
+    resolution = db.Column(db.String, nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+    link_count_min = db.Column(db.Integer, nullable=False)
+    link_count_max = db.Column(db.Integer, nullable=False)
+    link_count_last = db.Column(db.Integer, nullable=False)
+    new_links = db.Column(db.Integer, nullable=False)
+
 class Link(db.Model):
     __tablename__ = 'links'
+    __table_args__ = (
+        # One row per canonical URL and website; also finds the websites
+        # that listed a URL
+        db.Index('ix_links_url_hash_website_id', 'url_hash', 'website_id', unique=True),
+        # Keyset pagination of one website's links in insertion order
+        db.Index('ix_links_website_id_id', 'website_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), nullable=False)
+    # Canonical URL (see piston.urls.canonicalize) and its 64-bit hash
     link = db.Column(db.String, nullable=False)
+    url_hash = db.Column(db.BigInteger)
     description = db.Column(db.String)
 
+# On SQLite, descriptions are indexed by an FTS5 table over the links table,
+# kept in sync by triggers as links are inserted, updated or deleted
+LINK_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS links_fts USING fts5("
+    "description, content='links', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS links_fts_insert AFTER INSERT ON links BEGIN "
+    "INSERT INTO links_fts(rowid, description) VALUES (new.id, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS links_fts_delete AFTER DELETE ON links BEGIN "
+    "INSERT INTO links_fts(links_fts, rowid, description) VALUES ('delete', old.id, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS links_fts_update AFTER UPDATE OF description ON links BEGIN "
+    "INSERT INTO links_fts(links_fts, rowid, description) VALUES ('delete', old.id, old.description); "
+    "INSERT INTO links_fts(rowid, description) VALUES (new.id, new.description); END",
+)
+links_fts = table("links_fts", column("rowid"))
+
+for statement in LINK_SEARCH_DDL:
+    event.listen(Link.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Link.__table__, "before_drop", DDL("DROP TABLE IF EXISTS links_fts").execute_if(dialect="sqlite"))
+
 class Hash(db.Model):
     __tablename__ = 'hash'
     id = db.Column(db.Integer, primary_key=True)
     website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), nullable=False)
     last_hash = db.Column(db.String, nullable=False)
+    # HTTP validators from the last full response, sent back as
+    # If-None-Match / If-Modified-Since on the next scrape
+    etag = db.Column(db.String)
+    last_modified = db.Column(db.String)
+    # Size and duration of the last fetch
+    bytes_read = db.Column(db.Integer)
+    fetch_ms = db.Column(db.Integer)
+
+class ScrapeRun(db.Model):
+    __tablename__ = 'scrape_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), nullable=False, index=True)
+    started_at = db.Column(db.DateTime, nullable=False, index=True)
+    # changed, unchanged, failed, error, timeout or skipped
+    outcome = db.Column(db.String, nullable=False)
+    fetch_ms = db.Column(db.Integer)
+    parse_ms = db.Column(db.Integer)
+    diff_ms = db.Column(db.Integer)
+    commit_ms = db.Column(db.Integer)
+    notify_ms = db.Column(db.Integer)
+    bytes_fetched = db.Column(db.Integer)
+    links_seen = db.Column(db.Integer)
+    new_links = db.Column(db.Integer)
+
+class AlertRule(db.Model):
+    __tablename__ = 'alert_rules'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    # See piston.alerts.parse_rule for the syntax
+    expression = db.Column(db.String, nullable=False)
+    # None: the rule applies to every website
+    website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), index=True)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "expression": self.expression,
+            "website_id": self.website_id,
+            "active": self.active,
+            "created_at": self.created_at,
+        }
 
 
 def init_db():
     db.create_all()
+    upgrade_schema()
+
+def upgrade_schema():
+    # db.create_all() only creates missing tables: add the nullable columns and
+    # indexes introduced since an existing database was created.
+    with db.engine.begin() as connection:
+        # Bound to this connection, so that it runs inside the transaction
+        inspector = inspect(connection)
+        for schema_table in db.metadata.sorted_tables:
+            existing = {info["name"] for info in inspector.get_columns(schema_table.name)}
+            for schema_column in schema_table.columns:
+                if schema_column.name not in existing:
+                    column_type = schema_column.type.compile(dialect=db.engine.dialect)
+                    connection.execute(text(
+                        f"ALTER TABLE {schema_table.name} ADD COLUMN {schema_column.name} {column_type}"
+                    ))
+
+        # Before the unique url_hash index is created below
+        backfill_link_hashes(connection)
+
+        for schema_table in db.metadata.sorted_tables:
+            existing_indexes = {info["name"] for info in inspector.get_indexes(schema_table.name)}
+            for index in schema_table.indexes:
+                if index.name not in existing_indexes:
+                    if index.unique:
+                        # Older databases may hold duplicates: keep the first row
+                        columns = ", ".join(indexed.name for indexed in index.columns)
+                        connection.execute(text(
+                            f"DELETE FROM {schema_table.name} WHERE id NOT IN "
+                            f"(SELECT MIN(id) FROM {schema_table.name} GROUP BY {columns})"
+                        ))
+                    index.create(connection)
+
+        if connection.dialect.name == "sqlite" and not inspector.has_table("links_fts"):
+            # Index the links stored before search existed
+            for statement in LINK_SEARCH_DDL:
+                connection.execute(text(statement))
+            connection.execute(text("INSERT INTO links_fts(links_fts) VALUES ('rebuild')"))
+
+def backfill_link_hashes(connection, batch_size=5000):
+    # Links stored before canonicalization: rewrite them in canonical form,
+    # resolved against their website's URL, then drop the rows that turn out
+    # to be the same posting
+    if connection.execute(text("SELECT 1 FROM links WHERE url_hash IS NULL LIMIT 1")).first() is None:
+        return 0
+    # Replaced by the url_hash index; canonical rewrites may collide in it
+    connection.execute(text("DROP INDEX IF EXISTS ix_links_website_id_link"))
+    last_id = updated = 0
+    while True:
+        rows = connection.execute(text(
+            "SELECT links.id, links.link, websites.url FROM links "
+            "LEFT JOIN websites ON websites.id = links.website_id "
+            "WHERE links.url_hash IS NULL AND links.id > :last_id ORDER BY links.id LIMIT :limit"
+        ), {"last_id": last_id, "limit": batch_size}).all()
+        if not rows:
+            break
+        params = []
+        for id, link, base_url in rows:
+            link = canonicalize(link, base_url)
+            params.append({"id": id, "link": link, "url_hash": url_hash(link)})
+        connection.execute(text("UPDATE links SET link = :link, url_hash = :url_hash WHERE id = :id"), params)
+        last_id = rows[-1].id
+        updated += len(rows)
+    connection.execute(text(
+        "DELETE FROM links WHERE id NOT IN (SELECT MIN(id) FROM links GROUP BY url_hash, website_id)"
+    ))
+    return updated
+
+def insert_new_links(website_id, links_with_descriptions, batch_size=500):
+    # Insert-or-ignore against the (url_hash, website_id) unique index and
+    # return only the rows that were actually inserted, in scrape order,
+    # without reading the site's link history back into Python. Links must
+    # already be canonical.
+    rows = {}
+    for link, description in links_with_descriptions:
+        hashed = url_hash(link)
+        rows.setdefault(hashed, {"website_id": website_id, "link": link, "url_hash": hashed, "description": description})
+    rows = list(rows.values())
+
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+    inserted = set()
+    for start in range(0, len(rows), batch_size):
+        stmt = (
+            dialect.insert(Link)
+            .values(rows[start:start + batch_size])
+            .on_conflict_do_nothing(index_elements=["url_hash", "website_id"])
+            .returning(Link.url_hash)
+        )
+        inserted.update(db.session.execute(stmt).scalars())
+
+    return [(row["link"], row["description"]) for row in rows if row["url_hash"] in inserted]
+
+def canonical_links(base_url, links_with_descriptions):
+    return [(canonicalize(str(link), base_url), description) for link, description in links_with_descriptions]
+
+def listed_elsewhere(website_id, links, batch_size=500):
+    # The links another website already stored, by canonical URL hash
+    hashes = {url_hash(link): link for link, _ in links}
+    batches = list(hashes)
+    seen = set()
+    for start in range(0, len(batches), batch_size):
+        seen.update(db.session.execute(
+            db.select(Link.url_hash)
+            .where(Link.url_hash.in_(batches[start:start + batch_size]), Link.website_id != website_id)
+            .distinct()
+        ).scalars())
+    return {hashes[hashed] for hashed in seen}
+
+def fts_query(search):
+    # Quote every term so user input can't be read as FTS5 syntax; a
+    # trailing * still matches by prefix
+    terms = []
+    for term in search.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+def query_links(website_id=None, after=None, limit=50, search=None):
+    """A page of links in insertion order, and the cursor for the next one.
+
+    Pages are keyed on the last link id seen, never an offset, so every page
+    is an index range scan. ``search`` matches descriptions through the FTS5
+    index on SQLite and falls back to a substring match elsewhere.
+    """
+    stmt = db.select(Link.id, Link.website_id, Link.link, Link.description)
+    key = Link.id
+    words = (search or "").replace("*", " ").split()
+    if words and db.engine.dialect.name == "sqlite":
+        # Let FTS5 return matches in rowid order and apply the cursor
+        stmt = stmt.join(links_fts, links_fts.c.rowid == Link.id).where(
+            text("links_fts MATCH :search").bindparams(search=fts_query(search))
+        )
+        key = links_fts.c.rowid
+    elif words:
+        stmt = stmt.where(*(func.lower(Link.description).contains(word.lower(), autoescape=True) for word in words))
+    if website_id is not None:
+        stmt = stmt.where(Link.website_id == website_id)
+    if after is not None:
+        stmt = stmt.where(key > after)
+
+    rows = db.session.execute(stmt.order_by(key).limit(limit + 1)).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return [row._asdict() for row in rows[:limit]], next_cursor
+
+def auto_interval_bounds():
+    return current_app.config["AUTO_INTERVAL_MIN"], current_app.config["AUTO_INTERVAL_MAX"]
+
+def interval_delta(interval, auto_seconds=None):
+    if interval == AUTO_INTERVAL:
+        return timedelta(seconds=auto_seconds or current_app.config["AUTO_INTERVAL_START"])
+    return SCRAPE_INTERVALS.get(interval)
+
+def effective_interval(website):
+    delta = interval_delta(website.scrape_interval, website.auto_interval_seconds)
+    return int(delta.total_seconds()) if delta is not None else None
+
+def schedule_phase(url):
+    # Stable fraction of the interval in [0, 1) a site is offset by
+    return (url_hash(url) % 2**64) / 2**64
+
+def compute_next_due(interval, last_checked, now=None, auto_seconds=None, phase=None):
+    delta = interval_delta(interval, auto_seconds)
+    if delta is None:
+        return None
+    if phase is None:
+        if last_checked is None:
+            return now or datetime.now()
+        return last_checked + delta
+    if last_checked is None:
+        return (now or datetime.now()) + phase * min(delta, FIRST_SCRAPE_SPREAD)
+    # The slot of the site's grid nearest to one interval after the last check,
+    # so between half an interval and one and a half intervals later
+    offset = SCHEDULE_EPOCH + phase * delta
+    return offset + round((last_checked + delta - offset) / delta) * delta
+
+def next_due(website, last_checked, now=None):
+    phase = schedule_phase(website.url) if current_app.config["SCHEDULE_JITTER"] else None
+    return compute_next_due(website.scrape_interval, last_checked, now, website.auto_interval_seconds, phase)
+
+def adapt_interval(website, outcome, now):
+    """Move an 'auto' website's interval after a scrape found ``outcome``.
+
+    The gaps between observed changes are averaged (exponentially weighted)
+    into an estimate of how often the site changes. A change tightens the
+    interval to half that estimate, or half the current interval if that is
+    shorter; every scrape without a change stretches it by a factor that
+    grows with the number of such scrapes in a row. Failed scrapes say
+    nothing about the site and leave it alone. Also counts the fetches
+    saved against polling at the minimum interval.
+    """
+    if website.scrape_interval != AUTO_INTERVAL or outcome not in ("changed", "unchanged"):
+        return
+    minimum, maximum = auto_interval_bounds()
+    interval = website.auto_interval_seconds or current_app.config["AUTO_INTERVAL_START"]
+
+    if website.last_checked is not None:
+        elapsed = (now - website.last_checked).total_seconds()
+        saved = max(int(elapsed // minimum) - 1, 0)
+        if saved:
+            website.auto_fetches_saved = (website.auto_fetches_saved or 0) + saved
+            metrics.auto_fetches_saved.inc(saved)
+
+    if outcome == "changed":
+        if website.last_changed_at is not None:
+            gap = (now - website.last_changed_at).total_seconds()
+            if website.change_gap_ewma is None:
+                website.change_gap_ewma = gap
+            else:
+                website.change_gap_ewma += AUTO_CHANGE_GAP_WEIGHT * (gap - website.change_gap_ewma)
+        interval = min(interval, website.change_gap_ewma or interval) / 2
+        website.last_changed_at = now
+        website.unchanged_streak = 0
+    else:
+        streak = (website.unchanged_streak or 0) + 1
+        interval *= AUTO_BACKOFF[min(streak, len(AUTO_BACKOFF)) - 1]
+        website.unchanged_streak = streak
+
+    website.auto_interval_seconds = int(min(max(interval, minimum), maximum))
+
+def mark_checked(website, checked_at):
+    website.last_checked = checked_at
+    website.next_due_at = next_due(website, checked_at)
+
+def schedule_unscheduled_websites():
+    # Rows created before next_due_at existed, or with a default interval
+    now = datetime.now()
+    websites = Website.query.filter(
+        Website.next_due_at.is_(None),
+        Website.scrape_interval != 'never',
+    ).all()
+    for website in websites:
+        website.next_due_at = next_due(website, website.last_checked, now)
+    db.session.commit()
+    return len(websites)
+
+def lease_is_free(now):
+    return or_(Website.lease_expires_at.is_(None), Website.lease_expires_at <= now)
+
+def claim_due_websites(owner, now, lease_seconds, limit):
+    """Lease up to ``limit`` due websites to worker ``owner`` and return them.
+
+    Websites leased to a worker are skipped by the others until the lease
+    is released or expires, so each scrape runs once however many workers
+    share the database, and the websites of a worker that died mid-scrape
+    are claimed again once its leases run out.
+    """
+    candidates = (
+        select(Website.id)
+        .where(Website.next_due_at <= now, lease_is_free(now))
+        .order_by(Website.next_due_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    claimed = db.session.execute(
+        update(Website)
+        # Checked again in the update: another worker may have claimed a
+        # candidate since it was selected
+        .where(Website.id.in_(candidates), lease_is_free(now))
+        .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .returning(Website.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.session.commit()
+    if not claimed:
+        return []
+    return Website.query.filter(Website.id.in_(claimed)).order_by(Website.next_due_at).all()
+
+def renew_leases(owner, website_ids, now, lease_seconds):
+    # Runs on its own connection, next to the session of the scrape
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(Website)
+            .where(Website.id.in_(website_ids), Website.lease_owner == owner)
+            .values(lease_expires_at=now + timedelta(seconds=lease_seconds))
+        )
+
+def leased_to(owner, website_ids):
+    # Websites whose lease ``owner`` still holds, or held until it expired
+    # without another worker claiming them
+    return set(db.session.execute(
+        select(Website.id).where(Website.id.in_(website_ids), Website.lease_owner == owner)
+    ).scalars())
+
+def release_lease(website):
+    website.lease_owner = None
+    website.lease_expires_at = None
+
+def get_next_due_at(now=None):
+    # A website leased to a worker is due again when its lease expires, in
+    # case that worker died
+    now = now or datetime.now()
+    leased = and_(Website.lease_expires_at > now, Website.lease_expires_at > Website.next_due_at)
+    # Two queries, each walking an index from its earliest row, instead of
+    # a min() over an expression, which reads every website
+    earliest_free = db.session.execute(
+        select(Website.next_due_at)
+        .where(
+            Website.next_due_at.isnot(None),
+            or_(
+                Website.lease_expires_at.is_(None),
+                Website.lease_expires_at <= now,
+                Website.lease_expires_at <= Website.next_due_at,
+            ),
+        )
+        .order_by(Website.next_due_at)
+        .limit(1)
+    ).scalar()
+    earliest_lease = db.session.execute(
+        select(Website.lease_expires_at).where(leased).order_by(Website.lease_expires_at).limit(1)
+    ).scalar()
+    due = [at for at in (earliest_free, earliest_lease) if at is not None]
+    return min(due) if due else None
+
+def get_validators(website_ids):
+    hashes = Hash.query.filter(Hash.website_id.in_(website_ids)).all()
+    return {
+        h.website_id: {"etag": h.etag, "last_modified": h.last_modified}
+        for h in hashes
+        if h.etag or h.last_modified
+    }
+
+def record_scrape_run(website, outcome, started_at, phases=None, bytes_fetched=None, links_seen=None, new_links=None):
+    # Observe the metrics right away; the row itself is buffered and written
+    # by flush_scrape_runs
+    phases = {phase: seconds for phase, seconds in (phases or {}).items() if seconds is not None}
+    metrics.scrape_runs.inc(outcome=outcome)
+    for phase, seconds in phases.items():
+        metrics.scrape_phase_duration.observe(seconds, phase=phase)
+    if phases:
+        metrics.scrape_duration.observe(sum(phases.values()), website=website.name, plugin=website.plugin_name)
+    if bytes_fetched:
+        metrics.scrape_bytes.inc(bytes_fetched)
+    if new_links:
+        metrics.new_links.inc(new_links)
+
+    row = {
+        "website_id": website.id,
+        "started_at": started_at,
+        "outcome": outcome,
+        "bytes_fetched": bytes_fetched,
+        "links_seen": links_seen,
+        "new_links": new_links,
+    }
+    for phase in SCRAPE_RUN_PHASES:
+        row[f"{phase}_ms"] = round(phases[phase] * 1000) if phase in phases else None
+
+    with _scrape_runs_lock:
+        buffer = current_app.extensions.setdefault("piston_scrape_runs", {"rows": [], "since": time.monotonic()})
+        buffer["rows"].append(row)
+
+def flush_scrape_runs(force=True):
+    # Runs the session's transaction commit, so call it between scrape batches
+    with _scrape_runs_lock:
+        buffer = current_app.extensions.get("piston_scrape_runs")
+        if not buffer or not buffer["rows"]:
+            return 0
+        due = (
+            len(buffer["rows"]) >= SCRAPE_RUN_BATCH
+            or time.monotonic() - buffer["since"] >= SCRAPE_RUN_FLUSH_SECONDS
+        )
+        if not (force or due):
+            return 0
+        rows, buffer["rows"], buffer["since"] = buffer["rows"], [], time.monotonic()
+    try:
+        db.session.execute(insert(ScrapeRun), rows)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Error saving scrape runs: {e}")
+        return 0
+    return len(rows)
+
+def prune_scrape_runs(before):
+    deleted = ScrapeRun.query.filter(ScrapeRun.started_at < before).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def record_link_count(website_id, at, link_count, new_links):
+    # Append the point and fold it into its hourly and daily buckets, in the
+    # caller's transaction
+    db.session.execute(insert(LinkCountPoint).values(
+        website_id=website_id, at=at, link_count=link_count, new_links=new_links
+    ))
+    postgres = db.engine.dialect.name == "postgresql"
+    dialect = postgresql if postgres else sqlite
+    least, greatest = (func.least, func.greatest) if postgres else (func.min, func.max)
+    rollups = LinkCountRollup.__table__
+    for resolution, bucket in ROLLUP_BUCKETS.items():
+        stmt = dialect.insert(LinkCountRollup).values(
+            website_id=website_id,
+            resolution=resolution,
+            bucket_start=bucket(at),
+            samples=1,
+            link_count_min=link_count,
+            link_count_max=link_count,
+            link_count_last=link_count,
+            new_links=new_links,
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=["website_id", "resolution", "bucket_start"],
+            set_={
+                "samples": rollups.c.samples + 1,
+                "link_count_min": least(rollups.c.link_count_min, stmt.excluded.link_count_min),
+                "link_count_max": greatest(rollups.c.link_count_max, stmt.excluded.link_count_max),
+                "link_count_last": stmt.excluded.link_count_last,
+                "new_links": rollups.c.new_links + stmt.excluded.new_links,
+            },
+        ))
+
+def prune_link_history(now, raw_days, hourly_days, daily_days):
+    deleted = LinkCountPoint.query.filter(
+        LinkCountPoint.at < now - timedelta(days=raw_days)
+    ).delete(synchronize_session=False)
+    for resolution, days in (("hour", hourly_days), ("day", daily_days)):
+        deleted += LinkCountRollup.query.filter(
+            LinkCountRollup.resolution == resolution,
+            LinkCountRollup.bucket_start < ROLLUP_BUCKETS[resolution](now - timedelta(days=days)),
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def pick_trend_resolution(start, end, now, raw_days, hourly_days, series=1):
+    # The finest resolution that still holds data for ``start`` and keeps the
+    # response near TREND_POINT_BUDGET points, counting an hour per raw point
+    span = end - start
+    points = series * span / timedelta(hours=1)
+    if points <= TREND_POINT_BUDGET:
+        if span <= timedelta(days=2) and start >= now - timedelta(days=raw_days):
+            return "raw"
+        if start >= ROLLUP_BUCKETS["hour"](now - timedelta(days=hourly_days)):
+            return "hour"
+    return "day"
+
+def query_trends(start, end, resolution, website_ids=None):
+    """Link-count series per website id, as lists of plain tuples.
+
+    Raw points are ``(at, link_count, new_links)``; rollups are
+    ``(bucket_start, link_count_last, link_count_min, link_count_max,
+    new_links, samples)``.
+    """
+    if resolution == "raw":
+        model, at = LinkCountPoint, LinkCountPoint.at
+        columns = (LinkCountPoint.link_count, LinkCountPoint.new_links)
+        stmt = db.select(model.website_id, at, *columns)
+    else:
+        model, at = LinkCountRollup, LinkCountRollup.bucket_start
+        columns = (
+            LinkCountRollup.link_count_last,
+            LinkCountRollup.link_count_min,
+            LinkCountRollup.link_count_max,
+            LinkCountRollup.new_links,
+            LinkCountRollup.samples,
+        )
+        stmt = db.select(model.website_id, at, *columns).where(LinkCountRollup.resolution == resolution)
+        # Include the bucket that ``start`` falls in
+        start = ROLLUP_BUCKETS[resolution](start)
+    stmt = stmt.where(at >= start, at <= end).order_by(model.website_id, at)
+    if website_ids:
+        stmt = stmt.where(model.website_id.in_(website_ids))
+
+    series = {}
+    for website_id, *point in db.session.execute(stmt):
+        series.setdefault(website_id, []).append(tuple(point))
+    return series
 
 def get_websites():
-    websites = Website.query.all()
-
-    websites = [
-        {
-            "id": w.id,
-            "name": w.name,
-            "url": w.url,
-            "plugin_name": w.plugin_name,
-            "scraping_type": w.scraping_type,
-            "last_checked": w.last_checked,
-            "scrape_interval": w.scrape_interval,
-            "last_link_count": w.get_last_link_count(),
-        }
-        for w in websites
-    ]
+    return get_websites_snapshot()[0]
+
+def get_websites_snapshot():
+    # (websites, json_body, etag) served from the dashboard cache, which is
+    # invalidated whenever a website change commits
+    return get_dashboard_cache(current_app).get(query_websites)
+
+def query_websites():
+    rows = (
+        db.session.query(Website, LinkCounts.last_link_count)
+        .outerjoin(LinkCounts, LinkCounts.website_id == Website.id)
+        .order_by(Website.id)
+        .all()
+    )
+
+    websites = [website_row(w, last_link_count) for w, last_link_count in rows]
 
     return websites
 
+def website_row(w, last_link_count=None):
+    return {
+        "id": w.id,
+        "name": w.name,
+        "url": w.url,
+        "plugin_name": w.plugin_name,
+        "scraping_type": w.scraping_type,
+        "last_checked": w.last_checked,
+        "scrape_interval": w.scrape_interval,
+        "effective_interval": effective_interval(w),
+        "fetches_saved": w.auto_fetches_saved or 0,
+        "last_link_count": last_link_count,
+    }
+
+def notify_website_changed(website_id, reason, changes=None):
+    website_changed.send(
+        current_app._get_current_object(), website_id=website_id, reason=reason, changes=changes or {}
+    )
+
+class CommitBatch:
+    """Commit the writes of several scrapes in one transaction.
+
+    Dashboard notifications, emails and scrape-run records are held until the
+    commit succeeds, so nothing is announced for changes that were rolled back.
+    """
+
+    def __init__(self):
+        self.pending = []
+
+    def add(self, website, notifications=(), run=None, changes=None):
+        site = SiteRef(website.id, website.name, website.plugin_name)
+        changes = dict(changes or {}, last_checked=website.last_checked)
+        self.pending.append((site, list(notifications), run, changes))
+
+    def commit(self):
+        """Commit and announce the pending scrapes; returns an error or None."""
+        pending, self.pending = self.pending, []
+        started = time.perf_counter()
+        try:
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            print(f"Error committing {len(pending)} scrapes: {e}")
+            for site, _, run, _ in pending:
+                if run is not None:
+                    record_scrape_run(site, **dict(run, outcome="error"))
+            return str(e)
+
+        # One commit is shared by the whole batch
+        commit_seconds = (time.perf_counter() - started) / max(len(pending), 1)
+        for site, notifications, run, changes in pending:
+            started = time.perf_counter()
+            notify_website_changed(site.id, "scrape", changes)
+            for subject, body in notifications:
+                send_email(subject, body)
+            if run is not None:
+                phases = run.setdefault("phases", {})
+                phases["commit"] = commit_seconds
+                phases["notify"] = time.perf_counter() - started
+                record_scrape_run(site, **run)
+        flush_scrape_runs(force=False)
+        return None
+
+    def discard(self):
+        # The session was rolled back: record the lost scrapes as errors
+        pending, self.pending = self.pending, []
+        for site, _, run, _ in pending:
+            if run is not None:
+                record_scrape_run(site, **dict(run, outcome="error"))
+
+
 def update_website(id):
     try:
         website = db.session.get(Website, id)
-        if website:
-            url = website.url
-            plugin_name = website.plugin_name
-
         if not website:
             return "Website not found"
 
-        scrape_result = scrape_website(url, plugin_name)
+        validators = None
+        if website.scraping_type == 'hash':
+            validators = get_validators([website.id]).get(website.id)
+
+        scrape_result, timing = run_timed(scrape_website, website.url, website.plugin_name, validators)
 
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return f"Database error: {str(e)}"
+
+    return apply_scrape_result(website, scrape_result, timing)
+
+
+def apply_scrape_result(website, scrape_result, timing=None, batch=None):
+    # Diff a plugin result against the stored state. This is the only part of
+    # a scrape that touches the database, so callers fetching in parallel must
+    # run it serially. Without a ``batch`` the result is committed straight
+    # away. ``timing`` is the fetch/parse split from run_timed; the remaining
+    # phases are timed here and recorded as a ScrapeRun.
+    url = website.url
+    timing = timing or {}
+    phases = {"fetch": timing.get("fetch"), "parse": timing.get("parse")}
+    started_at = datetime.now() - timedelta(seconds=sum(seconds or 0 for seconds in phases.values()))
+    site = SiteRef(website.id, website.name, website.plugin_name)
+    notifications = []
+    changes = {}
+    outcome = "unchanged"
+    links_seen = new_link_count = None
+    own_batch = batch is None
+    if own_batch:
+        batch = CommitBatch()
+    try:
+        phase_started = time.perf_counter()
         if scrape_result:
             if website.scraping_type == 'hash':
+                before_hash = db.session.query(Hash).filter(Hash.website_id == website.id).first()
 
-                if "html_hash" in scrape_result.keys():
-                    before_hash = db.session.query(Hash).filter(Hash.id == website.id).first()
+                if scrape_result.get("not_modified"):
+                    result = "Not modified since last check: no site update"
+
+                elif "html_hash" in scrape_result.keys():
                     after_hash = scrape_result["html_hash"]
 
                     if before_hash is None:
                         result = f"New site: hash generated"
-                        new_hash = Hash(website_id=website.id, last_hash=after_hash)
-                        db.session.add(new_hash)
+                        outcome = "changed"
+                        before_hash = Hash(website_id=website.id, last_hash=after_hash)
+                        db.session.add(before_hash)
 
                     elif before_hash.last_hash != after_hash:
                         result = f"Update detected: site hash changed"
                         before_hash.last_hash = after_hash
 
+                        outcome = "changed"
                         subject = f"Update from site {url}"
                         body = f"{url} site was updated (new hash: {after_hash})"
-                        send_email(subject, body)
+                        notifications.append((subject, body))
                     else:
                         result = "Same hash as before: no site update"
+
+                    before_hash.etag = scrape_result.get("etag")
+                    before_hash.last_modified = scrape_result.get("last_modified")
                 else:
                     result = "Wrong plugin type"
+                    outcome = "error"
+
+                if before_hash is not None and "bytes_read" in scrape_result:
+                    before_hash.bytes_read = scrape_result["bytes_read"]
+                    before_hash.fetch_ms = round(scrape_result["fetch_seconds"] * 1000)
 
             elif website.scraping_type == 'links':
                 current_link_count = scrape_result["link_count"]
-                current_links_with_descriptions = scrape_result["links_with_descriptions"]
-
-                db_links = db.session.query(Link).filter(Link.website_id == website.id).all()
-                existing_links = set([db_link.link for db_link in db_links])
+                current_links_with_descriptions = canonical_links(url, scrape_result["links_with_descriptions"])
 
-                new_links_with_descriptions = [
-                    link for link in current_links_with_descriptions
-                    if link[0] not in existing_links
-                ]
+                new_links_with_descriptions = insert_new_links(website.id, current_links_with_descriptions)
+                links_seen = current_link_count
+                new_link_count = len(new_links_with_descriptions)
+                record_link_count(website.id, datetime.now(), current_link_count, new_link_count)
 
                 if new_links_with_descriptions:
+                    outcome = "changed"
                     result = f"Update detected: {len(new_links_with_descriptions)} new links found"
 
-                    for link, description in new_links_with_descriptions:
-                        new_link = Link(website_id=website.id, link=link, description=description)
-                        db.session.add(new_link)
-
                     link_counts = db.session.query(LinkCounts).filter(LinkCounts.website_id == website.id).first()
                     if link_counts is None:
                         new_link_counts = LinkCounts(website_id=website.id, last_link_count=current_link_count)
                         db.session.add(new_link_counts)
                     else:
                         link_counts.last_link_count = current_link_count
+                    changes["last_link_count"] = current_link_count
 
-                    subject = f"New links detected on {url}"
-                    body = "The following new links were found:\n\n" + "\n".join(
-                        [f"{link[0]} - {link[1]}" for link in new_links_with_descriptions]
-                    )
-                    send_email(subject, body)
+                    # Postings another website already listed were emailed
+                    # from there
+                    duplicates = listed_elsewhere(website.id, new_links_with_descriptions)
+                    if duplicates:
+                        metrics.duplicate_links.inc(len(duplicates))
+                    unseen_links = [link for link in new_links_with_descriptions if link[0] not in duplicates]
+
+                    # With alert rules covering this website, only the
+                    # links matching one of them are emailed
+                    matches = match_alerts(website.id, unseen_links)
+                    if matches is None and unseen_links:
+                        subject = f"New links detected on {url}"
+                        body = "The following new links were found:\n\n" + "\n".join(
+                            [f"{link[0]} - {link[1]}" for link in unseen_links]
+                        )
+                        notifications.append((subject, body))
+                    elif matches:
+                        subject = f"New links matching your alerts on {url}"
+                        body = "The following new links match your alert rules:\n\n" + "\n".join(
+                            [f"{link} - {description} [{', '.join(names)}]" for link, description, names in matches]
+                        )
+                        notifications.append((subject, body))
 
                 else:
                     result = "No new links found"
 
-            website.last_checked = db.func.now()
-            db.session.commit()
+            checked_at = datetime.now()
+            adapt_interval(website, outcome, checked_at)
+            mark_checked(website, checked_at)
+            if website.scrape_interval == AUTO_INTERVAL:
+                changes.update(effective_interval=effective_interval(website),
+                               fetches_saved=website.auto_fetches_saved or 0)
+            phases["diff"] = time.perf_counter() - phase_started
 
         else:
             result = "Scraping failed"
+            outcome = "failed"
 
     except SQLAlchemyError as e:
         db.session.rollback()
+        batch.discard()
         result = f"Database error: {str(e)}"
+        record_scrape_run(site, "error", started_at, phases)
+        return result
 
+    run = {
+        "outcome": outcome,
+        "started_at": started_at,
+        "phases": phases,
+        "bytes_fetched": timing.get("bytes") or (scrape_result or {}).get("bytes_read"),
+        "links_seen": links_seen,
+        "new_links": new_link_count,
+    }
+    changes.update(result=result, outcome=outcome)
+    # Emails are only queued for changes that were actually committed
+    batch.add(website, notifications, run, changes)
+    if own_batch:
+        error = batch.commit()
+        if error is not None:
+            result = f"Database error: {error}"
     return result
 
 
+def load_alert_rules():
+    return db.session.execute(
+        db.select(AlertRule.id, AlertRule.name, AlertRule.website_id, AlertRule.expression)
+        .where(AlertRule.active.is_(True))
+        .order_by(AlertRule.id)
+    ).all()
+
+def match_alerts(website_id, links_with_descriptions):
+    # The matcher is compiled once and kept until a rule changes
+    matcher = get_alert_matcher_cache(current_app).get(load_alert_rules)
+    return matcher.match(website_id, links_with_descriptions)
+
+def get_alert_rules():
+    return [rule.to_dict() for rule in AlertRule.query.order_by(AlertRule.id)]
+
+def save_alert_rule(rule, fields):
+    # Raises ValueError for an invalid expression or unknown website
+    if "expression" in fields:
+        parse_rule(fields["expression"])
+    if fields.get("website_id") is not None and db.session.get(Website, fields["website_id"]) is None:
+        raise ValueError("Website not found")
+    for field in ("name", "expression", "website_id"):
+        if field in fields:
+            setattr(rule, field, fields[field])
+    if "active" in fields:
+        rule.active = bool(fields["active"])
+    if not rule.name or not rule.expression:
+        raise ValueError("A rule needs a name and an expression")
+    db.session.add(rule)
+    db.session.commit()
+    alert_rules_changed.send(current_app._get_current_object(), rule_id=rule.id)
+    return rule
+
+def add_alert_rule(name, expression, website_id=None, active=True):
+    fields = {"name": name, "expression": expression, "website_id": website_id, "active": active}
+    return save_alert_rule(AlertRule(), fields)
+
+def update_alert_rule(id, **fields):
+    # Only the given fields change; website_id=None makes the rule global
+    rule = db.session.get(AlertRule, id)
+    if rule is None:
+        return None
+    return save_alert_rule(rule, fields)
+
+def delete_alert_rule(id):
+    rule = db.session.get(AlertRule, id)
+    if rule is None:
+        return False
+    db.session.delete(rule)
+    db.session.commit()
+    alert_rules_changed.send(current_app._get_current_object(), rule_id=id)
+    return True
+
+
 def update_interval(id, interval):
     website = db.session.get(Website, id)
     if website:
         website.scrape_interval = interval
+        if interval == AUTO_INTERVAL and website.auto_interval_seconds is None:
+            website.auto_interval_seconds = current_app.config["AUTO_INTERVAL_START"]
+        website.next_due_at = next_due(website, website.last_checked)
         db.session.commit()
+        changes = {"scrape_interval": interval}
+        if interval == AUTO_INTERVAL:
+            changes["effective_interval"] = effective_interval(website)
+        notify_website_changed(website.id, "interval", changes)
         return f"Scrape interval updated to {interval}"
     return "Website not found"
 
@@ -182,27 +1032,20 @@ def add_custom_website(name, url):
     )
     db.session.add(new_website)
     db.session.commit()
+    notify_website_changed(new_website.id, "added", website_row(new_website))
     
 # Create a plugin file for the custom website
     plugin_content = f"""
-        import requests
-        import hashlib
+        from piston.hashing import hash_page
 
         WEBSITE_NAME = "{name}"
         WEBSITE_URL = "{url}"
 
 
-        def scrape(url):
-            headers = {{"User-Agent": "Mozilla/5.0"}}
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                return {{
-                    "link_count": 0,
-                    "links_with_descriptions": [],
-                    "html_hash": hashlib.sha256(response.content).hexdigest()
-                }}
-            else:
-                return None
+        def scrape(url, validators=None):
+            # Streams and hashes the page, honouring HASH_MAX_BYTES and
+            # HASH_NORMALIZE; pass normalize=True to hash visible text only
+            return hash_page(url, validators)
     """
 
     with open(f"plugins/{plugin_name}.py", "w") as f:
@@ -214,11 +1057,17 @@ def add_custom_website(name, url):
 def delete_custom_website(id):
     website = db.session.get(Website, id)
     if website:
+        # Its stored links would otherwise keep counting as listed elsewhere
+        # (the FTS triggers drop them from the search index too)
+        for model in (Link, Hash, LinkCounts, LinkCountPoint, LinkCountRollup, ScrapeRun, AlertRule):
+            model.query.filter_by(website_id=website.id).delete(synchronize_session=False)
         db.session.delete(website)
         db.session.commit()
+        notify_website_changed(website.id, "deleted")
         
         # Delete the corresponding plugin file
         plugin_name = website.plugin_name
+        registry.evict(plugin_name)
         if os.path.exists(f"plugins/{plugin_name}.py"):
             os.remove(f"plugins/{plugin_name}.py")
             
@@ -227,11 +1076,9 @@ def delete_custom_website(id):
 
 def add_uploaded_scraper(filename):
     try:
-        # Load the module
+        # Load the module into the plugin registry, replacing any older version
         module_name = filename[:-3]  # Remove .py extension
-        spec = importlib.util.spec_from_file_location(module_name, os.path.join('plugins', filename))
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+        module = registry.load(module_name)
         
         # Check if the required attributes exist
         if not all(hasattr(module, attr) for attr in ['WEBSITE_NAME', 'WEBSITE_URL', 'scrape']):
@@ -246,9 +1093,11 @@ def add_uploaded_scraper(filename):
         )
         db.session.add(new_website)
         db.session.commit()
+        notify_website_changed(new_website.id, "added", website_row(new_website))
         return True
     except Exception as e:
         print(f"Error adding uploaded scraper: {e}")
+        registry.evict(filename[:-3])
         db.session.rollback()
         return False
 
@@ -256,8 +1105,10 @@ def update_last_checked(id):
     try:
         website = db.session.get(Website, id)
         if website:
-            website.last_checked = datetime.now()
+            mark_checked(website, datetime.now())
+            changes = {"last_checked": website.last_checked}
             db.session.commit()
+            notify_website_changed(website.id, "scrape", changes)
             return True
     except SQLAlchemyError as e:
         db.session.rollback()
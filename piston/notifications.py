@@ -0,0 +1,145 @@
+import time
+import queue
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+
+class NotificationQueue:
+    """Background sender for change notifications.
+
+    Messages queued within ``digest_window`` seconds of each other are
+    coalesced into one digest per recipient and sent over a single
+    authenticated SMTP connection that is kept open between batches (and
+    closed after ``idle_timeout`` seconds without mail). Failed deliveries
+    are retried with exponential backoff on the sender thread, never on the
+    scrape path.
+    """
+
+    def __init__(self, host, port, use_ssl, sender, password, recipients,
+                 digest_window=30, max_retries=5, retry_delay=2, idle_timeout=300):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.sender = sender
+        self.password = password
+        self.recipients = recipients
+        self.digest_window = digest_window
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue()
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, subject, body):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="piston-notifications", daemon=True)
+                self._thread.start()
+        self._queue.put((subject, body))
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        # Block until every queued message has been sent or given up on
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.idle_timeout)]
+            except queue.Empty:
+                self._disconnect()
+                continue
+
+            deadline = time.monotonic() + self.digest_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._deliver(batch)
+            except Exception as e:
+                print(f"Error sending email: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _deliver(self, batch):
+        subject, body = digest(batch)
+        for recipient in self.recipients:
+            msg = MIMEMultipart()
+            msg["From"] = self.sender
+            msg["To"] = recipient
+            msg["Subject"] = subject
+            msg.attach(MIMEText(body, "plain"))
+
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self._connection().send_message(msg)
+                    print(f"Email sent successfully to {recipient} ({len(batch)} updates)")
+                    break
+                except smtplib.SMTPAuthenticationError as e:
+                    print(f"SMTP Authentication Error: {e}")
+                    self._disconnect()
+                    break
+                except (smtplib.SMTPException, OSError) as e:
+                    print(f"Error sending email (attempt {attempt + 1}): {e}")
+                    self._disconnect()
+                    if attempt < self.max_retries:
+                        time.sleep(self.retry_delay * 2 ** attempt)
+
+    def _connection(self):
+        if self._server is None:
+            if self.use_ssl:
+                server = smtplib.SMTP_SSL(self.host, self.port)
+            else:
+                server = smtplib.SMTP(self.host, self.port)
+                server.ehlo()
+                if server.has_extn("starttls"):
+                    server.starttls()
+                    server.ehlo()
+            if self.password and server.has_extn("auth"):
+                server.login(self.sender, self.password)
+            self._server = server
+        return self._server
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+
+def digest(batch):
+    if len(batch) == 1:
+        return batch[0]
+    subject = f"{len(batch)} updates detected by piston"
+    body = "\n\n".join(f"== {item_subject} ==\n{item_body}" for item_subject, item_body in batch)
+    return subject, body
+
+
+def get_notification_queue(app):
+    if "piston_notifications" not in app.extensions:
+        app.extensions["piston_notifications"] = NotificationQueue(
+            host=app.config["SMTP_HOST"],
+            port=app.config["SMTP_PORT"],
+            use_ssl=app.config["SMTP_SSL"],
+            sender=app.config["EMAIL_ADDRESS"],
+            password=app.config["EMAIL_PASSWORD"],
+            recipients=[r.strip() for r in app.config["RECIPIENT_EMAIL"].split(",") if r.strip()],
+            digest_window=app.config["EMAIL_DIGEST_WINDOW"],
+            max_retries=app.config["EMAIL_MAX_RETRIES"],
+        )
+    return app.extensions["piston_notifications"]
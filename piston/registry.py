@@ -0,0 +1,98 @@
+import os
+import hashlib
+import importlib.util
+import threading
+
+PLUGINS_DIR = os.path.join(os.path.dirname(__file__), '..', "plugins")
+
+
+class PluginEntry:
+    def __init__(self, module, mtime_ns, size, digest):
+        self.module = module
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+
+
+class PluginRegistry:
+    """Process-wide cache of imported plugin modules.
+
+    A plugin is imported the first time it is needed and kept until its file
+    changes (mtime/size first, then content hash) or disappears.
+    """
+
+    def __init__(self, plugins_dir=PLUGINS_DIR):
+        self.plugins_dir = plugins_dir
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def path_for(self, plugin_name):
+        return os.path.join(self.plugins_dir, f"{plugin_name}.py")
+
+    def get(self, plugin_name):
+        path = self.path_for(plugin_name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.evict(plugin_name)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(plugin_name)
+            if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                return entry.module
+
+            with open(path, "rb") as f:
+                source = f.read()
+            digest = hashlib.sha256(source).hexdigest()
+
+            if entry and entry.digest == digest:
+                # Touched but not modified: keep the imported module
+                entry.mtime_ns, entry.size = stat.st_mtime_ns, stat.st_size
+                return entry.module
+
+            module = self._import(plugin_name, path)
+            self._entries[plugin_name] = PluginEntry(module, stat.st_mtime_ns, stat.st_size, digest)
+            return module
+
+    def load(self, plugin_name):
+        # Force a fresh import, e.g. after a plugin file was (re)uploaded
+        self.evict(plugin_name)
+        return self.get(plugin_name)
+
+    def evict(self, plugin_name):
+        with self._lock:
+            self._entries.pop(plugin_name, None)
+
+    def plugin_names(self):
+        return sorted(
+            filename[:-3]
+            for filename in os.listdir(self.plugins_dir)
+            if filename.endswith(".py") and not filename.startswith("__")
+        )
+
+    def load_all(self):
+        names = self.plugin_names()
+        with self._lock:
+            for stale in set(self._entries) - set(names):
+                del self._entries[stale]
+
+        plugins = {}
+        for plugin_name in names:
+            module = self.get(plugin_name)
+            if module is not None:
+                plugins[plugin_name] = module
+        return plugins
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _import(self, plugin_name, path):
+        spec = importlib.util.spec_from_file_location(plugin_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+
+registry = PluginRegistry()
@@ -1,36 +1,79 @@
 import os
-from datetime import datetime
-from flask import Blueprint, render_template, redirect, url_for, jsonify, request
+from datetime import datetime, timedelta
+from flask import Blueprint, render_template, redirect, url_for, jsonify, request, current_app
 from werkzeug.utils import secure_filename
+from piston import db, metrics
+from piston.events import get_event_broker, stream
+from piston.jobs import get_job_queue
 from piston.models import (
+    TREND_RESOLUTIONS,
     Website,
     get_websites,
-    update_website,
+    get_websites_snapshot,
     update_interval,
     add_custom_website,
     delete_custom_website,
     add_uploaded_scraper,
+    add_alert_rule,
+    delete_alert_rule,
+    get_alert_rules,
+    update_alert_rule,
+    pick_trend_resolution,
+    query_links,
+    query_trends,
 )
 
+LINKS_PAGE_SIZE = 50
+LINKS_MAX_PAGE_SIZE = 500
+
+TREND_FIELDS = {
+    "raw": ["t", "link_count", "new_links"],
+    "rollup": ["t", "link_count", "link_count_min", "link_count_max", "new_links", "samples"],
+}
+
 app = Blueprint("routes", __name__)
 
 
+@app.app_template_filter("duration")
+def duration(seconds):
+    # Effective 'auto' interval, as the dashboard's script.js formats it
+    if seconds is None:
+        return ""
+    if seconds < 3600:
+        return f"{round(seconds / 60)} min"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f}".rstrip("0").rstrip(".") + " h"
+    return f"{seconds / 86400:.1f}".rstrip("0").rstrip(".") + " j"
+
+
 @app.route("/")
 def index():
     websites = get_websites()
     return render_template("index.html", websites=websites)
 
 
-@app.route("/scrape/<path:id>")
+@app.route("/scrape/<int:id>", methods=["GET", "POST"])
 def scrape(id):
-    result = update_website(id)
-    return jsonify({"result": result})
+    # Queued: the fetch, the diff and the emails run off the request thread
+    if db.session.get(Website, id) is None:
+        return jsonify({"result": "Website not found"}), 404
+    job, created = get_job_queue(current_app._get_current_object()).submit(id)
+    response = jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "joined": not created or job.joined,
+        "status_url": url_for("routes.job_status", job_id=job.id),
+    })
+    response.status_code = 202
+    response.headers["Location"] = response.json["status_url"]
+    return response
 
-@app.route('/scrape/<id>')
-def update_website_route(id):
-    result = update_website(id)
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    return jsonify({"result": result, "last_checked": current_time})
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_job_queue(current_app).get(job_id)
+    if job is None:
+        return jsonify({"result": "Job not found"}), 404
+    return jsonify(job.to_dict())
 
 @app.route("/update_interval/<path:id>", methods=["POST"])
 def update(id):
@@ -83,5 +126,152 @@ def upload_scraper():
 
 @app.route('/fetch_updated_data')
 def fetch_updated_data():
-    updated_websites = get_websites()
-    return jsonify(updated_websites)
+    _, body, etag = get_websites_snapshot()
+    response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    # Let browsers revalidate every poll: unchanged snapshots answer 304
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+ALERT_RULE_FIELDS = {"name": str, "expression": str, "website_id": (int, type(None)), "active": bool}
+
+
+def alert_rule_fields(data):
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    for field, value in data.items():
+        if field not in ALERT_RULE_FIELDS:
+            raise ValueError(f"Unknown field {field}")
+        if not isinstance(value, ALERT_RULE_FIELDS[field]) or (field == "website_id" and isinstance(value, bool)):
+            raise ValueError(f"Invalid {field}")
+    return data
+
+@app.route('/api/alert_rules', methods=["GET", "POST"])
+def alert_rules():
+    if request.method == "GET":
+        return jsonify({"rules": get_alert_rules()})
+    try:
+        fields = alert_rule_fields(request.get_json(silent=True))
+        rule = add_alert_rule(fields.get("name"), fields.get("expression"), fields.get("website_id"),
+                              fields.get("active", True))
+    except ValueError as e:
+        return jsonify({"result": str(e)}), 400
+    return jsonify(rule.to_dict()), 201
+
+@app.route('/api/alert_rules/<int:id>', methods=["PATCH", "DELETE"])
+def alert_rule(id):
+    if request.method == "DELETE":
+        if not delete_alert_rule(id):
+            return jsonify({"result": "Alert rule not found"}), 404
+        return jsonify({"result": "Alert rule deleted"})
+    try:
+        rule = update_alert_rule(id, **alert_rule_fields(request.get_json(silent=True)))
+    except ValueError as e:
+        return jsonify({"result": str(e)}), 400
+    if rule is None:
+        return jsonify({"result": "Alert rule not found"}), 404
+    return jsonify(rule.to_dict())
+
+@app.route('/api/links')
+def links():
+    # Stored links in insertion order, optionally for one ?website_id and
+    # matching ?q; pass next_cursor back as ?after for the following page
+    try:
+        website_id, after = (
+            int(request.args[name]) if name in request.args else None for name in ("website_id", "after")
+        )
+        limit = min(int(request.args.get("limit", LINKS_PAGE_SIZE)), LINKS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"result": "Invalid website_id, after or limit"}), 400
+    if limit < 1:
+        return jsonify({"result": "limit must be positive"}), 400
+
+    rows, next_cursor = query_links(website_id, after, limit, request.args.get("q"))
+    next_url = None
+    if next_cursor is not None:
+        next_url = url_for("routes.links", **dict(request.args.items(), after=next_cursor))
+    return jsonify({"links": rows, "next_cursor": next_cursor, "next": next_url})
+
+def parse_local_datetime(value):
+    # Stored times are naive local time: convert ones given with an offset
+    # (e.g. a trailing Z) rather than comparing aware with naive
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+@app.route('/api/trends')
+def trends():
+    # Link-count series for every website, or those given as ?website_id=1,2;
+    # start and end are ISO datetimes, the default range is the last 7 days
+    now = datetime.now()
+    try:
+        end = parse_local_datetime(request.args["end"]) if "end" in request.args else now
+        start = parse_local_datetime(request.args["start"]) if "start" in request.args else end - timedelta(days=7)
+        website_ids = [
+            int(website_id)
+            for value in request.args.getlist("website_id")
+            for website_id in value.split(",")
+            if website_id
+        ]
+    except ValueError:
+        return jsonify({"result": "Invalid start, end or website_id"}), 400
+    if start > end:
+        return jsonify({"result": "start must be before end"}), 400
+
+    resolution = request.args.get("resolution", "auto")
+    if resolution == "auto":
+        resolution = pick_trend_resolution(
+            start,
+            end,
+            now,
+            current_app.config["LINK_HISTORY_RAW_DAYS"],
+            current_app.config["LINK_HISTORY_HOURLY_DAYS"],
+            series=len(website_ids) or Website.query.count(),
+        )
+    elif resolution not in TREND_RESOLUTIONS:
+        return jsonify({"result": f"resolution must be auto or one of {', '.join(TREND_RESOLUTIONS)}"}), 400
+
+    series = query_trends(start, end, resolution, website_ids)
+    return jsonify({
+        "resolution": resolution,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        # Points are arrays in this order, t in Unix seconds
+        "fields": TREND_FIELDS["raw" if resolution == "raw" else "rollup"],
+        "series": {
+            str(website_id): [[int(at.timestamp()), *values] for at, *values in points]
+            for website_id, points in series.items()
+        },
+    })
+
+@app.route('/events')
+def events():
+    # Server-Sent Events: one small delta per committed website change. Each
+    # open stream holds a server thread, so their number is capped and each
+    # one is closed after a while for the browser to reconnect.
+    broker = get_event_broker(current_app)
+    if broker.subscribers() >= current_app.config["EVENTS_MAX_STREAMS"]:
+        return jsonify({"result": "Too many open event streams"}), 503, {"Retry-After": "30"}
+    version = None
+    if "piston_scheduler" not in current_app.extensions:
+        # Scrapes run in worker processes: notice them through the data
+        flask_app = current_app._get_current_object()
+
+        def version():
+            with flask_app.app_context():
+                return get_websites_snapshot()[2]
+
+    response = current_app.response_class(
+        stream(broker.subscribe(), broker, version=version, max_age=current_app.config["EVENTS_STREAM_SECONDS"]),
+        mimetype="text/event-stream",
+    )
+    response.cache_control.no_cache = True
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route('/metrics')
+def metrics_route():
+    # Prometheus text exposition format. Scrape metrics are only filled in
+    # where scrapes run: the embedded scheduler, or each worker's own endpoint
+    return current_app.response_class(metrics.collect(current_app), mimetype=metrics.CONTENT_TYPE)
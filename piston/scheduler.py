@@ -1,72 +1,235 @@
+import time
+import threading
 from datetime import datetime, timedelta
-from piston.models import Website, update_website, db
-
-SCRAPE_INTERVALS = {
-    'never': timedelta(days=9999),  # effectively never
-    '5min': timedelta(minutes=5),
-    '30min': timedelta(minutes=30),
-    '1hour': timedelta(hours=1),
-    '2hours': timedelta(hours=2),
-    '12hours': timedelta(hours=12),
-    '1day': timedelta(days=1),
-    '1week': timedelta(weeks=1)
-}
-
-def init_scheduler(app, scheduler):
-    @scheduler.task('interval', id='check_all_updates', seconds=30)
-    def scheduled_check_all_updates():
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from piston import metrics
+from piston.models import (
+    CommitBatch,
+    apply_scrape_result,
+    claim_due_websites,
+    flush_scrape_runs,
+    get_next_due_at,
+    get_validators,
+    leased_to,
+    mark_checked,
+    next_due,
+    prune_link_history,
+    prune_scrape_runs,
+    release_lease,
+    renew_leases,
+    schedule_unscheduled_websites,
+    db,
+)
+from piston.executor import get_executor
+from piston.signals import website_changed
+
+JOB_ID = 'check_due_websites'
+PRUNE_EVERY = timedelta(hours=1)
+
+
+def init_scheduler(app, scheduler, poll=None):
+    # Instead of polling every website on a fixed tick, keep a single one-shot
+    # job armed for the earliest next_due_at and re-arm it after every run and
+    # whenever a website's schedule changes. Schedules changed by another
+    # process send no signal here: ``poll`` caps how long the job sleeps
+    # before looking at the database again.
+    def scheduled_check_due_websites():
         with app.app_context():
-            check_all_websites()
+            try:
+                check_all_websites()
+            finally:
+                schedule_next_check(app, scheduler)
+
+    def on_website_changed(sender, reason, **kwargs):
+        if reason in ("interval", "added", "deleted"):
+            schedule_next_check(app, scheduler)
+
+    app.extensions["piston_scheduler"] = (scheduler, scheduled_check_due_websites, poll)
+    website_changed.connect(on_website_changed, sender=app, weak=False)
+
+    with app.app_context():
+        schedule_unscheduled_websites()
+    schedule_next_check(app, scheduler)
+
+def schedule_next_check(app, scheduler):
+    _, job, poll = app.extensions["piston_scheduler"]
+    with app.app_context():
+        next_due_at = get_next_due_at()
+        db.session.remove()
+
+    now = datetime.now()
+    if poll:
+        latest = now + timedelta(seconds=poll)
+        next_due_at = min(next_due_at, latest) if next_due_at else latest
+    if next_due_at is None:
+        if scheduler.get_job(JOB_ID):
+            scheduler.remove_job(JOB_ID)
+        return None
+
+    run_date = max(next_due_at, now)
+    scheduler.add_job(
+        id=JOB_ID,
+        func=job,
+        trigger='date',
+        run_date=run_date,
+        replace_existing=True,
+        misfire_grace_time=None,
+    )
+    return run_date
+
+class LeaseKeeper(threading.Thread):
+    """Renews this worker's leases on the websites it is scraping.
+
+    Leases are renewed every third of their duration, so they only expire
+    when the worker stops renewing them: it died or lost the database.
+    """
+
+    def __init__(self, app, owner, lease_seconds):
+        super().__init__(name="piston-leases", daemon=True)
+        self.app = app
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.held = []
+        self._stopped = threading.Event()
+
+    def hold(self, website_ids):
+        self.held = list(website_ids)
+
+    def run(self):
+        while not self._stopped.wait(self.lease_seconds / 3):
+            held = self.held
+            if not held:
+                continue
+            try:
+                with self.app.app_context():
+                    renew_leases(self.owner, held, datetime.now(), self.lease_seconds)
+            except SQLAlchemyError as e:
+                print(f"Could not renew the leases of {len(held)} websites: {e}")
+
+    def stop(self):
+        self._stopped.set()
+
 
 def check_all_websites():
+    # Due websites are claimed in batches through leases, so that several
+    # workers sharing the database split them rather than each scraping all
+    started = time.monotonic()
     now = datetime.now()
-    websites = Website.query.all()
-    
-    for website in websites:
-        if should_scrape(website, now):
-            if isinstance(website, Website):
-                print(f"{now} - Updating {website.name} ({website.scraping_type} - {website.scrape_interval})")
-                update_website(website)
-
-            website.last_checked = now
-            db.session.commit()
-            
-    # Fetch updated data and update the frontend
-    fetch_updated_data()
-
-def should_scrape(website, now):
-    if website.last_checked is None:
-        return True
-    
-    interval = website.scrape_interval
-    return SCRAPE_INTERVALS.get(interval, timedelta(days=9999)) <= (now - website.last_checked)
-
-def should_scrape(website, now):
-    if website.last_checked is None:
-        return True
-    
-    interval = website.scrape_interval
-
-    if interval == 'never':
-        return False
-    elif interval == 'daily':
-        return (now - website.last_checked) > timedelta(days=1)
-    elif interval == 'hourly':
-        return (now - website.last_checked) > timedelta(hours=1)
-    elif interval == '5min':
-        return (now - website.last_checked) > timedelta(minutes=5)
-    
-    return False
-
-def fetch_updated_data():
-    updated_websites = Website.query.all()
-    updated_data = []
-    for website in updated_websites:
-        updated_data.append({
-            'id': website.id,
-            'name': website.name,
-            'url': website.url,
-            'last_checked': website.last_checked.strftime('%Y-%m-%d %H:%M:%S') if website.last_checked else None,
-        })
-    
-    return updated_data
+    owner = current_app.config["WORKER_ID"]
+    lease_seconds = current_app.config["SCRAPE_LEASE_SECONDS"]
+    claim_batch = current_app.config["SCRAPE_CLAIM_BATCH"]
+    report = {
+        "ran": 0,
+        "skipped": 0,
+        "failed": 0,
+        "timed_out": 0,
+        "lost": 0,
+    }
+
+    keeper = LeaseKeeper(current_app._get_current_object(), owner, lease_seconds)
+    keeper.start()
+    claimed = 0
+    try:
+        while True:
+            # Leases run from the claim, not from the start of the run
+            claimed_at = datetime.now()
+            due = {
+                website.id: website
+                for website in claim_due_websites(owner, claimed_at, lease_seconds, claim_batch)
+            }
+            if not due:
+                break
+            if not claimed:
+                # Sites come back ordered by next_due_at: the first one waited longest
+                metrics.scheduler_lag.set(max((now - next(iter(due.values())).next_due_at).total_seconds(), 0))
+            claimed += len(due)
+            keeper.hold(due)
+            run_claimed(due, now, report)
+            if len(due) < claim_batch:
+                break
+    finally:
+        keeper.stop()
+
+    flush_scrape_runs()
+    last_pruned = current_app.extensions.get("piston_scrape_runs_pruned")
+    if last_pruned is None or now - last_pruned >= PRUNE_EVERY:
+        prune_scrape_runs(now - timedelta(days=current_app.config["SCRAPE_RUNS_RETENTION_DAYS"]))
+        prune_link_history(
+            now,
+            current_app.config["LINK_HISTORY_RAW_DAYS"],
+            current_app.config["LINK_HISTORY_HOURLY_DAYS"],
+            current_app.config["LINK_HISTORY_DAILY_DAYS"],
+        )
+        current_app.extensions["piston_scrape_runs_pruned"] = now
+
+    report["wall_time"] = round(time.monotonic() - started, 3)
+    if claimed:
+        metrics.tick_duration.observe(report["wall_time"])
+        print(
+            f"{now} - Tick: {report['ran']} ran, {report['skipped']} skipped, "
+            f"{report['failed']} failed, {report['timed_out']} timed out, "
+            f"{report['lost']} lost in {report['wall_time']}s"
+        )
+
+    return report
+
+def run_claimed(due, now, report):
+    validators = get_validators([website.id for website in due.values() if website.scraping_type == 'hash'])
+    jobs = [
+        (website.id, website.url, website.plugin_name, validators.get(website.id))
+        for website in due.values()
+    ]
+    # Results are written in batches: one short transaction per batch rather
+    # than a commit per site, and no write lock held while fetches are running
+    pending = []
+    flushed = time.monotonic()
+    for website_id, status, scrape_result, timing in get_executor(current_app).run(jobs):
+        pending.append((due[website_id], status, scrape_result, timing))
+        if (
+            len(pending) >= current_app.config["SCRAPE_COMMIT_BATCH"]
+            or time.monotonic() - flushed >= current_app.config["SCRAPE_COMMIT_INTERVAL"]
+        ):
+            write_results(pending, now, report)
+            pending, flushed = [], time.monotonic()
+    write_results(pending, now, report)
+
+def write_results(results, now, report):
+    batch = CommitBatch()
+    # A lease that expired and was claimed by another worker: its result
+    # is theirs to write
+    owned = leased_to(current_app.config["WORKER_ID"], [website.id for website, *_ in results])
+    for website, status, scrape_result, timing in results:
+        if website.id not in owned:
+            print(f"{now} - Lease on {website.name} lost: dropping its result")
+            report["lost"] += 1
+            continue
+        release_lease(website)
+        if status == "ok":
+            print(f"{now} - Updating {website.name} ({website.scraping_type} - {website.scrape_interval})")
+            report["ran"] += 1
+            if scrape_result:
+                apply_scrape_result(website, scrape_result, timing, batch=batch)
+                continue
+            run = {
+                "outcome": "failed",
+                "started_at": now,
+                "phases": {"fetch": timing["fetch"], "parse": timing["parse"]},
+                "bytes_fetched": timing["bytes"],
+            }
+        elif status == "skipped":
+            # Still being fetched by an earlier run: try again next interval
+            report["skipped"] += 1
+            website.next_due_at = next_due(website, now)
+            batch.add(website, run={"outcome": "skipped", "started_at": now}, changes={"outcome": "skipped"})
+            continue
+        elif status == "timeout":
+            report["timed_out"] += 1
+            run = {"outcome": "timeout", "started_at": now}
+        else:
+            report["failed"] += 1
+            run = {"outcome": "failed", "started_at": now}
+
+        mark_checked(website, now)
+        batch.add(website, run=run, changes={"outcome": run["outcome"]})
+    batch.commit()
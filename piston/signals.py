@@ -0,0 +1,13 @@
+from blinker import Namespace
+
+_signals = Namespace()
+
+# Sent with the Flask app as sender after a commit that changes what the
+# dashboard shows. Keyword arguments: website_id, reason ("scrape",
+# "interval", "added" or "deleted") and changes, the dashboard fields that
+# changed (the whole row for "added").
+website_changed = _signals.signal("website-changed")
+
+# Sent with the Flask app as sender after alert rules are added, changed or
+# deleted. Keyword argument: rule_id.
+alert_rules_changed = _signals.signal("alert-rules-changed")
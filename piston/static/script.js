@@ -1,6 +1,7 @@
 // Configuration
 const CONFIG = {
-    RELOAD_DELAY: 2000,
+    EVENTS_URL: '/events',
+    JOB_POLL_DELAY: 1000,
     TOASTR_OPTIONS: {
       closeButton: true,
       debug: false,
@@ -26,11 +27,10 @@ const CONFIG = {
     customWebsiteName: () => document.getElementById('customWebsiteName'),
     customWebsiteUrl: () => document.getElementById('customWebsiteUrl'),
     deleteWebsiteButtons: () => document.querySelectorAll('.delete-website-btn'),
-    manualScrapeButtons: () => document.querySelectorAll('.manual-scrape-btn'),
-    intervalSelects: () => document.querySelectorAll('.interval-select'),
     searchInput: () => document.getElementById('search'),
     filterSelect: () => document.getElementById('filter'),
-    jobTableBody: () => document.getElementById('jobTable').getElementsByTagName('tbody')[0]
+    jobTableBody: () => document.getElementById('jobTable').getElementsByTagName('tbody')[0],
+    row: (id) => document.querySelector(`tr[data-website-id="${id}"]`)
   };
   
   // API Endpoints
@@ -38,20 +38,23 @@ const CONFIG = {
     ADD_CUSTOM_WEBSITE: '/add_custom_website',
     DELETE_CUSTOM_WEBSITE: (id) => `/delete_custom_website/${id}`,
     UPDATE_WEBSITE: (id) => `/scrape/${id}`,
+    JOB_STATUS: (jobId) => `/jobs/${jobId}`,
     UPDATE_INTERVAL: (id) => `/update_interval/${id}`,
-    UPLOAD_SCRAPER: '/upload_scraper'
+    UPLOAD_SCRAPER: '/upload_scraper',
+    FETCH_UPDATED_DATA: '/fetch_updated_data'
   };
   
   // Utility Functions
   const utils = {
-    reloadPage: () => setTimeout(() => location.reload(), CONFIG.RELOAD_DELAY),
     showError: (message) => {
       console.error('Error:', message);
       toastr.error(message);
-    }
+    },
+    escape: (value) => String(value ?? '').replace(/[&<>"']/g, c => `&#${c.charCodeAt(0)};`)
   };
   
-  // API Functions
+  // API Functions. The table itself is patched from the /events stream, so
+  // these only report the result.
   const api = {
     addCustomWebsite: async (name, url) => {
       try {
@@ -62,7 +65,6 @@ const CONFIG = {
         });
         const data = await response.json();
         toastr.success(data.result);
-        utils.reloadPage();
       } catch (error) {
         utils.showError('Une erreur est survenue lors de l\'ajout du site.');
       }
@@ -73,18 +75,31 @@ const CONFIG = {
         const response = await fetch(API.DELETE_CUSTOM_WEBSITE(id), { method: 'DELETE' });
         const data = await response.json();
         toastr.success(data.result);
-        utils.reloadPage();
       } catch (error) {
         utils.showError('Une erreur est survenue lors de la suppression du site.');
       }
     },
   
+    // Returns 202 with a job: poll it for the result, the row itself is
+    // patched by the scrape event
     manualScrape: async (id) => {
       try {
-        const response = await fetch(API.UPDATE_WEBSITE(id));
-        const data = await response.json();
-        toastr.success(data.result);
-        utils.reloadPage();
+        const response = await fetch(API.UPDATE_WEBSITE(id), { method: 'POST' });
+        let job = await response.json();
+        if (!response.ok) {
+          utils.showError(job.result);
+          return;
+        }
+        toastr.info(job.joined ? 'Scan déjà en cours...' : 'Scan lancé...');
+        while (job.status === 'queued' || job.status === 'running') {
+          await new Promise(resolve => setTimeout(resolve, CONFIG.JOB_POLL_DELAY));
+          job = await (await fetch(API.JOB_STATUS(job.id || job.job_id))).json();
+        }
+        if (job.status === 'done') {
+          toastr.success(job.result);
+        } else {
+          utils.showError(job.result);
+        }
       } catch (error) {
         utils.showError('Une erreur est survenue lors du scan.');
       }
@@ -99,32 +114,14 @@ const CONFIG = {
         });
         const data = await response.json();
         toastr.success(data.result);
-        utils.reloadPage();
       } catch (error) {
         utils.showError('Une erreur est survenue lors de la mise à jour de l\'intervalle.');
       }
     },
-    manualScrape: async (id) => {
-      try {
-        const response = await fetch(API.UPDATE_WEBSITE(id));
-        const data = await response.json();
-        toastr.success(data.result);
-        
-        // Update the "Dernière vérification" field in the table
-        const row = document.querySelector(`tr[data-website-id="${id}"]`);
-        if (row) {
-          const lastCheckedCell = row.querySelector('td[data-label="Dernière Vérification"]');
-          if (lastCheckedCell) {
-            lastCheckedCell.textContent = data.last_checked;
-          }
-        }
-      } catch (error) {
-        utils.showError('Une erreur est survenue lors du scan.');
-      }
-    },
+
     fetchUpdatedData: async () => {
       try {
-        const response = await fetch('/fetch_updated_data');
+        const response = await fetch(API.FETCH_UPDATED_DATA);
         const data = await response.json();
         return data;
       } catch (error) {
@@ -141,20 +138,23 @@ const CONFIG = {
       const url = DOM.customWebsiteUrl().value;
       api.addCustomWebsite(name, url);
     },
-  
-    deleteCustomWebsite: (event) => {
-      const id = event.target.closest('tr').dataset.websiteId;
-      api.deleteCustomWebsite(id);
-    },
-  
-    manualScrape: (event) => {
-      const id = event.target.closest('tr').dataset.websiteId;
-      api.manualScrape(id);
+
+    // Rows come and go with server events, so row buttons are handled by
+    // delegation from the table body
+    tableClick: (event) => {
+      const row = event.target.closest('tr');
+      if (!row) return;
+      if (event.target.closest('.manual-scrape-btn')) {
+        api.manualScrape(row.dataset.websiteId);
+      } else if (event.target.closest('.delete-website-btn')) {
+        api.deleteCustomWebsite(row.dataset.websiteId);
+      }
     },
-  
-    updateInterval: (event) => {
-      const id = event.target.closest('tr').dataset.websiteId;
-      api.updateInterval(id, event.target.value);
+
+    tableChange: (event) => {
+      if (event.target.classList.contains('interval-select')) {
+        api.updateInterval(event.target.closest('tr').dataset.websiteId, event.target.value);
+      }
     },
   
     filterTable: () => {
@@ -191,7 +191,6 @@ const CONFIG = {
         const data = await response.json();
         if (response.ok) {
           toastr.success(data.message);
-          utils.reloadPage();
         } else {
           toastr.error(data.message);
         }
@@ -199,23 +198,83 @@ const CONFIG = {
         utils.showError('An error occurred while uploading the scraper.');
       }
     },
-    manualScrape: async (event) => {
-      const id = event.target.closest('tr').dataset.websiteId;
-      api.manualScrape(id).then(() => {
-        api.fetchUpdatedData().then(data => {
-          updateTable(data);
-        });
-      });
+  };
+
+  // Server-Sent Events: each event carries only the fields that changed
+  const live = {
+    patchRow: (change) => {
+      const row = DOM.row(change.id);
+      if (!row) return;
+      if ('last_checked' in change) {
+        row.querySelector('td[data-label="Dernière Vérification"]').textContent =
+          change.last_checked || 'Pas encore vérifié';
+      }
+      if ('last_link_count' in change && row.dataset.scrapingType !== 'hash') {
+        row.querySelector('td[data-label="Nombre d\'Offres"]').textContent =
+          change.last_link_count || 'Pas encore vérifié';
+      }
+      if ('scrape_interval' in change) {
+        row.querySelector('.interval-select').value = change.scrape_interval;
+      }
+      if ('scrape_interval' in change || 'effective_interval' in change) {
+        const label = row.querySelector('.effective-interval');
+        if ('effective_interval' in change) label.dataset.seconds = change.effective_interval;
+        if ('fetches_saved' in change) label.dataset.saved = change.fetches_saved;
+        const auto = row.querySelector('.interval-select').value === 'auto';
+        label.hidden = !auto;
+        label.textContent = auto ? effectiveIntervalLabel(label.dataset.seconds, label.dataset.saved) : '';
+      }
     },
+
+    addRow: (website) => {
+      if (DOM.row(website.id)) return;
+      DOM.jobTableBody().insertAdjacentHTML('beforeend', renderRow(website));
+      setTheme(localStorage.getItem('darkMode') !== 'false');
+      handlers.filterTable();
+    },
+
+    removeRow: (change) => {
+      const row = DOM.row(change.id);
+      if (row) row.remove();
+    },
+
+    // Missed events (reconnect, or a backlog the server dropped): reload the
+    // data, not the page
+    resync: async () => {
+      const data = await api.fetchUpdatedData();
+      if (data) updateTable(data);
+    },
+
+    connect: () => {
+      if (!window.EventSource) return;
+      const source = new EventSource(CONFIG.EVENTS_URL);
+      let dropped = false;
+      const on = (name, apply) => source.addEventListener(name, (event) => apply(JSON.parse(event.data)));
+      on('scrape', live.patchRow);
+      on('interval', live.patchRow);
+      on('added', live.addRow);
+      on('deleted', live.removeRow);
+      on('resync', live.resync);
+      source.addEventListener('error', () => {
+        dropped = true;
+        // Refused (e.g. too many open streams): the browser gives up, so retry later
+        if (source.readyState === EventSource.CLOSED) {
+          setTimeout(() => { live.connect(); live.resync(); }, 30000);
+        }
+      });
+      source.addEventListener('open', () => {
+        if (dropped) live.resync();
+        dropped = false;
+      });
+    }
   };
   
   // Initialize
   const init = () => {
     // Set up event listeners
     DOM.addCustomWebsiteForm().addEventListener('submit', handlers.addCustomWebsite);
-    DOM.deleteWebsiteButtons().forEach(button => button.addEventListener('click', handlers.deleteCustomWebsite));
-    DOM.manualScrapeButtons().forEach(button => button.addEventListener('click', handlers.manualScrape));
-    DOM.intervalSelects().forEach(select => select.addEventListener('change', handlers.updateInterval));
+    DOM.jobTableBody().addEventListener('click', handlers.tableClick);
+    DOM.jobTableBody().addEventListener('change', handlers.tableChange);
     DOM.searchInput().addEventListener('input', handlers.filterTable);
     DOM.filterSelect().addEventListener('change', handlers.filterTable);
     document.getElementById('uploadScraperForm').addEventListener('submit', handlers.uploadScraper);
@@ -225,6 +284,8 @@ const CONFIG = {
   
     // Initial update of delete buttons
     handlers.updateDeleteButtons();
+
+    live.connect();
   };
   
   // Run initialization when DOM is loaded
@@ -268,54 +329,71 @@ if (modeToggle) {
 // Call setTheme on page load to ensure correct initial state
 document.addEventListener('DOMContentLoaded', () => setTheme(defaultDark));
 
-function updateTable(data) {
-  const tableBody = DOM.jobTableBody();
-  tableBody.innerHTML = '';
+const INTERVAL_OPTIONS = [
+  { value: 'never', label: 'Jamais' },
+  { value: 'auto', label: 'Auto' },
+  { value: '5min', label: '5 minutes' },
+  { value: '30min', label: '30 minutes' },
+  { value: '1hour', label: '1 heure' },
+  { value: '2hours', label: '2 heures' },
+  { value: '12hours', label: '12 heures' },
+  { value: '1day', label: '1 jour' },
+  { value: '1week', label: '1 semaine' }
+];
 
-  const rows = data.map(website => {
-    const intervalOptions = [
-      { value: 'never', label: 'Jamais' },
-      { value: '5min', label: '5 minutes' },
-      { value: '30min', label: '30 minutes' },
-      { value: '1hour', label: '1 heure' },
-      { value: '2hours', label: '2 heures' },
-      { value: '12hours', label: '12 heures' },
-      { value: '1day', label: '1 jour' },
-      { value: '1week', label: '1 semaine' }
-    ];
+// Same format as the "duration" template filter
+function formatDuration(seconds) {
+  if (seconds < 3600) return `${Math.round(seconds / 60)} min`;
+  if (seconds < 86400) return `${parseFloat((seconds / 3600).toFixed(1))} h`;
+  return `${parseFloat((seconds / 86400).toFixed(1))} j`;
+}
 
-    const intervalSelectOptions = intervalOptions
-      .map(option => `<option value="${option.value}" ${website.scrape_interval === option.value ? 'selected' : ''}>${option.label}</option>`)
-      .join('');
+function effectiveIntervalLabel(seconds, saved) {
+  return `≈ ${formatDuration(Number(seconds))}, ${Number(saved) || 0} scans évités`;
+}
 
-    return `
-      <tr data-website-id="${website.id}" class="dark-mode">
-        <td data-label="Nom du Site">${website.name}</td>
-        <td data-label="URL">${website.url}</td>
-        <td data-label="ID du site" class="type-column">
-          ${website.id}
-        </td>
-        <td data-label="Méthode de Parsing" class="parsing-method-column">
-          ${website.scraping_type == 'links' ? 'Parser spécifique' : 'Changement de hash'}
-        </td>
-        <td data-label="Nombre d'Offres">
-          ${website.scraping_type == 'hash' ? '/' : website.last_link_count || 'Pas encore vérifié'}</td>
-        <td data-label="Dernière Vérification">
-          ${website.last_checked || 'Pas encore vérifié'}</td>
-        <td data-label="Intervalle de Scan">
-          <select class="interval-select">
-            ${intervalSelectOptions}
-          </select>
-        </td>
-        <td data-label="Actions">
-          <div class="action-buttons">
-            <button class="manual-scrape-btn">Scanner Maintenant</button>
-            <button class="delete-website-btn">Supprimer</button>
-          </div>
-        </td>
-      </tr>
-    `;
-  }).join('');
-  
-  tableBody.innerHTML = rows;
+function renderRow(website) {
+  const e = utils.escape;
+  const intervalSelectOptions = INTERVAL_OPTIONS
+    .map(option => `<option value="${option.value}" ${website.scrape_interval === option.value ? 'selected' : ''}>${option.label}</option>`)
+    .join('');
+  const auto = website.scrape_interval === 'auto';
+
+  return `
+    <tr data-website-id="${e(website.id)}" data-scraping-type="${e(website.scraping_type)}" class="dark-mode">
+      <td data-label="Nom du Site">${e(website.name)}</td>
+      <td data-label="URL">${e(website.url)}</td>
+      <td data-label="ID du site" class="type-column">
+        ${e(website.id)}
+      </td>
+      <td data-label="Méthode de Parsing" class="parsing-method-column">
+        ${website.scraping_type == 'links' ? 'Parser spécifique' : 'Changement de hash'}
+      </td>
+      <td data-label="Nombre d'Offres">
+        ${website.scraping_type == 'hash' ? '/' : e(website.last_link_count) || 'Pas encore vérifié'}</td>
+      <td data-label="Dernière Vérification">
+        ${e(website.last_checked) || 'Pas encore vérifié'}</td>
+      <td data-label="Intervalle de Scan">
+        <select class="interval-select">
+          ${intervalSelectOptions}
+        </select>
+        <small class="effective-interval" data-seconds="${e(website.effective_interval)}"
+          data-saved="${e(website.fetches_saved)}" ${auto ? '' : 'hidden'}>
+          ${auto ? effectiveIntervalLabel(website.effective_interval, website.fetches_saved) : ''}
+        </small>
+      </td>
+      <td data-label="Actions">
+        <div class="action-buttons">
+          <button class="manual-scrape-btn">Scanner Maintenant</button>
+          <button class="delete-website-btn">Supprimer</button>
+        </div>
+      </td>
+    </tr>
+  `;
+}
+
+function updateTable(data) {
+  DOM.jobTableBody().innerHTML = data.map(renderRow).join('');
+  setTheme(localStorage.getItem('darkMode') !== 'false');
+  handlers.filterTable();
 }
@@ -0,0 +1,84 @@
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+# pg_advisory_lock key held while a process creates the schema and seeds it
+SETUP_LOCK_KEY = 0x70697374
+
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return (
+        url.get_backend_name() == "sqlite"
+        and url.database not in (None, "", ":memory:")
+        and url.query.get("mode") != "memory"
+    )
+
+
+def engine_options(config):
+    """Pool settings for a file-backed SQLite database.
+
+    The scheduler thread and every request thread hold their own connection;
+    in-memory databases keep Flask-SQLAlchemy's single shared connection.
+    """
+    if not is_sqlite_file(config["SQLALCHEMY_DATABASE_URI"]):
+        return {}
+    return {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_POOL_SIZE"] * 2,
+        "pool_timeout": config["SQLITE_BUSY_TIMEOUT"],
+        "connect_args": {"check_same_thread": False},
+    }
+
+
+def configure_sqlite(engine, wal=True, busy_timeout=5, synchronous="NORMAL"):
+    # journal_mode is stored in the database file; the other pragmas are per
+    # connection, so all of them are applied whenever the pool connects
+    synchronous = synchronous.upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(sorted(SYNCHRONOUS_MODES))}")
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if wal:
+            # WAL lets the dashboard read while the scheduler writes
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.close()
+
+
+@contextmanager
+def setup_lock(engine):
+    """Hold a lock shared by every process using ``engine``'s database.
+
+    Schema creation and seeding check then write, so web and worker
+    processes starting together against a new database take turns. Uses an
+    advisory lock on PostgreSQL and a lock file next to a SQLite database
+    file; other databases are not locked.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as connection:
+            connection.exec_driver_sql(f"SELECT pg_advisory_lock({SETUP_LOCK_KEY})")
+            try:
+                yield
+            finally:
+                connection.exec_driver_sql(f"SELECT pg_advisory_unlock({SETUP_LOCK_KEY})")
+    elif fcntl is not None and is_sqlite_file(str(engine.url)):
+        with open(f"{os.path.abspath(engine.url.database)}.setup-lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        yield
@@ -0,0 +1,65 @@
+import hashlib
+from fnmatch import fnmatchcase
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+settings = {
+    # Query parameters dropped from links; * matches any suffix
+    "tracking_params": (
+        "utm_*", "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_hsenc", "_hsmi",
+        "igshid", "yclid", "ref", "refid", "ref_src", "trk", "trkinfo", "trackingid",
+    ),
+}
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def configure(**options):
+    settings.update({key: value for key, value in options.items() if value is not None})
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return any(fnmatchcase(name, pattern.lower()) for pattern in settings["tracking_params"])
+
+
+def canonicalize(href, base_url=None):
+    """Absolute, normalized form of a link as found on ``base_url``.
+
+    Relative links are resolved, the scheme and host are lower-cased, default
+    ports, fragments and tracking parameters are dropped, the remaining
+    query parameters are sorted, so the spellings of a posting's URL seen in
+    practice map to the same string. Links that aren't http(s) URLs are
+    returned resolved but otherwise unchanged.
+    """
+    url = href.strip()
+    try:
+        url = urljoin(base_url, url) if base_url else url
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+    if port and port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+    if parts.username:
+        credentials = parts.username + (f":{parts.password}" if parts.password else "")
+        host = f"{credentials}@{host}"
+
+    path = parts.path or "/"
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not is_tracking_param(name)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def url_hash(url):
+    # Signed 64-bit digest, stored in an indexed BIGINT column
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), "big", signed=True)
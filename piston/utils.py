@@ -1,11 +1,12 @@
-import os
-import importlib
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import time
+import inspect
 from datetime import datetime
 from flask import current_app
 
+from piston import http_client, isolation
+from piston.registry import registry
+from piston.notifications import get_notification_queue
+
 def adapt_datetime(dt):
     return dt.isoformat()
 
@@ -15,48 +16,58 @@ def convert_datetime(dt_str):
 
 
 def load_plugins():
-    plugins = {}
-    websites_data = []
-    plugins_dir = os.path.join(os.path.dirname(__file__), '..', "plugins")
-    
-    for filename in os.listdir(plugins_dir):
-        if filename.endswith(".py") and not filename.startswith("__"):
-            plugin_name = filename[:-3]
-            spec = importlib.util.spec_from_file_location(plugin_name, os.path.join(plugins_dir, filename))
-            plugin = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(plugin)
-            
-            plugins[plugin_name] = plugin
-            websites_data.append((plugin.WEBSITE_NAME, plugin.WEBSITE_URL, plugin_name))
-    
+    # Plugins are read from the manifest, not imported: the registry imports
+    # each one the first time it scrapes
+    from piston.manifest import manifest
+
+    plugins = manifest.load()
+    websites_data = [
+        (entry["name"], entry["url"], plugin_name)
+        for plugin_name, entry in plugins.items()
+    ]
+
     return plugins, websites_data
 
 
-def scrape_website(url, plugin_name):
-    plugins, _ = load_plugins()
-    if plugin_name in plugins:
-        return plugins[plugin_name].scrape(url)
+def accepts_argument(func, name):
+    parameters = inspect.signature(func).parameters
+    return name in parameters or any(p.kind == p.VAR_KEYWORD for p in parameters.values())
+
+
+def scrape_website(url, plugin_name, validators=None):
+    pool = isolation.get_pool()
+    if pool is not None:
+        scrape_result, timing = pool.scrape(url, plugin_name, validators)
+        # Count the worker's network time as this thread's, for run_timed
+        http_client.record(timing["fetch"], timing["bytes"])
+        return scrape_result
+
+    plugin = registry.get(plugin_name)
+    if plugin is not None:
+        # Plugins written before conditional requests only take the URL
+        if validators and accepts_argument(plugin.scrape, "validators"):
+            return plugin.scrape(url, validators=validators)
+        return plugin.scrape(url)
     else:
         print(f"No plugin found for {plugin_name}")
         return None
 
 
+def run_timed(scrape, *args):
+    # Returns (result, timing) where fetch is the time this thread spent in the
+    # shared HTTP client and parse is the rest of the plugin's run time
+    http_client.start_stats()
+    started = time.perf_counter()
+    result = scrape(*args)
+    elapsed = time.perf_counter() - started
+    stats = http_client.get_stats()
+    return result, {
+        "fetch": stats["seconds"],
+        "parse": max(elapsed - stats["seconds"], 0.0),
+        "bytes": stats["bytes"],
+    }
+
+
 def send_email(subject, body):
-    with current_app.app_context():
-        msg = MIMEMultipart()
-        msg["From"] = current_app.config["EMAIL_ADDRESS"]
-        msg["To"] = current_app.config["RECIPIENT_EMAIL"]
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "plain"))
-
-        try:
-            with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-                server.login(current_app.config["EMAIL_ADDRESS"], current_app.config["EMAIL_PASSWORD"])
-                server.send_message(msg)
-            print("Email sent successfully")
-        except smtplib.SMTPAuthenticationError as e:
-            print(f"SMTP Authentication Error: {e}")
-        except smtplib.SMTPException as e:
-            print(f"SMTP Exception: {e}")
-        except Exception as e:
-            print(f"Error sending email: {e}")
+    # Queued for the background sender, which batches and delivers it
+    get_notification_queue(current_app).put(subject, body)
@@ -0,0 +1,26 @@
+from piston.links import extract_links
+
+# Define the website name and URL as constants
+WEBSITE_NAME = "Wikipedia"
+WEBSITE_URL = "https://en.wikipedia.org/wiki/Main_Page"
+
+
+def scrape(url):
+    try:
+        # Stream the page and collect its links without building a DOM
+        links_with_descriptions = [
+            (href, description)
+            for href, description in extract_links(url)
+            if not href.startswith("#")
+        ]
+
+        # Remove duplicates while preserving order
+        unique_links_with_descriptions = list(dict.fromkeys(links_with_descriptions))
+
+        return {
+            "link_count": len(unique_links_with_descriptions),
+            "links_with_descriptions": unique_links_with_descriptions,
+        }
+    except Exception as e:
+        print(f"Error scraping Wikipedia: {e}")
+        return None
@@ -1,5 +1,4 @@
-import requests
-from bs4 import BeautifulSoup
+from piston.links import extract_links
 
 # Define the website name and URL as constants
 WEBSITE_NAME = "Wikipedia"
@@ -8,18 +7,12 @@ WEBSITE_URL = "https://en.wikipedia.org/wiki/Main_Page"
 
 def scrape(url):
     try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # Find all links on the page
-        all_links = soup.find_all("a")
-        links_with_descriptions = []
-
-        for link in all_links:
-            href = link.get("href")
-            description = link.text.strip()
-            if href and not href.startswith("#"):
-                links_with_descriptions.append((href, description))
+        # Stream the page and collect its links without building a DOM
+        links_with_descriptions = [
+            (href, description)
+            for href, description in extract_links(url)
+            if not href.startswith("#")
+        ]
 
         # Remove duplicates while preserving order
         unique_links_with_descriptions = list(dict.fromkeys(links_with_descriptions))
@@ -1,13 +1,49 @@
 import sys
 import os
+import json
+import time
+import subprocess
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pytest
+from click.testing import CliRunner
+from unittest.mock import MagicMock, patch
 
 # Add the root directory to the Python path
 root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, root_path)
 
-from piston import create_app, db, ensure_plugins_directory
-from piston.models import Website
+from sqlalchemy import event, inspect, text
+from piston import create_app, db, ensure_plugins_directory, load_plugins
+from piston.cli import cli
+from piston.events import RESYNC, get_event_broker, stream
+from piston.executor import get_executor
+from piston.models import (
+    Link,
+    LinkCountPoint,
+    LinkCountRollup,
+    ScrapeRun,
+    Website,
+    adapt_interval,
+    add_custom_website,
+    apply_scrape_result,
+    claim_due_websites,
+    delete_custom_website,
+    flush_scrape_runs,
+    get_next_due_at,
+    init_db,
+    insert_new_links,
+    listed_elsewhere,
+    mark_checked,
+    next_due,
+    prune_link_history,
+    record_link_count,
+    renew_leases,
+    update_website,
+    upgrade_schema,
+)
+from piston.scheduler import check_all_websites, init_scheduler, write_results
 
 @pytest.fixture(scope="module")
 def test_app():
@@ -56,10 +92,81 @@ def test_index(client):
     assert b"pistON" in response.data
 
 
+def wait_for_job(client, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/jobs/{job_id}").json
+        if job["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
 def test_update_website(client):
     response = client.get("/scrape/1")
-    assert response.status_code == 200
-    assert b"result" in response.data
+    assert response.status_code == 202
+    assert response.headers["Location"] == f"/jobs/{response.json['job_id']}"
+    job = wait_for_job(client, response.json["job_id"])
+    assert job["status"] == "done"
+    assert job["result"]
+
+    assert client.get("/scrape/999").status_code == 404
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_manual_scrape_joins_in_flight_fetch(client):
+    app = client.application
+    release = threading.Event()
+    calls = []
+
+    def fake_scrape(url, plugin_name, validators=None):
+        calls.append(url)
+        release.wait(2)
+        return {"link_count": 1, "links_with_descriptions": [("/jobs/1", "Dev")]}
+
+    with patch("piston.executor.scrape_website", side_effect=fake_scrape), patch("piston.models.send_email"):
+        # Repeated clicks share one job
+        first = client.post("/scrape/1").json
+        second = client.post("/scrape/1").json
+        assert second["job_id"] == first["job_id"]
+        assert second["joined"]
+        release.set()
+        job = wait_for_job(client, first["job_id"])
+        assert job["result"] == "Update detected: 1 new links found"
+
+        # A scheduled fetch already running is joined, and its commit finishes the job
+        release.clear()
+        future, owner = get_executor(app).submit(1, "http://test.com", "default")
+        assert owner
+        job_id = client.post("/scrape/1").json["job_id"]
+        for _ in range(200):
+            if client.get(f"/jobs/{job_id}").json["joined"]:
+                break
+            time.sleep(0.01)
+        release.set()
+        scrape_result, timing = future.result(timeout=2)
+        apply_scrape_result(db.session.get(Website, 1), scrape_result, timing)
+        job = wait_for_job(client, job_id)
+
+    assert job["joined"]
+    assert job["result"] == "No new links found"
+    assert len(calls) == 2
+
+
+def test_manual_scrape_timeout_counts_from_fetch_start(client):
+    app = client.application
+    app.config.update(SCRAPE_WORKERS=1, SCRAPE_TIMEOUT=0.5)
+
+    def fake_scrape(url, plugin_name, validators=None):
+        time.sleep(0.4)
+        return {"link_count": 1, "links_with_descriptions": [("/jobs/1", "Dev")]}
+
+    with patch("piston.executor.scrape_website", side_effect=fake_scrape), patch("piston.models.send_email"):
+        # Queued behind a scheduled fetch holding the only worker
+        get_executor(app).submit(99, "http://other.test", "default")
+        job = wait_for_job(client, client.post("/scrape/1").json["job_id"])
+
+    assert job["status"] == "done"
+    assert job["result"] == "Update detected: 1 new links found"
 
 
 def test_update_interval(client):
@@ -68,5 +175,614 @@ def test_update_interval(client):
     assert b"Scrape interval updated to 5min" in response.data
 
 
+def test_fetch_updated_data_is_cached_with_etag(client):
+    response = client.get("/fetch_updated_data")
+    assert response.status_code == 200
+    assert response.json[0]["name"] == "Test Website"
+    etag = response.headers["ETag"]
+
+    response = client.get("/fetch_updated_data", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.post("/update_interval/1", json={"interval": "1hour"})
+    response = client.get("/fetch_updated_data", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json[0]["scrape_interval"] == "1hour"
+
+
+def test_check_all_websites_fetches_in_parallel(client):
+    app = client.application
+    app.config.update(SCRAPE_WORKERS=4, SCRAPE_TIMEOUT=0.5, SCRAPE_MAX_PER_HOST=4)
+    now = datetime.now()
+    for i in range(3):
+        db.session.add(Website(name=f"Site {i}", url=f"http://site{i}.test", plugin_name="slow",
+                               scrape_interval="5min", next_due_at=now))
+    hung = Website(name="Hung", url="http://hung.test", plugin_name="hung", scrape_interval="5min", next_due_at=now)
+    db.session.add(hung)
+    db.session.add(Website(name="Later", url="http://later.test", plugin_name="slow", scrape_interval="5min",
+                           next_due_at=now + timedelta(minutes=5)))
+    db.session.commit()
+
+    def fake_scrape(url, plugin_name, validators=None):
+        time.sleep(2 if plugin_name == "hung" else 0.3)
+        return None
+
+    with patch("piston.executor.scrape_website", side_effect=fake_scrape):
+        report = check_all_websites()
+
+        assert report["ran"] == 3
+        assert report["timed_out"] == 1
+        assert report["wall_time"] < 1.5
+        assert hung.next_due_at > now
+
+        # The abandoned fetch is still running: the next tick must not start another
+        hung.next_due_at = datetime.now()
+        db.session.commit()
+        report = check_all_websites()
+        assert report["skipped"] == 1
+        assert report["ran"] == 0
+
+
+def test_leases_split_due_websites_and_expire(client):
+    now = datetime.now()
+    for i in range(3):
+        db.session.add(Website(name=f"Site {i}", url=f"http://site{i}.test", plugin_name="slow",
+                               scrape_interval="5min", next_due_at=now - timedelta(minutes=3 - i)))
+    db.session.commit()
+
+    claimed_by_a = claim_due_websites("a", now, 60, 2)
+    assert [website.name for website in claimed_by_a] == ["Site 0", "Site 1"]
+    claimed_by_b = claim_due_websites("b", now, 60, 2)
+    assert [website.name for website in claimed_by_b] == ["Site 2"]
+    assert claim_due_websites("b", now, 60, 2) == []
+    # Leased websites are due again when their lease runs out
+    assert get_next_due_at(now) == now + timedelta(seconds=60)
+
+    # Worker a stopped renewing: b takes its websites over once the leases expire
+    renew_leases("b", [claimed_by_b[0].id], now + timedelta(seconds=30), 60)
+    later = now + timedelta(seconds=61)
+    assert {website.name for website in claim_due_websites("b", later, 60, 5)} == {"Site 0", "Site 1"}
+
+    # ...and a's late results are dropped
+    client.application.config["WORKER_ID"] = "a"
+    report = {"ran": 0, "skipped": 0, "failed": 0, "timed_out": 0, "lost": 0}
+    write_results([(website, "failed", None, None) for website in claimed_by_a], now, report)
+    assert report["lost"] == 2
+    assert {website.lease_owner for website in claimed_by_a} == {"b"}
+
+
+def test_next_due_at_reads_indexes_only(client):
+    now = datetime.now()
+    db.session.add(Website(name="Free", url="http://free.test", plugin_name="slow", scrape_interval="5min",
+                           next_due_at=now + timedelta(minutes=5)))
+    db.session.add(Website(name="Leased", url="http://leased.test", plugin_name="slow", scrape_interval="5min",
+                           next_due_at=now - timedelta(minutes=5), lease_owner="a",
+                           lease_expires_at=now + timedelta(minutes=1)))
+    db.session.commit()
+
+    statements = []
+    record = lambda conn, cursor, statement, parameters, context, many: statements.append((statement, parameters))
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        assert get_next_due_at(now) == now + timedelta(minutes=1)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+    with db.engine.connect() as connection:
+        plans = [
+            " ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+            for statement, parameters in statements
+        ]
+    assert len(plans) == 2
+    assert "USING INDEX ix_websites_next_due_at" in plans[0]
+    assert "USING INDEX ix_websites_lease_expires_at" in plans[1]
+
+
+def test_workers_sharing_a_database_scrape_each_site_once(tmp_path):
+    uri = f"sqlite:///{tmp_path}/piston.db"
+    apps = [
+        create_app({"SQLALCHEMY_DATABASE_URI": uri, "WORKER_ID": f"worker-{i}", "SCRAPE_CLAIM_BATCH": 5,
+                    "SCRAPE_WORKERS": 4, "SCRAPE_MAX_PER_HOST": 4})
+        for i in range(3)
+    ]
+    urls = [f"http://site{i}.test" for i in range(40)]
+    with apps[0].app_context():
+        init_db()
+        now = datetime.now()
+        db.session.add_all(
+            Website(name=url, url=url, plugin_name="slow", scrape_interval="1hour", next_due_at=now) for url in urls
+        )
+        db.session.commit()
+        db.session.remove()
+
+    scraped = []
+
+    def fake_scrape(url, plugin_name, validators=None):
+        scraped.append(url)
+        time.sleep(0.02)
+        return None
+
+    def work(app):
+        with app.app_context():
+            check_all_websites()
+            db.session.remove()
+
+    with patch("piston.executor.scrape_website", side_effect=fake_scrape):
+        workers = [threading.Thread(target=work, args=(app,)) for app in apps]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    assert sorted(scraped) == sorted(urls)
+    with apps[0].app_context():
+        assert Website.query.filter(Website.lease_owner.is_not(None)).count() == 0
+        assert Website.query.filter(Website.next_due_at <= now).count() == 0
+        db.session.remove()
+    for app in apps:
+        with app.app_context():
+            db.engine.dispose()
+
+
+def test_scheduler_arms_job_for_earliest_due_site(client):
+    app = client.application
+    scheduler = MagicMock()
+    scheduler.get_job.return_value = None
+
+    init_scheduler(app, scheduler)
+    assert not scheduler.add_job.called  # the fixture site is never scraped
+
+    client.post("/update_interval/1", json={"interval": "5min"})
+    kwargs = scheduler.add_job.call_args.kwargs
+    assert kwargs["id"] == "check_due_websites"
+    assert kwargs["trigger"] == "date"
+    # Never checked: due within the first-scrape spread
+    assert kwargs["run_date"] <= datetime.now() + timedelta(minutes=5)
+
+    client.post("/update_interval/1", json={"interval": "never"})
+    scheduler.get_job.return_value = object()
+    client.post("/update_interval/1", json={"interval": "never"})
+    scheduler.remove_job.assert_called_with("check_due_websites")
+
+
+def test_jittered_schedule_spreads_sites_sharing_an_interval(client):
+    now = datetime(2024, 1, 1, 9, 0, 17)
+    sites = [Website(url=f"http://board.test/jobs?page={i}", scrape_interval="1hour") for i in range(120)]
+
+    # New sites: first scrapes spread over the next 30 minutes
+    first = [next_due(site, None, now) for site in sites]
+    assert all(now <= due < now + timedelta(minutes=30) for due in first)
+    assert len({due.minute for due in first}) > 20
+
+    # Checked together, due again spread over the hour, each at its own phase
+    due = [next_due(site, now) for site in sites]
+    assert all(now + timedelta(minutes=30) <= at <= now + timedelta(minutes=90) for at in due)
+    assert len({at.minute for at in due}) > 40
+    # A late scrape doesn't move the site off its slot
+    later = [next_due(site, at + timedelta(minutes=7)) for site, at in zip(sites, due)]
+    assert all(b - a == timedelta(hours=1) for a, b in zip(due, later))
+
+
+def test_scrape_once_runs_due_websites_and_exits(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path}/piston.db")
+    app = create_app()
+    with app.app_context():
+        init_db()
+        db.session.add(Website(name="Due", url="http://due.test", plugin_name="slow", scrape_interval="1hour",
+                               next_due_at=datetime.now()))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+    with patch("piston.executor.scrape_website", return_value=None) as scrape:
+        result = CliRunner().invoke(cli, ["scrape-once"])
+    assert result.exit_code == 0, result.output
+    assert "1 ran" in result.output
+    scrape.assert_called_once_with("http://due.test", "slow", None)
+
+    with app.app_context():
+        website = Website.query.filter_by(name="Due").one()
+        assert website.last_checked is not None
+        assert website.next_due_at > datetime.now()
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_processes_starting_together_set_up_the_database_once(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path}/piston.db")
+    script = "from piston.cli import prepare_app\nprepare_app()\n"
+    processes = [
+        subprocess.Popen([sys.executable, "-c", script], cwd=root_path, env=env, stderr=subprocess.PIPE, text=True)
+        for _ in range(4)
+    ]
+    for process in processes:
+        _, stderr = process.communicate(timeout=60)
+        assert process.returncode == 0, stderr
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": env["DATABASE_URL"]})
+    with app.app_context():
+        plugins, _ = load_plugins()
+        assert sorted(name for (name,) in db.session.query(Website.plugin_name)) == sorted(plugins)
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_scrape_once_exits_without_waiting_for_timed_out_fetches(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path}/piston.db", SCRAPE_TIMEOUT="1")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": env["DATABASE_URL"]})
+    with app.app_context():
+        init_db()
+        db.session.add(Website(name="Hung", url="http://hung.test", plugin_name="hung", scrape_interval="1hour",
+                               next_due_at=datetime.now()))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+    # A plugin that outlives the timeout by far, in a process of its own
+    script = (
+        "import time\n"
+        "from unittest.mock import patch\n"
+        "from piston.cli import cli\n"
+        "with patch('piston.executor.scrape_website', side_effect=lambda *args: time.sleep(30)):\n"
+        "    cli(['scrape-once'])\n"
+    )
+    started = time.monotonic()
+    result = subprocess.run([sys.executable, "-c", script], cwd=root_path, env=env, capture_output=True,
+                            text=True, timeout=20)
+    assert result.returncode == 0, result.stderr
+    assert "1 timed out" in result.stdout
+    assert time.monotonic() - started < 10
+
+
+def test_worker_polls_for_schedules_changed_elsewhere(client):
+    scheduler = MagicMock()
+    init_scheduler(client.application, scheduler, poll=30)
+    # Nothing due here, but the web tier may schedule a website at any time
+    run_date = scheduler.add_job.call_args.kwargs["run_date"]
+    assert datetime.now() + timedelta(seconds=25) < run_date <= datetime.now() + timedelta(seconds=30)
+
+    # The web tier hears of the worker's scrapes through the dashboard data
+    broker = get_event_broker(client.application)
+    versions = iter(["v1", "v1", "v2"])
+    frames = stream(broker.subscribe(), broker, keepalive=0.01, version=lambda: next(versions))
+    assert [next(frames) for _ in range(3)] == ["retry: 5000\n\n", ": keepalive\n\n", RESYNC]
+    frames.close()
+
+
+def test_links_diff_inserts_only_new_links(client):
+    website = db.session.get(Website, 1)
+    first = [("/jobs/1", "Python dev"), ("/jobs/2", "Data engineer"), ("/jobs/1", "Python dev (dup)")]
+    second = [("/jobs/2", "Data engineer"), ("/jobs/3", "SRE")]
+
+    with patch("piston.models.send_email") as mock_send:
+        assert apply_scrape_result(website, {"link_count": 2, "links_with_descriptions": first}) == \
+            "Update detected: 2 new links found"
+        assert apply_scrape_result(website, {"link_count": 2, "links_with_descriptions": second}) == \
+            "Update detected: 1 new links found"
+        assert apply_scrape_result(website, {"link_count": 2, "links_with_descriptions": second}) == \
+            "No new links found"
+
+    assert "/jobs/3 - SRE" in mock_send.call_args_list[1].args[1]
+    assert "/jobs/2" not in mock_send.call_args_list[1].args[1]
+    assert Link.query.filter_by(website_id=1).count() == 3
+
+    flush_scrape_runs()
+    runs = ScrapeRun.query.filter_by(website_id=1).order_by(ScrapeRun.id).all()
+    assert [run.outcome for run in runs] == ["changed", "changed", "unchanged"]
+    assert [run.new_links for run in runs] == [2, 1, 0]
+    assert runs[0].commit_ms is not None
+
+
+def test_auto_interval_backs_off_and_tightens_after_changes(client):
+    # Exact due times: no per-site phase
+    client.application.config["SCHEDULE_JITTER"] = False
+    response = client.post("/update_interval/1", json={"interval": "auto"})
+    assert response.status_code == 200
+    website = db.session.get(Website, 1)
+    assert website.auto_interval_seconds == 3600
+
+    now = datetime(2024, 1, 1)
+    mark_checked(website, now)
+    assert website.next_due_at == now + timedelta(hours=1)
+
+    def scrape(outcome, after):
+        nonlocal now
+        now += after
+        adapt_interval(website, outcome, now)
+        mark_checked(website, now)
+        return website.auto_interval_seconds
+
+    # Unchanged scrapes in a row back off faster and faster, up to the maximum
+    assert [scrape("unchanged", timedelta(hours=1)) for _ in range(3)] == [5400, 10800, 32400]
+    assert scrape("unchanged", timedelta(hours=9)) == 86400
+    assert website.next_due_at == now + timedelta(days=1)
+    # Failures don't move it
+    assert scrape("failed", timedelta(days=1)) == 86400
+
+    # Changes every 4 hours: tighten to half the estimated gap
+    scrape("changed", timedelta(days=1))
+    assert website.unchanged_streak == 0
+    assert scrape("changed", timedelta(hours=4)) == 2 * 3600
+    assert scrape("changed", timedelta(hours=4)) == 3600
+    # Never below the minimum
+    assert [scrape("changed", timedelta(minutes=5)) for _ in range(4)] == [1800, 900, 450, 300]
+
+    # Fetches saved against polling every 5 minutes
+    assert website.auto_fetches_saved > 0
+    db.session.commit()
+    row = client.get("/fetch_updated_data").json[0]
+    assert row["scrape_interval"] == "auto"
+    assert row["effective_interval"] == 300
+    assert row["fetches_saved"] == website.auto_fetches_saved
+
+
+def test_links_api_pages_by_cursor_and_searches_descriptions(client):
+    db.session.add(Website(id=2, name="Other", url="http://other.test", plugin_name="default"))
+    with patch("piston.models.send_email"):
+        apply_scrape_result(db.session.get(Website, 1), {"link_count": 3, "links_with_descriptions": [
+            ("/jobs/1", "Développeur Python"), ("/jobs/2", "Data engineer"), ("/jobs/3", "Python SRE"),
+        ]})
+        apply_scrape_result(db.session.get(Website, 2), {"link_count": 1, "links_with_descriptions": [
+            ("/jobs/4", "Python tooling"),
+        ]})
+
+    def paths(page):
+        return [link["link"].split(".test", 1)[-1].split(".com", 1)[-1] for link in page["links"]]
+
+    page = client.get("/api/links?website_id=1&limit=2").json
+    assert paths(page) == ["/jobs/1", "/jobs/2"]
+    page = client.get(page["next"]).json
+    assert paths(page) == ["/jobs/3"]
+    assert page["next_cursor"] is None
+
+    page = client.get("/api/links?q=python&limit=2").json
+    assert paths(page) == ["/jobs/1", "/jobs/3"]
+    assert paths(client.get(page["next"]).json) == ["/jobs/4"]
+    # Accents are folded, terms are ANDed, prefixes match and syntax is quoted
+    assert paths(client.get("/api/links?q=developpeur").json) == ["/jobs/1"]
+    assert paths(client.get("/api/links?q=pyth*+sre").json) == ["/jobs/3"]
+    assert client.get('/api/links?q="OR+-').json["links"] == []
+
+    Link.query.filter_by(link="http://test.com/jobs/3").update({"description": "Go SRE"})
+    db.session.commit()
+    assert paths(client.get("/api/links?q=python").json) == ["/jobs/1", "/jobs/4"]
+    assert client.get("/api/links?after=x").status_code == 400
+
+
+def test_links_are_canonical_and_cross_site_duplicates_not_emailed(client):
+    db.session.add(Website(id=2, name="Aggregator", url="https://agg.test/", plugin_name="default"))
+    board = db.session.get(Website, 1)
+    with patch("piston.models.send_email") as mock_send:
+        assert apply_scrape_result(board, {"link_count": 2, "links_with_descriptions": [
+            ("/jobs/1?utm_source=rss", "Dev"), ("http://TEST.com/jobs/1#apply", "Dev (again)"),
+        ]}) == "Update detected: 1 new links found"
+        apply_scrape_result(db.session.get(Website, 2), {"link_count": 2, "links_with_descriptions": [
+            ("http://test.com/jobs/1?fbclid=abc", "Dev via aggregator"), ("/offers/7", "QA"),
+        ]})
+
+    assert [link.link for link in Link.query.order_by(Link.id)] == \
+        ["http://test.com/jobs/1", "http://test.com/jobs/1", "https://agg.test/offers/7"]
+    # The aggregator's copy is stored but not emailed again
+    assert mock_send.call_count == 2
+    assert "jobs/1" not in mock_send.call_args_list[1].args[1]
+    assert "https://agg.test/offers/7 - QA" in mock_send.call_args_list[1].args[1]
+
+
+def test_upgrade_schema_backfills_canonical_links(client):
+    with db.engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_links_url_hash_website_id"))
+        connection.execute(text("CREATE UNIQUE INDEX ix_links_website_id_link ON links (website_id, link)"))
+        for link in ("/jobs/1?utm_source=a", "/jobs/1?utm_source=b", "/jobs/2"):
+            connection.execute(text("INSERT INTO links (website_id, link) VALUES (1, :link)"), {"link": link})
+
+    upgrade_schema()
+
+    assert [link.link for link in Link.query.order_by(Link.id)] == ["http://test.com/jobs/1", "http://test.com/jobs/2"]
+    assert all(link.url_hash is not None for link in Link.query)
+    indexes = {index["name"] for index in inspect(db.engine).get_indexes("links")}
+    assert "ix_links_url_hash_website_id" in indexes and "ix_links_website_id_link" not in indexes
+
+
+def test_alert_rules_filter_new_link_emails(client):
+    response = client.post("/api/alert_rules", json={"name": "Remote Python", "expression": "python AND remote"})
+    assert response.status_code == 201
+    rule_id = response.json["id"]
+    assert client.post("/api/alert_rules", json={"name": "Bad", "expression": "python AND"}).status_code == 400
+    assert client.post("/api/alert_rules", json={"name": "Bad", "expression": "go", "website_id": 99}).status_code == 400
+
+    website = db.session.get(Website, 1)
+    with patch("piston.models.send_email") as mock_send:
+        apply_scrape_result(website, {"link_count": 2, "links_with_descriptions": [
+            ("/jobs/1", "Python dev, remote"), ("/jobs/2", "Java dev, remote"),
+        ]})
+        # The matcher is rebuilt when a rule changes
+        client.patch(f"/api/alert_rules/{rule_id}", json={"expression": "java"})
+        apply_scrape_result(website, {"link_count": 1, "links_with_descriptions": [("/jobs/3", "Java lead")]})
+        assert client.delete(f"/api/alert_rules/{rule_id}").status_code == 200
+        apply_scrape_result(website, {"link_count": 1, "links_with_descriptions": [("/jobs/4", "Go dev")]})
+
+    bodies = [call.args[1] for call in mock_send.call_args_list]
+    assert "/jobs/1 - Python dev, remote [Remote Python]" in bodies[0]
+    assert "/jobs/2" not in bodies[0]
+    assert "/jobs/3 - Java lead [Remote Python]" in bodies[1]
+    assert "/jobs/4 - Go dev" in bodies[2]
+    assert client.get("/api/alert_rules").json["rules"] == []
+
+
+def test_link_count_history_rollups_and_trends(client):
+    now = datetime.now().replace(hour=12, minute=30, second=0, microsecond=0)
+    for minutes, link_count, new_links in ((-90, 10, 10), (-20, 12, 2), (-10, 11, 0), (-5, 14, 3)):
+        record_link_count(1, now + timedelta(minutes=minutes), link_count, new_links)
+    db.session.commit()
+
+    hours = LinkCountRollup.query.filter_by(resolution="hour").order_by(LinkCountRollup.bucket_start).all()
+    assert [(h.samples, h.link_count_min, h.link_count_max, h.link_count_last, h.new_links) for h in hours] == \
+        [(1, 10, 10, 10, 10), (3, 11, 14, 14, 5)]
+
+    start = (now - timedelta(hours=2)).isoformat()
+    response = client.get(f"/api/trends?website_id=1&start={start}&end={now.isoformat()}")
+    assert response.json["resolution"] == "raw"
+    assert [point[1:] for point in response.json["series"]["1"]] == [[10, 10], [12, 2], [11, 0], [14, 3]]
+    response = client.get(f"/api/trends?start={start}&end={now.isoformat()}&resolution=day")
+    assert response.json["fields"][1] == "link_count"
+    assert [point[1:] for point in response.json["series"]["1"]] == [[14, 10, 14, 15, 4]]
+    assert client.get("/api/trends?resolution=minute").status_code == 400
+    assert client.get("/api/trends?website_id=x").status_code == 400
+
+    # Times with an offset are read as the local time they stand for
+    utc_start = (now - timedelta(days=2)).astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+    response = client.get(f"/api/trends?start={utc_start}&end={now.isoformat()}&resolution=raw")
+    assert response.status_code == 200
+    assert response.json["start"] == (now - timedelta(days=2)).isoformat()
+    assert len(response.json["series"]["1"]) == 4
+
+    # Raw points outlive their window only as rollups
+    prune_link_history(now + timedelta(days=8), raw_days=7, hourly_days=90, daily_days=365)
+    assert LinkCountPoint.query.count() == 0
+    assert LinkCountRollup.query.count() == len(hours) + len({h.bucket_start.date() for h in hours})
+
+
+def test_metrics_route(client):
+    website = db.session.get(Website, 1)
+    with patch("piston.models.send_email"):
+        apply_scrape_result(website, {"link_count": 1, "links_with_descriptions": [("/jobs/9", "QA")]},
+                            {"fetch": 0.2, "parse": 0.01, "bytes": 2048})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    body = response.get_data(as_text=True)
+    assert "# TYPE piston_scrape_duration_seconds histogram" in body
+    assert 'piston_scrape_duration_seconds_count{website="Test Website",plugin="default"}' in body
+    assert 'piston_scrape_phase_seconds_bucket{phase="fetch",le="0.25"}' in body
+    assert 'piston_scrape_runs_total{outcome="changed"}' in body
+
+
+def test_worker_metrics_endpoint(client):
+    import requests
+    from piston import metrics
+
+    server = metrics.serve(client.application, "127.0.0.1", 0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        response = requests.get(f"{base}/metrics", timeout=2)
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+        assert "# TYPE piston_scrape_runs_total counter" in response.text
+        assert requests.get(f"{base}/", timeout=2).status_code == 404
+    finally:
+        server.shutdown()
+
+
+def test_events_stream_pushes_row_deltas(client):
+    broker = get_event_broker(client.application)
+    subscription = broker.subscribe()
+
+    client.post("/update_interval/1", json={"interval": "5min"})
+    event, data = subscription.get(timeout=1).splitlines()[:2]
+    assert event == "event: interval"
+    assert json.loads(data[len("data: "):]) == {"id": 1, "scrape_interval": "5min"}
+
+    website = db.session.get(Website, 1)
+    with patch("piston.models.send_email"):
+        apply_scrape_result(website, {"link_count": 1, "links_with_descriptions": [("/jobs/1", "Dev")]})
+    event, data = subscription.get(timeout=1).splitlines()[:2]
+    assert event == "event: scrape"
+    delta = json.loads(data[len("data: "):])
+    assert delta["last_link_count"] == 1
+    assert delta["result"] == "Update detected: 1 new links found"
+    assert delta["last_checked"]
+    broker.unsubscribe(subscription)
+
+    response = client.get("/events", buffered=False)
+    assert response.mimetype == "text/event-stream"
+    assert next(response.response) == b"retry: 5000\n\n"
+    response.close()
+    assert broker.subscribers() == 0
+
+    # Streams end after max_age, and are refused past EVENTS_MAX_STREAMS
+    started = time.monotonic()
+    assert list(stream(broker.subscribe(), broker, keepalive=60, max_age=0.2)) == ["retry: 5000\n\n"]
+    assert time.monotonic() - started < 1
+    assert broker.subscribers() == 0
+    client.application.config["EVENTS_MAX_STREAMS"] = 1
+    subscription = broker.subscribe()
+    response = client.get("/events")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    broker.unsubscribe(subscription)
+
+
+class EtagHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        if self.path == "/robots.txt":
+            self.send_error(404)
+            return
+        self.requests_seen.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = b"<html>job board</html>"
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def etag_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EtagHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    EtagHandler.requests_seen = []
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+def test_hash_site_uses_conditional_get(client, etag_server):
+    add_custom_website("Etag Board", etag_server)
+    website = Website.query.filter_by(name="Etag Board").first()
+    try:
+        assert update_website(website.id) == "New site: hash generated"
+        assert update_website(website.id) == "Not modified since last check: no site update"
+        assert EtagHandler.requests_seen == [None, '"v1"']
+    finally:
+        delete_custom_website(website.id)
+
+
+def test_deleted_website_links_no_longer_count_as_listed_elsewhere(client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("plugins")
+    add_custom_website("Gone Board", "http://gone.test")
+    website = Website.query.filter_by(name="Gone Board").first()
+    insert_new_links(website.id, [("http://jobs.test/1", "Dev")])
+    db.session.add(ScrapeRun(website_id=website.id, started_at=datetime.now(), outcome="changed"))
+    db.session.commit()
+    assert listed_elsewhere(1, [("http://jobs.test/1", "Dev")]) == {"http://jobs.test/1"}
+
+    delete_custom_website(website.id)
+
+    assert listed_elsewhere(1, [("http://jobs.test/1", "Dev")]) == set()
+    assert Link.query.filter_by(website_id=website.id).count() == 0
+    assert ScrapeRun.query.filter_by(website_id=website.id).count() == 0
+
+
+def test_sqlite_file_database_uses_wal(tmp_path):
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path}/piston.db", "SQLITE_BUSY_TIMEOUT": 2})
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == 2000
+            assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert db.engine.pool.size() == app.config["DB_POOL_SIZE"]
+        db.engine.dispose()
+
+
 if __name__ == "__main__":
     pytest.main()
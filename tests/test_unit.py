@@ -1,5 +1,8 @@
 import sys
 import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pytest
 from unittest.mock import patch, MagicMock
 from flask import Flask
@@ -8,6 +11,17 @@ from flask import Flask
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from piston.utils import scrape_website, send_email  # Corrected import
+from piston.registry import PluginRegistry
+from piston.manifest import PluginManifest
+from piston import http_client
+from piston.executor import ScrapeExecutor
+from piston.notifications import NotificationQueue
+from piston.links import iter_links
+from piston.hashing import hash_response
+from piston.isolation import PluginProcessPool, PluginTimeout
+from piston.alerts import AlertMatcher, parse_rule
+from piston.urls import canonicalize, url_hash
+from piston.registry import registry
 
 
 @pytest.mark.parametrize(
@@ -27,12 +41,365 @@ def test_scrape_website(plugin_name, expected_result):
     mock_plugin = MagicMock()
     mock_plugin.scrape = MagicMock(return_value=expected_result)
 
-    with patch(
-        "piston.utils.load_plugins",
-        return_value=({plugin_name: mock_plugin}, []),
-    ):
+    with patch("piston.utils.registry.get", return_value=mock_plugin) as mock_get:
         result = scrape_website("http://example.com", plugin_name)
         assert result == expected_result
+        mock_get.assert_called_once_with(plugin_name)
+
+
+def test_plugin_registry_reloads_only_on_change(tmp_path):
+    plugin_file = tmp_path / "example.py"
+    plugin_file.write_text('WEBSITE_NAME = "Example"\nWEBSITE_URL = "http://example.com"\n')
+    registry = PluginRegistry(str(tmp_path))
+
+    first = registry.get("example")
+    assert first.WEBSITE_NAME == "Example"
+    assert registry.get("example") is first
+
+    # Same content, new mtime: the cached module is kept
+    os.utime(plugin_file, ns=(0, 0))
+    assert registry.get("example") is first
+
+    plugin_file.write_text('WEBSITE_NAME = "Changed"\nWEBSITE_URL = "http://example.com"\n')
+    assert registry.get("example").WEBSITE_NAME == "Changed"
+
+    plugin_file.unlink()
+    assert registry.get("example") is None
+    assert registry.load_all() == {}
+
+
+def test_plugin_manifest_reads_constants_without_importing(tmp_path):
+    (tmp_path / "heavy.py").write_text(
+        'import module_that_is_not_installed\n'
+        'WEBSITE_NAME: str = "Heavy"\nWEBSITE_URL = "http://heavy.test"\n'
+    )
+    (tmp_path / "dynamic.py").write_text(
+        'BASE = "http://dynamic.test"\nWEBSITE_NAME = "Dynamic"\nWEBSITE_URL = BASE + "/jobs"\n'
+    )
+    registry = PluginRegistry(str(tmp_path))
+    manifest = PluginManifest(registry, str(tmp_path / "instance" / "plugin-manifest.json"))
+
+    plugins = manifest.load()
+    assert {name: (entry["name"], entry["url"]) for name, entry in plugins.items()} == {
+        "dynamic": ("Dynamic", "http://dynamic.test/jobs"),
+        "heavy": ("Heavy", "http://heavy.test"),
+    }
+    # Only the plugin with computed constants had to be imported
+    assert set(registry._entries) == {"dynamic"}
+    # The cache stays out of the plugins directory
+    assert (tmp_path / "instance" / "plugin-manifest.json").exists()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".json")]
+
+    registry.clear()
+    with patch("piston.manifest.read_constants") as read_constants:
+        assert manifest.load() == plugins
+        # A copy is hashed and recognised; nothing is parsed or imported
+        (tmp_path / "copy.py").write_bytes((tmp_path / "heavy.py").read_bytes())
+        assert manifest.load()["copy"]["name"] == "Heavy"
+    read_constants.assert_not_called()
+    assert registry._entries == {}
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = 0
+
+    def do_GET(self):
+        if self.path == "/robots.txt":
+            self.send_error(404)
+            return
+        FlakyHandler.hits += 1
+        status, body = (503, b"") if FlakyHandler.hits == 1 else (200, b"x" * 2048)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_fetch_retries_and_caps_body_size():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    http_client.configure(backoff_factor=0)
+    try:
+        response = http_client.fetch(url)
+        assert response.status_code == 200
+        assert FlakyHandler.hits == 2
+        assert len(response.content) == 2048
+
+        with pytest.raises(http_client.ResponseTooLarge):
+            http_client.fetch(url, max_bytes=1024)
+    finally:
+        http_client.configure(backoff_factor=0.5)
+        server.shutdown()
+
+
+class PoliteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/robots.txt":
+            status, headers, body = 200, {}, b"User-agent: *\nCrawl-delay: 2\n"
+        elif self.path == "/busy":
+            status, headers, body = 429, {"Retry-After": "30"}, b""
+        else:
+            status, headers, body = 200, {}, b"ok"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_token_bucket_spaces_fetches_per_host():
+    bucket = http_client.TokenBucket(rate=2, burst=2)
+    now = bucket.updated
+    assert [bucket.reserve(now) for _ in range(4)] == [0, 0, 0.5, 1.0]
+    # Refilled after a quiet second, never beyond the burst
+    assert bucket.reserve(now + 10) == 0
+    bucket.pause(30, now + 10)
+    assert bucket.reserve(now + 10) == pytest.approx(30.5)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PoliteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        # robots.txt asks for 2 seconds between fetches
+        limit = http_client.host_limit(url + "/jobs")
+        assert limit.crawl_delay == 2
+        assert (limit.bucket.rate, limit.bucket.burst) == (0.5, 1)
+        assert http_client.host_limit(url + "/other") is limit
+
+        # A 429 holds the host back for its Retry-After
+        limit.bucket.tokens = 1
+        assert http_client.fetch(url + "/busy").status_code == 429
+        assert limit.bucket.reserve() > 29
+    finally:
+        http_client.configure()
+        server.shutdown()
+
+
+def test_executor_queues_busy_hosts_without_holding_threads():
+    executor = ScrapeExecutor(max_workers=4, timeout=10, max_per_host=1)
+
+    def fake_scrape(url, plugin_name, validators=None):
+        time.sleep(0.2)
+        return url
+
+    # A rate-limited host waits for its tokens before taking a thread
+    http_client._hosts["limited.test"] = http_client.HostLimit(
+        http_client.TokenBucket(rate=1, burst=1), None, time.monotonic() + 60
+    )
+    jobs = [(i, "http://busy.test/", "p", None) for i in range(8)]
+    jobs += [(10 + i, "http://limited.test/", "p", None) for i in range(3)]
+    jobs += [(20 + i, f"http://other{i}.test/", "p", None) for i in range(4)]
+    started = time.monotonic()
+    finished = {}
+    try:
+        with patch("piston.executor.scrape_website", side_effect=fake_scrape):
+            for website_id, status, _, _ in executor.run(jobs):
+                assert status == "ok"
+                finished[website_id] = time.monotonic() - started
+    finally:
+        executor.shutdown()
+        http_client.configure()
+
+    assert max(finished[20 + i] for i in range(4)) < 0.6
+    # One fetch at a time per host, and limited.test at one per second
+    assert finished[7] >= 1.5
+    assert finished[12] >= 2
+
+
+def test_executor_hands_abandoned_fetch_slots_to_waiting_fetches():
+    executor = ScrapeExecutor(max_workers=4, timeout=0.5, max_per_host=1)
+    release = threading.Event()
+
+    def fake_scrape(url, plugin_name, validators=None):
+        if plugin_name == "hangs":
+            release.wait(10)
+        return url
+
+    try:
+        with patch("piston.executor.scrape_website", side_effect=fake_scrape):
+            jobs = [(1, "http://busy.test/1", "hangs", None), (2, "http://busy.test/2", "fast", None)]
+            started = time.monotonic()
+            assert [(website_id, status) for website_id, status, _, _ in executor.run(jobs)] == \
+                [(1, "timeout"), (2, "ok")]
+            assert time.monotonic() - started < 2
+
+            # Same for a manual scrape waiting on its result
+            hung, _ = executor.submit(3, "http://manual.test/1", "hangs")
+            queued, _ = executor.submit(4, "http://manual.test/2", "fast")
+            with pytest.raises(TimeoutError):
+                executor.result(hung)
+            assert executor.result(queued)[0] == "http://manual.test/2"
+            assert time.monotonic() - started < 4
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+@patch("smtplib.SMTP")
+def test_notification_queue_sends_digest_over_one_connection(mock_smtp):
+    server = mock_smtp.return_value
+    server.has_extn.side_effect = lambda name: name == "auth"
+    notifications = NotificationQueue(
+        host="localhost", port=1025, use_ssl=False,
+        sender="piston@example.com", password="secret",
+        recipients=["a@example.com", "b@example.com"],
+        digest_window=0.2,
+    )
+
+    for i in range(3):
+        notifications.put(f"Update {i}", f"body {i}")
+    notifications.flush()
+    notifications.put("Update 3", "body 3")
+    notifications.flush()
+
+    mock_smtp.assert_called_once_with("localhost", 1025)
+    server.login.assert_called_once_with("piston@example.com", "secret")
+    sent = [call.args[0] for call in server.send_message.call_args_list]
+    assert [(msg["To"], msg["Subject"]) for msg in sent] == [
+        ("a@example.com", "3 updates detected by piston"),
+        ("b@example.com", "3 updates detected by piston"),
+        ("a@example.com", "Update 3"),
+        ("b@example.com", "Update 3"),
+    ]
+
+
+def test_iter_links_streams_scoped_links():
+    html = (
+        '<nav><a href="/home">Home</a></nav>'
+        '<div id="results"><ul class="jobs">'
+        '<li><a href="/jobs/1">Python <b>developer</b></a></li>'
+        '<li><a href="/jobs/2">Caf\u00e9 manager<br></a></li>'
+        '<li><a name="anchor-only">No href</a></li>'
+        '</ul></div>'
+        '<footer><a href="/about">About</a></footer>'
+    ).encode("utf-8")
+    # Split mid-tag and mid-character to exercise the incremental path
+    chunks = [html[i:i + 7] for i in range(0, len(html), 7)]
+
+    assert list(iter_links(chunks)) == [
+        ("/home", "Home"),
+        ("/jobs/1", "Python developer"),
+        ("/jobs/2", "Caf\u00e9 manager"),
+        ("/about", "About"),
+    ]
+    assert list(iter_links(chunks, scope="#results ul.jobs")) == [
+        ("/jobs/1", "Python developer"),
+        ("/jobs/2", "Caf\u00e9 manager"),
+    ]
+
+
+class ChunkedResponse:
+    def __init__(self, body, chunk):
+        self.body, self.chunk = body, chunk
+        self.encoding = "utf-8"
+        self.url = "http://example.com"
+
+    def iter_content(self, chunk_size):
+        return (self.body[i:i + self.chunk] for i in range(0, len(self.body), self.chunk))
+
+    def close(self):
+        pass
+
+
+def test_normalized_hash_ignores_tokens_and_chunking():
+    page = (
+        '<html><head><script>var nonce = "{token}";</script></head><body>'
+        '<form><input type="hidden" name="csrf" value="{token}"></form>'
+        '<h1>Open   positions</h1>\n<p>Python developer</p></body></html>'
+    )
+    first = page.format(token="abc123").encode()
+    second = page.format(token="zzz999").encode()
+
+    digest, bytes_read = hash_response(ChunkedResponse(first, 5), normalize=True)
+    assert bytes_read == len(first)
+    assert hash_response(ChunkedResponse(second, 13), normalize=True)[0] == digest
+    assert hash_response(ChunkedResponse(first, 4), normalize=False)[0] != \
+        hash_response(ChunkedResponse(second, 4), normalize=False)[0]
+
+    with pytest.raises(http_client.ResponseTooLarge):
+        hash_response(ChunkedResponse(first, 16), max_bytes=32)
+
+
+def test_process_pool_isolates_plugins(tmp_path, monkeypatch):
+    (tmp_path / "fast.py").write_text(
+        "import os\n"
+        "def scrape(url):\n"
+        "    return {'link_count': 1, 'links_with_descriptions': [(url, str(os.getpid()))]}\n"
+    )
+    (tmp_path / "hangs.py").write_text("import time\ndef scrape(url):\n    time.sleep(30)\n")
+    monkeypatch.setattr(registry, "plugins_dir", str(tmp_path))
+
+    pool = PluginProcessPool(size=1, timeout=1, max_jobs=2)
+    try:
+        first, timing = pool.scrape("http://a.test", "fast")
+        second, _ = pool.scrape("http://b.test", "fast")
+        assert first["links_with_descriptions"] == [["http://a.test", first["links_with_descriptions"][0][1]]]
+        assert "parse" in timing
+        # Same warm worker, then recycled after max_jobs
+        assert first["links_with_descriptions"][0][1] == second["links_with_descriptions"][0][1]
+        third, _ = pool.scrape("http://c.test", "fast")
+        assert third["links_with_descriptions"][0][1] != second["links_with_descriptions"][0][1]
+        assert int(third["links_with_descriptions"][0][1]) != os.getpid()
+
+        with pytest.raises(PluginTimeout):
+            pool.scrape("http://d.test", "hangs")
+        # The hung worker was killed and replaced
+        assert pool.scrape("http://e.test", "fast")[0]["link_count"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_alert_matcher_evaluates_rules_in_one_pass():
+    assert parse_rule("python AND remote NOT senior") == \
+        ("and", [("term", "python"), ("term", "remote"), ("not", ("term", "senior"))])
+    for invalid in ("", "python AND", "(python", 'python "remote', "OR remote"):
+        with pytest.raises(ValueError):
+            parse_rule(invalid)
+
+    matcher = AlertMatcher([
+        (1, "python remote", None, "python AND remote NOT senior"),
+        (2, "data on site 7", 7, '"data engineer" OR "data scientist"'),
+        (3, "not java", 8, "NOT java"),
+        (4, "prefix", None, '"python developer" lyon'),
+    ])
+    new_links = [
+        ("/jobs/1", "Python developer (télétravail) - Remote"),
+        ("/jobs/2", "Senior Python developer, remote"),
+        ("/jobs/3", "Data Engineer - Lyon"),
+        ("/jobs/4", "Python Developer, Lyon"),
+        ("/jobs/5", "Pythonista remote"),
+    ]
+    assert matcher.match(7, new_links) == [
+        ("/jobs/1", "Python developer (télétravail) - Remote", ["python remote"]),
+        ("/jobs/3", "Data Engineer - Lyon", ["data on site 7"]),
+        ("/jobs/4", "Python Developer, Lyon", ["prefix"]),
+    ]
+    assert [names for _, _, names in matcher.match(8, [("/jobs/6", "Java lead"), ("/jobs/7", "Go lead")])] == \
+        [["not java"]]
+    assert AlertMatcher([(1, "site 7", 7, "python")]).match(9, new_links) is None
+
+
+def test_canonicalize_resolves_and_strips_tracking():
+    base = "https://fr.wikipedia.org/wiki/Accueil"
+    assert canonicalize("/wiki/Python#Histoire", base) == "https://fr.wikipedia.org/wiki/Python"
+    assert canonicalize("HTTPS://Jobs.Example.COM:443/o/42?utm_source=x&b=2&a=1&fbclid=y") == \
+        "https://jobs.example.com/o/42?a=1&b=2"
+    assert canonicalize("?page=2", "http://x.test:8080/jobs?ref=nav") == "http://x.test:8080/jobs?page=2"
+    assert canonicalize("mailto:hr@example.com", base) == "mailto:hr@example.com"
+    assert url_hash(canonicalize("/o/42?utm_medium=a", "https://jobs.example.com/")) == \
+        url_hash("https://jobs.example.com/o/42")
+    assert -2 ** 63 <= url_hash("https://jobs.example.com/o/42") < 2 ** 63
 
 
 # @patch("smtplib.SMTP_SSL")